@@ -16,12 +16,12 @@ export const getPhotos = async (req: Request, res: Response, next: NextFunction)
 
 export const searchPhotos = async (req: Request, res: Response, next: NextFunction) => {
     try {
-        const { query } = req.query;
+        const { query, mode } = req.query;
         console.log("QUERYsearchPhotos: " + query)
         if (!query || typeof query !== 'string') {
             throw { statusCode: 400, message: 'Search query is required' };
         }
-        const photos = await photoService.searchPhotos(query);
+        const photos = await photoService.searchPhotos(query, mode === 'fast' ? 'fast' : 'rerank');
         res.json(photos);
     } catch (error) {
         next(error);
@@ -2,7 +2,15 @@ import { Photo } from '../types/types';
 
 // Add interface for Flask API response
 interface FlaskSearchResponse {
-    result: string;
+    mode: 'rerank' | 'fast';
+    result?: string;
+    filenames?: string[];
+    time_taken: string;
+}
+
+interface FlaskBatchSearchResponse {
+    mode: 'rerank' | 'fast';
+    results: (FlaskSearchResponse & { query: string; error?: string })[];
     time_taken: string;
 }
 
@@ -137,7 +145,7 @@ export class PhotoService {
         return photos.sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime());
     }
 
-    async searchPhotos(query: string): Promise<Photo[]> {
+    async searchPhotos(query: string, mode: 'rerank' | 'fast' = 'rerank'): Promise<Photo[]> {
         try {
 
             console.log("QUERY: " + query)
@@ -147,7 +155,7 @@ export class PhotoService {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ query })
+                body: JSON.stringify({ query, mode })
             });
 
 
@@ -160,52 +168,91 @@ export class PhotoService {
             console.log("HERE IS THE FLASK RESPONSE")
             console.log(data)
 
-            // Extract filenames from the response
-            const filenameLine = data.result.split('\n').find(line => line.startsWith('Filename:'));
-            if (!filenameLine) {
-                throw new Error("Filename line not found in Flask response");
-            }
+            // Use the structured filenames, falling back to parsing the raw answer
+            let filenames: string[];
+            if (data.filenames) {
+                filenames = data.filenames;
+            } else {
+                const filenameLine = (data.result || '').split('\n').find(line => line.startsWith('Filename:'));
+                if (!filenameLine) {
+                    throw new Error("Filename line not found in Flask response");
+                }
 
-            // Parse the array of filenames
-            const filenames = filenameLine
-                .split(': ')[1] // Split to get the portion after "Filename: "
-                .trim() // Remove extra whitespace
-                .replace('[', '') // Remove opening bracket
-                .replace(']', '') // Remove closing bracket
-                .split(',') // Split into individual filenames
-                .map(filename => filename.trim()); // Remove whitespace around filenames
+                // Parse the array of filenames
+                filenames = filenameLine
+                    .split(': ')[1] // Split to get the portion after "Filename: "
+                    .trim() // Remove extra whitespace
+                    .replace('[', '') // Remove opening bracket
+                    .replace(']', '') // Remove closing bracket
+                    .split(',') // Split into individual filenames
+                    .map(filename => filename.trim()); // Remove whitespace around filenames
+            }
 
             console.log("Parsed Filenames:", filenames);
 
-            // If no filenames are returned, return an empty array
-            if (filenames.length === 0 || filenames[0] == '') {
-                console.log("No matching filenames found.");
-                return []; // Return no pictures
-            }
+            return this.matchPhotos(query, filenames);
+
+        } catch (error) {
+            console.error('Error searching photos via Flask:', error);
+            // Fallback to basic text search on error
+            return this.textSearch(query);
+        }
+    }
 
-            // Find all matching photos
-            const matchedPhotos = filenames
-                .map(filename => photos.find(p => p.url.includes(filename)))
-                .filter((photo): photo is Photo => photo !== undefined);
+    // Answer many queries (e.g. smart albums) with one Flask call; results
+    // come back in the order of the queries
+    async searchPhotosBatch(queries: string[], mode: 'rerank' | 'fast' = 'rerank'): Promise<Photo[][]> {
+        try {
+            const response = await fetch(`${this.flaskApiUrl}/search_photos/batch`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ queries, mode })
+            });
 
-            if (matchedPhotos.length > 0) {
-                return matchedPhotos;
+            if (!response.ok) {
+                throw new Error(`Flask API error: ${response.statusText}`);
             }
 
-            // Fallback to traditional text search if no match found
-            const lowercaseQuery = query.toLowerCase();
-            return photos.filter(photo =>
-                photo.description.toLowerCase().includes(lowercaseQuery)
+            const data: FlaskBatchSearchResponse = await response.json();
+            return data.results.map(result =>
+                result.error || !result.filenames
+                    ? this.textSearch(result.query)
+                    : this.matchPhotos(result.query, result.filenames)
             );
 
         } catch (error) {
-            console.error('Error searching photos via Flask:', error);
-            // Fallback to basic text search on error
-            const lowercaseQuery = query.toLowerCase();
-            return photos.filter(photo =>
-                photo.description.toLowerCase().includes(lowercaseQuery)
-            );
+            console.error('Error batch searching photos via Flask:', error);
+            return queries.map(query => this.textSearch(query));
+        }
+    }
+
+    private matchPhotos(query: string, filenames: string[]): Photo[] {
+        // If no filenames are returned, return an empty array
+        if (filenames.length === 0 || filenames[0] == '') {
+            console.log("No matching filenames found.");
+            return []; // Return no pictures
+        }
+
+        // Find all matching photos
+        const matchedPhotos = filenames
+            .map(filename => photos.find(p => p.url.includes(filename)))
+            .filter((photo): photo is Photo => photo !== undefined);
+
+        if (matchedPhotos.length > 0) {
+            return matchedPhotos;
         }
+
+        // Fallback to traditional text search if no match found
+        return this.textSearch(query);
+    }
+
+    private textSearch(query: string): Photo[] {
+        const lowercaseQuery = query.toLowerCase();
+        return photos.filter(photo =>
+            photo.description.toLowerCase().includes(lowercaseQuery)
+        );
     }
 
     async savePhoto(photoData: Omit<Photo, 'id'>): Promise<Photo> {
@@ -216,24 +263,29 @@ export class PhotoService {
         };
         photos.unshift(newPhoto);
 
-        try {
-            // Update the knowledge graph with the new photo
-            // await fetch(`${this.flaskApiUrl}/build_knowledge_graph`, {
-            //     method: 'POST',
-            //     headers: {
-            //         'Content-Type': 'application/json',
-            //     },
-            //     body: JSON.stringify({
-            //         photos: {
-            //             [newPhoto.url]: newPhoto.description
-            //         }
-            //     })
-            // });
-        } catch (error) {
-            console.error('Error updating knowledge graph:', error);
-            // Continue even if knowledge graph update fails
-            // The photo is still saved in local storage
-        }
+        // Incrementally add the new photo to the knowledge graph. Not awaited:
+        // extraction takes seconds and waits behind any running rebuild, and
+        // the photo is already saved in local storage either way
+        const filename = newPhoto.url.split('/').pop() as string;
+        fetch(`${this.flaskApiUrl}/upsert_photos`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                photos: {
+                    [filename]: newPhoto.description
+                }
+            })
+        })
+            .then(async response => {
+                if (!response.ok) {
+                    console.error(`Error updating knowledge graph for ${filename}: ${response.status} ${await response.text()}`);
+                }
+            })
+            .catch(error => {
+                console.error('Error updating knowledge graph:', error);
+            });
 
         return newPhoto;
     }
@@ -0,0 +1,1094 @@
+"""
+Offline benchmark for PhotoGraphRAG ingest and search.
+
+Runs the real ingest and search code paths against deterministic stand-ins
+instead of OpenAI and Neo4j, so it needs no network and can run in CI:
+
+    FakeChatModel     chat model with configurable latency; answers graph
+                      extraction tool calls and rerank prompts
+    HashEmbeddings    feature-hashing embedder with configurable latency
+    InMemoryGraph     dict-backed graph answering the Cypher PhotoGraphRAG
+                      and BulkGraphWriter send, one store per graph version
+    InMemoryVectorStore  brute-force hybrid (cosine + keyword) search over
+                      the stored chunks
+
+Corpora are synthesized from the sample library by recombining its
+sentences, from the 19 originals up to 100k photos. Results (ingest
+throughput, search p50/p95/p99, peak RSS and remote-call counts) are printed
+as JSON so runs on different commits can be compared:
+
+    python benchmark.py --photos 1000 --queries 200
+    python benchmark.py --photos 19,1000,10000,100000 --output bench.json
+    python benchmark.py --photos 1000 --search-batch 32
+    python benchmark.py --startup 10
+
+The --startup mode instead measures cold start: import time and the time
+until /health/live and /health/ready answer, each in a fresh process.
+
+Every corpus size runs in its own process so peak RSS and the singleton
+PhotoGraphRAG start fresh.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The module-level PhotoGraphRAG would connect to Neo4j and OpenAI on import
+os.environ.setdefault("GRAPHRAG_EAGER_INIT", "0")
+import graphRAGTesting as rag_module  # noqa: E402
+from graphRAGTesting import (  # noqa: E402
+    ALLOWED_RELATIONSHIPS,
+    AWAIT_INDEXES_QUERY,
+    BATCH_GRAPH_SEARCH_QUERY,
+    BATCH_VECTOR_SEARCH_QUERY,
+    CHUNK_COUNT_QUERY,
+    CLEAR_LIVE_VERSION_QUERY,
+    DELETE_VERSION_QUERY,
+    ENTITY_MENTIONS_QUERY,
+    ENTITY_RELATIONS_QUERY,
+    FORGET_VERSION_QUERY,
+    EXISTING_PHOTOS_BY_NAME_QUERY,
+    EXISTING_PHOTOS_QUERY,
+    GRAPH_INDEXES_QUERY,
+    GRAPH_LABELS_QUERY,
+    GRAPH_NEIGHBOURS_QUERY,
+    GRAPH_SEARCH_QUERY,
+    INDEX_STATES_QUERY,
+    LIVE_VERSION_QUERY,
+    LOCAL_INDEX_SYNC_QUERY,
+    RECORD_VERSION_QUERY,
+    REMOVE_PHOTO_RELATIONSHIPS_QUERY,
+    REMOVE_PHOTO_SUBGRAPHS_QUERY,
+    REMOVE_PHOTO_VECTORS_QUERY,
+    RETIRE_VERSION_QUERY,
+    SET_LIVE_VERSION_QUERY,
+    SAMPLE_PHOTO_DESCRIPTIONS,
+    VERSION_RECORDS_QUERY,
+    PhotoGraphRAG,
+)
+from graph_versions import (CHUNK_LABEL, DOCUMENT_LABEL,  # noqa: E402
+                            KEYWORD_INDEX, VECTOR_INDEX, versioned,
+                            versions_in)
+from graph_writer import BASE_ENTITY_LABEL  # noqa: E402
+
+BENCHMARK_QUERIES = [
+    "Busy downtown",
+    "sunset at the beach",
+    "cute animals",
+    "people sharing a meal",
+    "sports car on a mountain road",
+    "hiking in the mountains",
+    "famous landmark at dusk",
+    "city skyline at night",
+    "desert sand dunes",
+    "coffee shop with people working",
+    "men in suits",
+    "gym workout",
+    "fast food restaurant",
+    "family outdoors",
+    "silver electric car",
+    "fighting birds",
+    "surreal cosmic art",
+    "calm ocean waves",
+    "winding road through hills",
+    "puppies in a basket",
+]
+
+# Words the fake extractor turns into entities, by node type
+ENTITY_VOCABULARY = {
+    "Landscape": ["desert", "mountain", "mountains", "beach", "hills",
+                  "hillside", "dunes", "landscape", "shoreline"],
+    "NaturalFeature": ["sand", "ocean", "water", "trees", "grass", "sky",
+                       "clouds", "foliage", "sun", "waves", "greenery"],
+    "Building": ["restaurant", "building", "house", "skyscrapers", "café",
+                 "gym", "tower", "counter", "garage"],
+    "Person": ["man", "woman", "men", "women", "hiker", "barista", "boy",
+               "people", "patrons", "individuals"],
+    "Activity": ["dinner", "hiking", "fight", "conversation", "lift",
+                 "walking", "meal", "bout", "work"],
+    "Object": ["car", "basket", "table", "laptop", "backpack", "road",
+               "minivan", "quilt", "bench", "puppies", "kittens",
+               "roosters", "chimpanzee", "vehicle", "spaghetti"],
+    "TimeContext": ["sunset", "twilight", "evening", "night", "dusk",
+                    "day", "sunlight"],
+    "Atmosphere": ["serene", "tranquil", "lively", "cozy", "dramatic",
+                   "peaceful", "vibrant", "joyful", "calm"],
+    "Weather": ["sunny", "storm", "clear", "wispy"],
+    "Location": ["paris", "kong", "city", "harbour", "arena", "cityscape",
+                 "café"],
+}
+_ENTITY_TYPES = {word: node_type
+                 for node_type, words in ENTITY_VOCABULARY.items()
+                 for word in words}
+
+_TOKEN = re.compile(r"[\w']+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _stable_hash(text: str) -> int:
+    # hash() is salted per process; benchmark output must be reproducible
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(values, q)), 3)
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class CallCounter:
+    """
+    Thread-safe named counters shared by the stand-ins
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self.counts[name] += value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+# Synthetic corpora
+
+def synthetic_corpus(size: int, seed: int = 0) -> Iterator[Tuple[str, str]]:
+    """
+    Yield size (filename, description) pairs. The first photos are the
+    sample library itself; the rest splice together sentences of randomly
+    chosen sample descriptions, so vocabulary and length stay realistic.
+    """
+    samples = list(SAMPLE_PHOTO_DESCRIPTIONS.items())
+    sentences = [
+        [s.strip() for s in description.split(". ") if s.strip()]
+        for _, description in samples
+    ]
+    rng = random.Random(seed)
+    for i in range(size):
+        if i < len(samples):
+            yield samples[i]
+            continue
+        base, other = rng.sample(range(len(samples)), 2)
+        picked = sentences[base][:rng.randint(2, len(sentences[base]))]
+        picked += rng.sample(sentences[other], min(2, len(sentences[other])))
+        yield f"photo_{i:06d}.jpg", ". ".join(picked) + "."
+
+
+def corpus_ndjson(size: int, seed: int = 0) -> Iterator[str]:
+    for filename, description in synthetic_corpus(size, seed):
+        yield json.dumps({"filename": filename, "description": description})
+
+
+# Stand-ins for OpenAI
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model. Tool-calling requests (LLMGraphTransformer's
+    structured output) get entities picked from ENTITY_VOCABULARY; plain
+    prompts are treated as rerank requests and answered in the rerank format
+    with the first photos named in the context. Every call sleeps latency
+    seconds.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.0
+    max_entities: int = 8
+    counter: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [convert_to_openai_tool(tool)["function"]["name"]
+                 for tool in tools]
+        return self.bind(tool_names=names, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None,
+                  tool_names=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "\n".join(str(message.content) for message in messages)
+        if tool_names:
+            message = self._extraction(prompt, tool_names[0])
+            kind = "extraction"
+        else:
+            message = self._rerank(prompt)
+            kind = "rerank"
+        if self.counter is not None:
+            self.counter.add(f"llm_{kind}_calls")
+            self.counter.add("llm_input_tokens", len(prompt.split()))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _extraction(self, prompt: str, tool_name: str) -> AIMessage:
+        text = prompt.rsplit("input:", 1)[-1]
+        nodes = {}
+        for token in _tokens(text):
+            node_type = _ENTITY_TYPES.get(token)
+            if node_type and token not in nodes:
+                nodes[token] = node_type
+                if len(nodes) >= self.max_entities:
+                    break
+        entities = list(nodes.items())
+        relationships = [
+            {
+                "source_node_id": head, "source_node_type": head_type,
+                "target_node_id": tail, "target_node_type": tail_type,
+                "type": ALLOWED_RELATIONSHIPS[
+                    _stable_hash(head_type + tail_type) % len(ALLOWED_RELATIONSHIPS)]
+            }
+            for (head, head_type), (tail, tail_type)
+            in zip(entities, entities[1:])
+        ]
+        args = {
+            "nodes": [{"id": word, "type": node_type}
+                      for word, node_type in entities],
+            "relationships": relationships
+        }
+        return AIMessage(content="", tool_calls=[
+            {"name": tool_name, "args": args, "id": f"call_{_stable_hash(text)}"}
+        ])
+
+    def _rerank(self, prompt: str) -> AIMessage:
+        context, _, query = prompt.rpartition("Query:")
+        found = re.findall(r"Photo (\S+?):", context)
+        found += re.findall(r"'filename': '([^']+)'", context)
+        chosen = list(dict.fromkeys(found))[:2]
+        answer = (
+            f"Filename: [{', '.join(chosen)}]\n"
+            "Primary Match Factors:\n"
+            f"- [{', '.join(_tokens(query.split(chr(10))[0])[:3])}]\n"
+            "Detailed Reasoning: Deterministic benchmark answer."
+        )
+        input_tokens = len(prompt.split())
+        output_tokens = len(answer.split())
+        return AIMessage(content=answer, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        })
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Signed feature hashing of word unigrams into a unit vector, so texts
+    sharing words land close together
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.0,
+                 counter: Optional[CallCounter] = None):
+        self.dimension = dimension
+        self.latency = latency
+        self.counter = counter
+        self.model = f"hash-{dimension}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in _tokens(text):
+            h = _stable_hash(token)
+            vector[h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.counter is not None:
+            self.counter.add("embedding_calls")
+            self.counter.add("embedding_texts", len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# Stand-ins for Neo4j
+
+def _normalize_cypher(query: str) -> str:
+    return " ".join(query.split())
+
+
+class _Result:
+    def consume(self):
+        return None
+
+
+class _Session:
+    """
+    The slice of a neo4j Session that BulkGraphWriter uses
+    """
+
+    def __init__(self, graph: "InMemoryGraph"):
+        self.graph = graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query: str, params: Optional[Dict] = None) -> _Result:
+        self.graph.write(query, params or {})
+        return _Result()
+
+    def execute_write(self, work):
+        self.graph.counter.add("db_transactions")
+        return work(self)
+
+
+class _Driver:
+    def __init__(self, graph: "InMemoryGraph"):
+        self.graph = graph
+
+    def session(self, database=None) -> _Session:
+        return _Session(self.graph)
+
+
+# Versioned labels (`Document_v3`) select the store a statement runs against
+_VERSIONED_LABEL = re.compile(
+    rf"`({DOCUMENT_LABEL}|{CHUNK_LABEL}|{BASE_ENTITY_LABEL})_v(\d+)`")
+_INDEX_NAME = re.compile(r"(?:CREATE|DROP) (?:VECTOR |FULLTEXT )?INDEX `?(\w+)`?")
+
+
+def _unversioned(query: str) -> Tuple[str, int]:
+    """
+    The query with its version labels replaced by the base labels, and the
+    version it targets
+    """
+    versions = {int(m.group(2)) for m in _VERSIONED_LABEL.finditer(query)}
+    return _VERSIONED_LABEL.sub(lambda m: m.group(1), query), max(versions, default=0)
+
+
+class _VersionStore:
+    """
+    The nodes, relationships and fulltext postings of one graph version
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, Dict] = {}
+        self.entities: Dict[str, Dict] = {}
+        self.mentions: Dict[str, set] = defaultdict(set)
+        self.mentioned_by: Dict[str, set] = defaultdict(set)
+        # (source, type, target) -> photos whose extraction produced it
+        self.relationships: Dict[Tuple[str, str, str], set] = {}
+        self.chunks: Dict[str, Dict] = {}
+        self.postings: Dict[str, set] = defaultdict(set)
+        self.revision = 0
+        self._matrix = None
+
+    def write_chunks(self, rows: List[Dict]):
+        for row in rows:
+            self.drop_chunk(row["id"])
+            self.chunks[row["id"]] = {
+                "text": row["text"],
+                **row["metadata"],
+                "embedding": np.asarray(row["embedding"], dtype=np.float32)
+            }
+            for token in set(_tokens(row["text"])):
+                self.postings[token].add(row["id"])
+        self.revision += 1
+
+    def embedding_matrix(self) -> Tuple[List[Dict], np.ndarray]:
+        """
+        The chunks and their stacked embeddings, rebuilt after writes
+        """
+        if self._matrix is None or self._matrix[0] != self.revision:
+            chunks = list(self.chunks.values())
+            matrix = (np.vstack([c["embedding"] for c in chunks]) if chunks
+                      else np.zeros((0, 0), dtype=np.float32))
+            self._matrix = (self.revision, chunks, matrix)
+        return self._matrix[1], self._matrix[2]
+
+    def drop_chunk(self, chunk_id: str):
+        chunk = self.chunks.pop(chunk_id, None)
+        if chunk is None:
+            return
+        for token in set(_tokens(chunk["text"])):
+            self.postings[token].discard(chunk_id)
+
+
+class InMemoryGraph:
+    """
+    Dict-backed stand-in for Neo4jGraph. Reads are dispatched on the Cypher
+    constants of graphRAGTesting; writes come through the driver sessions of
+    BulkGraphWriter. Each graph version has its own store, picked by the
+    versioned labels in the statement. Unknown queries raise, so new Cypher
+    has to be taught to the benchmark instead of silently returning nothing.
+    """
+
+    def __init__(self, counter: Optional[CallCounter] = None):
+        self.counter = counter or CallCounter()
+        self._lock = threading.RLock()
+        self._driver = _Driver(self)
+        self._database = "neo4j"
+        self.stores: Dict[int, _VersionStore] = {}
+        self.indexes = set()
+        self.live_version: Optional[int] = None
+        # version -> creation and retirement times (ms), like GraphRAGState
+        self.version_records: Dict[int, Dict[str, Optional[float]]] = {}
+        self._reads = {
+            _normalize_cypher(EXISTING_PHOTOS_QUERY): self._existing_photos,
+            _normalize_cypher(EXISTING_PHOTOS_BY_NAME_QUERY): self._existing_photos,
+            _normalize_cypher(REMOVE_PHOTO_RELATIONSHIPS_QUERY): self._remove_relationships,
+            _normalize_cypher(REMOVE_PHOTO_SUBGRAPHS_QUERY): self._remove_subgraphs,
+            _normalize_cypher(REMOVE_PHOTO_VECTORS_QUERY): self._remove_chunks,
+            _normalize_cypher(GRAPH_SEARCH_QUERY): self._fulltext_search,
+            _normalize_cypher(BATCH_GRAPH_SEARCH_QUERY): self._fulltext_search_batch,
+            _normalize_cypher(BATCH_VECTOR_SEARCH_QUERY): self._vector_search_batch,
+            _normalize_cypher(GRAPH_NEIGHBOURS_QUERY): self._neighbours,
+            _normalize_cypher(CHUNK_COUNT_QUERY): self._chunk_count,
+            _normalize_cypher(LOCAL_INDEX_SYNC_QUERY): self._chunk_rows,
+            _normalize_cypher(DELETE_VERSION_QUERY): self._delete_version,
+            _normalize_cypher(ENTITY_MENTIONS_QUERY): self._entity_mentions,
+            _normalize_cypher(ENTITY_RELATIONS_QUERY): self._entity_relations,
+        }
+        self._admin = {
+            _normalize_cypher(LIVE_VERSION_QUERY): self._live_version,
+            _normalize_cypher(SET_LIVE_VERSION_QUERY): self._set_live_version,
+            _normalize_cypher(CLEAR_LIVE_VERSION_QUERY): self._clear_live_version,
+            _normalize_cypher(RECORD_VERSION_QUERY): self._record_version,
+            _normalize_cypher(RETIRE_VERSION_QUERY): self._retire_version,
+            _normalize_cypher(VERSION_RECORDS_QUERY): self._version_records,
+            _normalize_cypher(FORGET_VERSION_QUERY): self._forget_version,
+            _normalize_cypher(GRAPH_LABELS_QUERY): self._labels,
+            _normalize_cypher(GRAPH_INDEXES_QUERY): self._index_names,
+            _normalize_cypher(INDEX_STATES_QUERY): self._index_states,
+            _normalize_cypher(AWAIT_INDEXES_QUERY): lambda params: [],
+        }
+
+    def store(self, version: int = 0) -> _VersionStore:
+        with self._lock:
+            return self.stores.setdefault(version, _VersionStore())
+
+    # Neo4jGraph interface
+
+    def query(self, query: str, params: Optional[Dict] = None) -> List[Dict]:
+        self.counter.add("db_queries")
+        normalized, version = _unversioned(_normalize_cypher(query))
+        with self._lock:
+            if normalized.startswith("DROP "):
+                self._schema(query)
+                return []
+            if normalized in self._admin:
+                return self._admin[normalized](params or {})
+            handler = self._reads.get(normalized)
+            if handler is None:
+                raise ValueError(
+                    f"InMemoryGraph does not support query: {normalized}")
+            return handler(self.store(version), params or {})
+
+    def write(self, query: str, params: Dict):
+        self.counter.add("db_statements")
+        rows = params.get("rows", [])
+        query, version = _unversioned(query)
+        with self._lock:
+            if query.startswith("CREATE "):
+                self._schema(query)
+                return
+            store = self.store(version)
+            if "setNodeVectorProperty" in query:
+                store.write_chunks(rows)
+            elif "[:MENTIONS]" in query:
+                for row in rows:
+                    store.mentions[row["document"]].add(row["entity"])
+                    store.mentioned_by[row["entity"]].add(row["document"])
+            elif "MERGE (s)-[r:" in query:
+                rel_type = re.search(r"\[r:`([^`]+)`\]", query).group(1)
+                for row in rows:
+                    sources = store.relationships.setdefault(
+                        (row["source"], rel_type, row["target"]), set())
+                    if row.get("photo") is not None:
+                        sources.add(row["photo"])
+            elif "SET n:`" in query:
+                label = re.search(r"SET n:`([^`]+)`", query).group(1)
+                for row in rows:
+                    entity = store.entities.setdefault(
+                        row["id"], {"labels": set(), "properties": {}})
+                    entity["labels"].add(label)
+                    entity["properties"].update(row["properties"])
+            elif "MERGE (d:" in query:
+                for row in rows:
+                    store.documents[row["id"]] = {"text": row["text"],
+                                                  **row["metadata"]}
+            else:
+                raise ValueError(f"InMemoryGraph does not support write: {query}")
+
+    def _schema(self, statement: str):
+        match = _INDEX_NAME.match(statement)
+        if match and statement.startswith("CREATE "):
+            self.indexes.add(match.group(1))
+        elif match:
+            self.indexes.discard(match.group(1))
+
+    # Version bookkeeping
+
+    def _live_version(self, params: Dict) -> List[Dict]:
+        if self.live_version is None:
+            return []
+        return [{"version": self.live_version}]
+
+    def _set_live_version(self, params: Dict) -> List[Dict]:
+        self.live_version = params["version"]
+        return []
+
+    def _clear_live_version(self, params: Dict) -> List[Dict]:
+        self.live_version = None
+        self.version_records.clear()
+        return []
+
+    def _record_version(self, params: Dict) -> List[Dict]:
+        self.version_records[params["version"]] = {
+            "created_at": time.time() * 1000, "retired_at": None}
+        return []
+
+    def _retire_version(self, params: Dict) -> List[Dict]:
+        record = self.version_records.get(params["version"])
+        if record is not None:
+            record["retired_at"] = time.time() * 1000
+        return []
+
+    def _version_records(self, params: Dict) -> List[Dict]:
+        now = time.time() * 1000
+        return [{"version": version,
+                 "age_ms": now - record["created_at"],
+                 "retired_ms": (now - record["retired_at"]
+                                if record["retired_at"] is not None else None)}
+                for version, record in self.version_records.items()]
+
+    def _forget_version(self, params: Dict) -> List[Dict]:
+        self.version_records.pop(params["version"], None)
+        return []
+
+    def _labels(self, params: Dict) -> List[Dict]:
+        return [{"name": versioned(DOCUMENT_LABEL, version)}
+                for version, store in self.stores.items()
+                if store.documents or store.chunks]
+
+    def _index_names(self, params: Dict) -> List[Dict]:
+        return [{"name": name} for name in sorted(self.indexes)]
+
+    def _index_states(self, params: Dict) -> List[Dict]:
+        return [{"name": name, "state": "ONLINE"}
+                for name in params["names"] if name in self.indexes]
+
+    def _delete_version(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        for version, candidate in list(self.stores.items()):
+            if candidate is store:
+                del self.stores[version]
+        return []
+
+    # Read handlers, one per Cypher constant
+
+    def _existing_photos(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        wanted = params.get("filenames")
+        return [
+            {"filename": doc["filename"], "content_hash": doc.get("content_hash")}
+            for doc in store.documents.values()
+            if doc.get("filename") is not None
+            and (wanted is None or doc["filename"] in wanted)
+        ]
+
+    def _remove_subgraphs(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        filenames = set(params["filenames"])
+        doomed = [doc_id for doc_id, doc in store.documents.items()
+                  if doc.get("filename") in filenames]
+        for doc_id in doomed:
+            for entity in store.mentions.pop(doc_id, set()):
+                store.mentioned_by[entity].discard(doc_id)
+                if not store.mentioned_by[entity]:
+                    del store.mentioned_by[entity]
+                    store.entities.pop(entity, None)
+            del store.documents[doc_id]
+        store.relationships = {
+            rel: sources for rel, sources in store.relationships.items()
+            if rel[0] in store.entities and rel[2] in store.entities
+        }
+        return []
+
+    def _remove_relationships(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        filenames = set(params["filenames"])
+        for rel, sources in list(store.relationships.items()):
+            if sources & filenames:
+                sources -= filenames
+                if not sources:
+                    del store.relationships[rel]
+        return []
+
+    def _remove_chunks(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        filenames = set(params["filenames"])
+        for chunk_id in [chunk_id for chunk_id, chunk in store.chunks.items()
+                         if chunk.get("filename") in filenames]:
+            store.drop_chunk(chunk_id)
+        store.revision += 1
+        return []
+
+    def _fulltext_search(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        if params["keyword_index"] not in self.indexes:
+            raise ValueError(f"No such fulltext index: {params['keyword_index']}")
+        # OR of the query terms weighted by idf, like the default Lucene parser
+        scores: Dict[str, float] = defaultdict(float)
+        total = max(len(store.chunks), 1)
+        for token in set(_tokens(params["query"])):
+            matches = store.postings.get(token)
+            if not matches:
+                continue
+            idf = math.log(1 + total / len(matches))
+            for chunk_id in matches:
+                scores[chunk_id] += idf
+        best: Dict[str, Dict] = {}
+        for chunk_id, score in scores.items():
+            chunk = store.chunks[chunk_id]
+            filename = chunk.get("filename")
+            if filename and score > best.get(filename, {}).get("score", -1):
+                best[filename] = {"filename": filename,
+                                  "description": chunk["text"], "score": score}
+        rows = sorted(best.values(), key=lambda r: -r["score"])
+        return rows[:params["limit"]]
+
+    def _fulltext_search_batch(self, store: _VersionStore,
+                               params: Dict) -> List[Dict]:
+        return [{"query_index": q["index"], **row}
+                for q in params["queries"]
+                for row in self._fulltext_search(store, {**params, **q})]
+
+    def _vector_search_batch(self, store: _VersionStore,
+                             params: Dict) -> List[Dict]:
+        # No labels to go by; the versioned index name picks the store
+        store = self.store(versions_in([params["vector_index"]]).pop())
+        return [{"query_index": q["index"], **row}
+                for q in params["queries"]
+                for row in self.hybrid_search(
+                    store, q["embedding"], q["query"], params["k"],
+                    params["vector_index"], params["keyword_index"])]
+
+    def hybrid_search(self, store: _VersionStore, embedding: Sequence[float],
+                      query: str, k: int, vector_index: str,
+                      keyword_index: str) -> List[Dict]:
+        """
+        Neo4jVector's hybrid search: the top k of the vector index (cosine
+        scores mapped to [0, 1] like Neo4j's) and of the fulltext index, each
+        normalised by its best score, merged per photo
+        """
+        if vector_index not in self.indexes:
+            raise ValueError(f"No such vector index: {vector_index}")
+        chunks, matrix = store.embedding_matrix()
+        if not chunks:
+            return []
+        scores = (1 + matrix @ np.asarray(embedding, dtype=np.float32)) / 2
+        top = np.argsort(-scores)[:k]
+        branches = [[{"filename": chunks[i].get("filename"),
+                      "text": chunks[i]["text"], "score": float(scores[i])}
+                     for i in top]]
+        if query.strip():
+            branches.append([
+                {"filename": row["filename"], "text": row["description"],
+                 "score": row["score"]}
+                for row in self._fulltext_search(store, {
+                    "keyword_index": keyword_index, "query": query, "limit": k})])
+        merged: Dict[str, Dict] = {}
+        for rows in branches:
+            best = max((row["score"] for row in rows), default=0) or 1
+            for row in rows:
+                score = row["score"] / best
+                if score > merged.get(row["filename"], {}).get("score", -1):
+                    merged[row["filename"]] = {**row, "score": score}
+        return sorted(merged.values(), key=lambda r: -r["score"])[:k]
+
+    def _neighbours(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        seeds = {doc_id for doc_id, doc in store.documents.items()
+                 if doc.get("filename") in set(params["filenames"])}
+        shared: Dict[str, set] = defaultdict(set)
+        for seed in seeds:
+            for entity in store.mentions.get(seed, ()):
+                for other in store.mentioned_by.get(entity, ()):
+                    if other != seed:
+                        shared[other].add(entity)
+        return [{"filename": store.documents[doc_id].get("filename"),
+                 "shared": len(entities)}
+                for doc_id, entities in shared.items()]
+
+    def _chunk_count(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        return [{"count": len(store.chunks)}]
+
+    def _entity_mentions(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        return [{"filename": store.documents[doc_id].get("filename"), "entity": entity}
+                for doc_id, entities in store.mentions.items()
+                if store.documents.get(doc_id, {}).get("filename") is not None
+                for entity in entities]
+
+    def _entity_relations(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        return [{"source": source, "target": target, "sources": sorted(sources)}
+                for (source, _, target), sources in store.relationships.items()]
+
+    def _chunk_rows(self, store: _VersionStore, params: Dict) -> List[Dict]:
+        return [{"filename": chunk.get("filename"), "text": chunk["text"],
+                 "embedding": chunk["embedding"].tolist()}
+                for chunk in store.chunks.values()]
+
+
+class InMemoryVectorStore:
+    """
+    Stand-in for the Neo4jVector hybrid search over the chunks of one
+    InMemoryGraph version
+    """
+
+    def __init__(self, graph: InMemoryGraph, version: int = 0):
+        self.graph = graph
+        self.version = version
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4,
+                                               query: Optional[str] = None,
+                                               **kwargs):
+        from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+        self.graph.counter.add("db_queries")
+        with self.graph._lock:
+            store = self.graph.stores.get(self.version)
+            if store is None:
+                raise ValueError(f"Graph version {self.version} has been dropped")
+            rows = self.graph.hybrid_search(
+                store, embedding, remove_lucene_chars(query or ""), k,
+                versioned(VECTOR_INDEX, self.version),
+                versioned(KEYWORD_INDEX, self.version))
+        return [
+            (Document(page_content=row["text"],
+                      metadata={"filename": row["filename"]}), row["score"])
+            for row in rows
+        ]
+
+
+# Benchmark runs
+
+def run_load(mode: str, requests: int, concurrency: int) -> Dict:
+    """
+    Fire requests searches at the Flask app from concurrency threads at once,
+    through admission control, and tally latencies and status codes
+    """
+    def one(i: int) -> Tuple[int, float]:
+        client = rag_module.app.test_client()
+        started = time.perf_counter()
+        response = client.post("/search_photos", json={
+            "query": BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)], "mode": mode})
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    statuses: Dict[str, int] = defaultdict(int)
+    for status, _ in outcomes:
+        statuses[str(status)] += 1
+    served = [ms for status, ms in outcomes if status == 200]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": round(requests / max(elapsed, 1e-9), 2),
+        "statuses": dict(statuses),
+        "p50_ms": percentile(served, 50),
+        "p99_ms": percentile(served, 99)
+    }
+
+
+def run_batches(rag: PhotoGraphRAG, mode: str, queries: int, size: int,
+                counter: CallCounter) -> Dict:
+    """
+    Send the benchmark queries through search_photos_batch, size at a time,
+    and report latency per batch and per query plus the remote calls made
+    """
+    latencies: List[float] = []
+    before = counter.snapshot()
+    for start in range(0, queries, size):
+        batch = [BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)]
+                 for i in range(start, min(start + size, queries))]
+        batch_started = time.perf_counter()
+        rag.search_photos_batch(batch, mode=mode)
+        latencies.append((time.perf_counter() - batch_started) * 1000)
+    after = counter.snapshot()
+    return {
+        "size": size,
+        "batches": len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "per_query_ms": round(sum(latencies) / max(queries, 1), 3),
+        "remote_calls": {name: after[name] - before.get(name, 0)
+                         for name in after
+                         if after[name] != before.get(name, 0)}
+    }
+
+
+def run_benchmark(photos: int, queries: int = 100, modes: Sequence[str] = ("fast", "rerank"),
+                  batch_size: int = 500, llm_latency: float = 0.0,
+                  embedding_latency: float = 0.0, dimension: int = 256,
+                  seed: int = 0, concurrency: int = 0,
+                  search_batch: int = 0) -> Dict:
+    """
+    Ingest a synthetic corpus of the given size into a fresh PhotoGraphRAG
+    backed by the stand-ins, then run the benchmark queries, one at a time
+    and, with concurrency, as a burst through the Flask app, and with
+    search_batch, in batches through search_photos_batch. Caches and the
+    optional local vector index live in a temporary directory, so every run
+    starts cold.
+    """
+    counter = CallCounter()
+    graph = InMemoryGraph(counter)
+    llm = FakeChatModel(latency=llm_latency, counter=counter)
+    embeddings = HashEmbeddings(dimension, embedding_latency, counter)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["GRAPHRAG_CACHE_PATH"] = os.path.join(workdir, "cache.sqlite3")
+        os.environ["GRAPHRAG_LOCAL_INDEX_PATH"] = os.path.join(
+            workdir, "index", "photo_vectors")
+
+        rag = PhotoGraphRAG(graph=graph, llm=llm, embeddings=embeddings,
+                            vector_store_factory=lambda version: InMemoryVectorStore(
+                                graph, version.version))
+        rag_module.photo_rag = rag
+
+        started = time.perf_counter()
+        summary = {}
+        for event in rag.ingest_ndjson(corpus_ndjson(photos, seed),
+                                       batch_size=batch_size, reset=True):
+            if event["event"] == "done":
+                summary = event
+        ingest_seconds = time.perf_counter() - started
+        ingest_calls = counter.snapshot()
+
+        search = {}
+        for mode in modes:
+            latencies: List[float] = []
+            stages: Dict[str, List[float]] = defaultdict(list)
+            before = counter.snapshot()
+            for i in range(queries):
+                query = BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)]
+                timings: Dict[str, float] = {}
+                query_started = time.perf_counter()
+                rag.search_photos_detailed(query, mode=mode, timings=timings)
+                latencies.append((time.perf_counter() - query_started) * 1000)
+                for stage, ms in timings.items():
+                    stages[stage].append(ms)
+            after = counter.snapshot()
+            search[mode] = {
+                "queries": queries,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "mean_ms": round(float(np.mean(latencies)), 3) if latencies else None,
+                "stage_p50_ms": {stage: percentile(values, 50)
+                                 for stage, values in sorted(stages.items())},
+                "remote_calls": {name: after[name] - before.get(name, 0)
+                                 for name in after
+                                 if after[name] != before.get(name, 0)}
+            }
+            if search_batch:
+                search[mode]["batch"] = run_batches(rag, mode, queries,
+                                                    search_batch, counter)
+            if concurrency:
+                search[mode]["load"] = run_load(mode, queries, concurrency)
+
+    return {
+        "photos": photos,
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "photos_per_second": round(photos / max(ingest_seconds, 1e-9), 2),
+            "failed": summary.get("failed_count", 0),
+            "batches": summary.get("batches", 0),
+            "remote_calls": ingest_calls
+        },
+        "search": search,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# Cold start: run in a fresh interpreter that has imported nothing else, so
+# the graphRAGTesting import is timed on its own
+_STARTUP_PROBE = (
+    "import time; started = time.perf_counter(); import graphRAGTesting; "
+    "imported = time.perf_counter(); import benchmark; "
+    "benchmark.startup_probe(started, imported)"
+)
+
+
+def startup_probe(started: float, imported: float):
+    """
+    Child side of run_startup: time /health/live and /health/ready from
+    process start and print them as JSON. Importing the stand-ins is left
+    out of the times.
+    """
+    stand_ins = time.perf_counter() - imported
+    with tempfile.TemporaryDirectory() as workdir, \
+            contextlib.redirect_stdout(sys.stderr):
+        os.environ["GRAPHRAG_CACHE_PATH"] = os.path.join(workdir, "cache.sqlite3")
+        graph = InMemoryGraph()
+        rag = PhotoGraphRAG(graph=graph, llm=FakeChatModel(),
+                            embeddings=HashEmbeddings(),
+                            vector_store_factory=lambda version: InMemoryVectorStore(
+                                graph, version.version))
+        rag_module.photo_rag = rag
+        rag.warm_up()
+        client = rag_module.app.test_client()
+        while client.get("/health/live").status_code != 200:
+            time.sleep(0.001)
+        live = time.perf_counter()
+        while client.get("/health/ready").status_code != 200:
+            time.sleep(0.001)
+        ready = time.perf_counter()
+        rag.warm_up(background=False)
+        warm = time.perf_counter()
+
+    def since_start(t: float) -> float:
+        return round((t - started - stand_ins) * 1000, 1)
+
+    sys.stdout.write(json.dumps({
+        "import_ms": round((imported - started) * 1000, 1),
+        "live_ms": since_start(live),
+        "ready_ms": since_start(ready),
+        "warm_ms": since_start(warm),
+        "stand_ins_ms": round(stand_ins * 1000, 1)
+    }) + "\n")
+
+
+def run_startup(runs: int) -> Dict:
+    """
+    Cold start times over runs fresh processes: importing graphRAGTesting,
+    until /health/live answers, until /health/ready answers and until the
+    warm-up has also built the rerank chain
+    """
+    env = {**os.environ, "GRAPHRAG_EAGER_INIT": "0"}
+    samples = []
+    for _ in range(runs):
+        child = subprocess.run(
+            [sys.executable, "-c", _STARTUP_PROBE], capture_output=True,
+            text=True, check=True, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    return {
+        "runs": runs,
+        **{f"{key[:-3]}_p50_ms": percentile([s[key] for s in samples], 50)
+           for key in samples[0]},
+        "samples": samples
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--photos", default="1000",
+                        help="corpus size, or a comma separated list of sizes")
+    parser.add_argument("--queries", type=int, default=100,
+                        help="searches per mode")
+    parser.add_argument("--modes", default="fast,rerank")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="photos per ingest micro-batch")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds slept per fake LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0,
+                        help="seconds slept per fake embedding call")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local-index", action="store_true",
+                        help="search with the in-process vector index")
+    parser.add_argument("--query-cache", action="store_true",
+                        help="keep the search result cache enabled")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="also send the queries as a burst from this many "
+                             "threads through the Flask app")
+    parser.add_argument("--search-batch", type=int, default=0, metavar="SIZE",
+                        help="also send the queries through the batch search "
+                             "API, this many per call")
+    parser.add_argument("--startup", type=int, default=0, metavar="RUNS",
+                        help="measure cold start over this many fresh "
+                             "processes instead of ingest and search")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.photos.split(",")]
+    if args.startup:
+        runs = [run_startup(args.startup)]
+    elif len(sizes) > 1:
+        # One process per size so peak RSS is measured per corpus
+        runs = []
+        for size in sizes:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__),
+                 *[a for a in (argv if argv is not None else sys.argv[1:])
+                   if not a.startswith("--output") and a != args.output],
+                 "--photos", str(size)],
+                capture_output=True, text=True, check=True)
+            runs.extend(json.loads(child.stdout)["runs"])
+    else:
+        os.environ["GRAPHRAG_LOCAL_INDEX"] = "1" if args.local_index else "0"
+        if not args.query_cache:
+            os.environ["GRAPHRAG_QUERY_CACHE_SIZE"] = "0"
+        # PhotoGraphRAG logs with print; keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            runs = [run_benchmark(
+                sizes[0], queries=args.queries, modes=args.modes.split(","),
+                batch_size=args.batch_size, llm_latency=args.llm_latency,
+                embedding_latency=args.embedding_latency,
+                dimension=args.dimension, seed=args.seed,
+                concurrency=args.concurrency, search_batch=args.search_batch)]
+
+    report = {
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("photos", "output")},
+        "runs": runs
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+In-memory entity graph index used to expand retrieval through the extracted
+entities without multi-hop Cypher.
+
+Two sparse structures are derived from the ingested graph documents:
+- the photo-entity incidence (which photos MENTION which entities), stored
+  in CSR form in both directions;
+- the entity co-occurrence index: for every entity its strongest
+  neighbours, weighted by how often the two are mentioned by the same photo
+  (cosine of their photo sets) plus a bonus when the extraction related them
+  directly.
+
+A query is matched against entity names, and photos are scored by the
+entities they mention (one hop) and by the co-occurring neighbours of those
+entities (two hops). Mentions and relationship pairs are read back from
+each graph version when it is opened (replace_all) and kept up to date by the
+upsert and delete endpoints (add, remove). Only the per-photo entity sets are
+edited in place; the CSR arrays, neighbour lists and name vocabulary are
+derived from them in one pass the next time a query needs them.
+"""
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at by for from in into is of on or the to with".split())
+
+
+def _tokens(text: str) -> List[str]:
+    """
+    Lowercased words without stopwords, with a plain plural "s" removed
+    """
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+            for t in _TOKEN.findall(text.lower())
+            if len(t) > 1 and t not in _STOPWORDS]
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n_rows: int,
+         data: Optional[np.ndarray] = None):
+    """
+    (indptr, indices, data) of a sparse matrix given in coordinate form
+    """
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return (indptr, cols[order].astype(np.int32),
+            None if data is None else data[order].astype(np.float32))
+
+
+def _gather(indptr: np.ndarray, indices: np.ndarray,
+            rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenated indices of the given CSR rows, with the position in rows
+    each one came from
+    """
+    starts, ends = indptr[rows], indptr[rows + 1]
+    counts = ends - starts
+    if not counts.sum():
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    origin = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets, origin
+
+
+class _Snapshot:
+    """
+    Incidence, neighbour and vocabulary arrays from one build; a search
+    resolves its entity ids and photo ids against the same set
+    """
+
+    def __init__(self, filenames: List[str], entities: List[str],
+                 photo_entities, entity_photos, neighbours,
+                 vocabulary: Dict[str, int], token_entities, token_idf: np.ndarray,
+                 name_lengths: np.ndarray):
+        self.filenames = filenames
+        self.entities = entities
+        self.entity_ids = {entity: i for i, entity in enumerate(entities)}
+        self.photo_ids = {filename: i for i, filename in enumerate(filenames)}
+        self.photo_entities = photo_entities
+        self.entity_photos = entity_photos
+        self.neighbours = neighbours
+        self.vocabulary = vocabulary
+        self.token_entities = token_entities
+        self.token_idf = token_idf
+        self.name_lengths = name_lengths
+
+
+class EntityGraphIndex:
+    """
+    Photo-entity incidence and entity co-occurrence in sparse arrays, with
+    one- and two-hop photo scoring
+    """
+
+    def __init__(self, max_neighbours: int = 16, hop_decay: float = 0.5,
+                 relation_weight: float = 0.5):
+        self.max_neighbours = max_neighbours
+        self.hop_decay = hop_decay
+        self.relation_weight = relation_weight
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._photo_entities: Dict[str, Set[str]] = {}
+        # Entity pair -> photos whose extraction related them; pairs loaded
+        # without provenance have none and go with their entities' mentions
+        self._relations: Dict[Tuple[str, str], Set[str]] = {}
+        self._dirty = False
+        self._snapshot = self._build()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._photo_entities)
+
+    # Entity sets per photo
+
+    def add(self, graph_documents: Sequence) -> int:
+        """
+        Index the entities and relationships of graph documents; a photo
+        already in the index has its entities replaced
+        """
+        graph_documents = [g for g in graph_documents
+                           if g.source.metadata.get("filename") is not None]
+        with self._lock:
+            for graph_document in graph_documents:
+                filename = graph_document.source.metadata["filename"]
+                self._photo_entities[filename] = {n.id for n in graph_document.nodes}
+            # A photo already in the index loses the relations of its
+            # previous extraction
+            self._drop_relations(
+                g.source.metadata["filename"] for g in graph_documents)
+            for graph_document in graph_documents:
+                filename = graph_document.source.metadata["filename"]
+                for rel in graph_document.relationships:
+                    if rel.source.id != rel.target.id:
+                        pair = tuple(sorted((rel.source.id, rel.target.id)))
+                        self._relations.setdefault(pair, set()).add(filename)
+            self._dirty = True
+        return len(graph_documents)
+
+    def remove(self, filenames: Iterable[str]):
+        filenames = set(filenames)
+        with self._lock:
+            for filename in filenames:
+                self._photo_entities.pop(filename, None)
+            self._drop_relations(filenames)
+            self._dirty = True
+
+    def _drop_relations(self, filenames: Iterable[str]):
+        """
+        Take the photos off the relations they contributed, deleting those
+        no other photo contributed, as the graph does. Relations loaded
+        without provenance go once one of their entities is no longer
+        mentioned. Call with _lock held.
+        """
+        filenames = set(filenames)
+        mentioned = None
+        for pair, sources in list(self._relations.items()):
+            if sources & filenames:
+                sources -= filenames
+                if not sources:
+                    del self._relations[pair]
+            elif not sources:
+                if mentioned is None:
+                    mentioned = {e for names in self._photo_entities.values()
+                                 for e in names}
+                if pair[0] not in mentioned or pair[1] not in mentioned:
+                    del self._relations[pair]
+
+    def replace_all(self, mentions: Iterable[Tuple[str, str]],
+                    relations: Iterable[Sequence]):
+        """
+        Load the index from (filename, entity) mentions and entity
+        relationship (source, target, sources) rows, e.g. read back from
+        Neo4j; sources lists the photos that produced the relationship and
+        may be left out
+        """
+        photo_entities: Dict[str, Set[str]] = defaultdict(set)
+        for filename, entity in mentions:
+            photo_entities[filename].add(entity)
+        pairs: Dict[Tuple[str, str], Set[str]] = {}
+        for source, target, *sources in relations:
+            if source != target:
+                pairs.setdefault(tuple(sorted((source, target))), set()).update(
+                    (sources[0] or ()) if sources else ())
+        with self._lock:
+            self._photo_entities = dict(photo_entities)
+            self._relations = pairs
+            self._dirty = True
+
+    def clear(self):
+        self.replace_all([], [])
+
+    # Building the arrays
+
+    def refresh(self):
+        """
+        Rebuild the arrays now rather than on the next query
+        """
+        self._current()
+
+    def _current(self) -> _Snapshot:
+        """
+        The latest snapshot, rebuilt first if the index changed. Only one
+        thread rebuilds; the others keep reading the previous snapshot.
+        """
+        if self._dirty and self._rebuild_lock.acquire(blocking=False):
+            try:
+                with self._lock:
+                    dirty, self._dirty = self._dirty, False
+                    photo_entities = {f: list(e) for f, e in self._photo_entities.items()}
+                    relations = list(self._relations)
+                if dirty:
+                    self._snapshot = self._build(photo_entities, relations)
+            finally:
+                self._rebuild_lock.release()
+        return self._snapshot
+
+    def _build(self, photo_entities: Optional[Dict[str, List[str]]] = None,
+               relations: Sequence[Tuple[str, str]] = ()) -> _Snapshot:
+        photo_entities = photo_entities or {}
+        filenames = list(photo_entities)
+        entities = sorted({e for names in photo_entities.values() for e in names})
+        entity_ids = {entity: i for i, entity in enumerate(entities)}
+        n_photos, n_entities = len(filenames), len(entities)
+
+        # Incidence, photo -> entities and entity -> photos
+        rows = np.fromiter(
+            (p for p, f in enumerate(filenames) for _ in photo_entities[f]),
+            dtype=np.int64)
+        cols = np.fromiter(
+            (entity_ids[e] for f in filenames for e in photo_entities[f]),
+            dtype=np.int64)
+        photo_entities_csr = _csr(rows, cols, n_photos)
+        entity_photos = _csr(cols, rows, n_entities)
+        frequency = np.diff(entity_photos[0]).astype(np.float32)
+
+        # Co-occurrence counts from every pair of entities sharing a photo
+        n = max(n_entities, 1)
+        positions, origin = _gather(photo_entities_csr[0], photo_entities_csr[1],
+                                    rows)
+        left, right = cols[origin], photo_entities_csr[1][positions]
+        keep = left < right
+        keys, counts = np.unique(left[keep] * n + right[keep], return_counts=True)
+        weights = counts / np.sqrt(frequency[keys // n] * frequency[keys % n])
+
+        # Extracted relationships between indexed entities add a bonus
+        related = np.array(sorted({
+            min(entity_ids[a], entity_ids[b]) * n + max(entity_ids[a], entity_ids[b])
+            for a, b in relations if a in entity_ids and b in entity_ids
+        }), dtype=np.int64)
+        if len(related) and self.relation_weight:
+            keys, inverse = np.unique(np.concatenate([keys, related]),
+                                      return_inverse=True)
+            weights = np.bincount(inverse, weights=np.concatenate([
+                weights, np.full(len(related), self.relation_weight)]))
+        first, second = keys // n, keys % n
+
+        # Both directions, then only the strongest neighbours of each entity
+        source = np.concatenate([first, second])
+        target = np.concatenate([second, first])
+        weight = np.concatenate([weights, weights]).astype(np.float32)
+        order = np.lexsort((-weight, source))
+        source, target, weight = source[order], target[order], weight[order]
+        group_start = np.searchsorted(source, source)
+        keep = (np.arange(len(source)) - group_start) < self.max_neighbours
+        neighbours = _csr(source[keep], target[keep], n_entities, weight[keep])
+
+        # Entity name tokens, for matching queries
+        vocabulary: Dict[str, int] = {}
+        token_rows, token_cols = [], []
+        for i, entity in enumerate(entities):
+            for token in set(_tokens(entity)):
+                token_rows.append(vocabulary.setdefault(token, len(vocabulary)))
+                token_cols.append(i)
+        token_entities = _csr(np.asarray(token_rows, dtype=np.int64),
+                              np.asarray(token_cols, dtype=np.int64),
+                              len(vocabulary))
+        token_idf = np.log1p(n_entities / np.maximum(
+            np.diff(token_entities[0]), 1)).astype(np.float32)
+        name_lengths = np.array([max(len(_tokens(e)), 1) for e in entities],
+                                dtype=np.float32)
+
+        return _Snapshot(filenames, entities, photo_entities_csr, entity_photos,
+                         neighbours, vocabulary, token_entities, token_idf,
+                         name_lengths)
+
+    # Queries
+
+    def _match(self, snapshot: _Snapshot, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Entities whose names share tokens with the query, weighted by the
+        idf of the shared tokens over the length of the name
+        """
+        tokens = np.array(sorted({snapshot.vocabulary[t] for t in _tokens(query)
+                                  if t in snapshot.vocabulary}), dtype=np.int64)
+        if not len(tokens):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indptr, indices, _ = snapshot.token_entities
+        positions, origin = _gather(indptr, indices, tokens)
+        matched = indices[positions]
+        scores = np.bincount(matched, weights=snapshot.token_idf[tokens][origin],
+                             minlength=len(snapshot.entities))
+        entities = np.flatnonzero(scores)
+        return entities, (scores[entities]
+                          / snapshot.name_lengths[entities]).astype(np.float32)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Best-first {"filename", "score", "entities"} for photos reached from
+        the query's entities in one hop (mentioned) or two (mentioning a
+        co-occurring entity); entities lists the matched ones they mention
+        """
+        snapshot = self._current()
+        entities, weights = self._match(snapshot, query)
+        if not len(entities):
+            return []
+        n_photos = len(snapshot.filenames)
+
+        # Hop 1: photos mentioning a matched entity
+        indptr, indices, _ = snapshot.entity_photos
+        positions, origin = _gather(indptr, indices, entities)
+        scores = np.bincount(indices[positions], weights=weights[origin],
+                             minlength=n_photos)
+
+        # Hop 2: photos mentioning a neighbour of a matched entity
+        if self.hop_decay:
+            n_indptr, n_indices, n_data = snapshot.neighbours
+            positions, origin = _gather(n_indptr, n_indices, entities)
+            related = n_indices[positions]
+            related_weights = weights[origin] * n_data[positions] * self.hop_decay
+            positions, origin = _gather(indptr, indices, related)
+            scores += np.bincount(indices[positions],
+                                  weights=related_weights[origin],
+                                  minlength=n_photos)
+
+        limit = min(limit, int(np.count_nonzero(scores)))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        matched = set(entities.tolist())
+        p_indptr, p_indices, _ = snapshot.photo_entities
+        return [
+            {
+                "filename": snapshot.filenames[p],
+                "score": float(scores[p]),
+                "entities": [snapshot.entities[e]
+                             for e in p_indices[p_indptr[p]:p_indptr[p + 1]]
+                             if e in matched]
+            }
+            for p in top
+        ]
+
+    def shared_entities(self, filenames: Iterable[str]) -> Dict[str, int]:
+        """
+        For every other photo, how many entities it shares with the given
+        photos (what GRAPH_NEIGHBOURS_QUERY computes in Cypher)
+        """
+        snapshot = self._current()
+        seeds = np.array([snapshot.photo_ids[f] for f in set(filenames)
+                          if f in snapshot.photo_ids], dtype=np.int64)
+        if not len(seeds):
+            return {}
+        p_indptr, p_indices, _ = snapshot.photo_entities
+        positions, origin = _gather(p_indptr, p_indices, seeds)
+        seed_entities = p_indices[positions]
+
+        indptr, indices, _ = snapshot.entity_photos
+        shared: Dict[str, int] = {}
+        positions, _ = _gather(indptr, indices, np.unique(seed_entities))
+        counts = np.bincount(indices[positions], minlength=len(snapshot.filenames))
+        seed_set = set(seeds.tolist())
+        for p in np.flatnonzero(counts):
+            if p not in seed_set:
+                shared[snapshot.filenames[p]] = int(counts[p])
+
+        # A seed counts only the entities it shares with the other seeds
+        for i, seed in enumerate(seeds):
+            others = np.unique(seed_entities[origin != i])
+            own = seed_entities[origin == i]
+            count = int(np.isin(own, others).sum())
+            if count:
+                shared[snapshot.filenames[seed]] = count
+        return shared
+
+    def stats(self) -> Dict:
+        snapshot = self._current()
+        return {
+            "photos": len(snapshot.filenames),
+            "entities": len(snapshot.entities),
+            "mentions": int(len(snapshot.photo_entities[1])),
+            "neighbour_links": int(len(snapshot.neighbours[1])),
+            "bytes": int(sum(
+                array.nbytes
+                for arrays in (snapshot.photo_entities, snapshot.entity_photos,
+                               snapshot.neighbours, snapshot.token_entities)
+                for array in arrays if array is not None))
+        }
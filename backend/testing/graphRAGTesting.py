@@ -1,184 +1,1437 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
 from dotenv import load_dotenv
 import time
-from typing import Dict, List
-from langchain_community.graphs import Neo4jGraph
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import Neo4jVector
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
-from langchain.docstore.document import Document
+import hashlib
+import importlib.metadata
+import functools
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+from graph_extraction import extract_graph_documents
+from graph_writer import BASE_ENTITY_LABEL, BulkGraphWriter
+from graph_versions import (CHUNK_LABEL, DOCUMENT_LABEL, KEYWORD_INDEX, VECTOR_INDEX,
+                            GraphValidationError, GraphVersion, versioned,
+                            versions_in)
+from query_cache import QueryResultCache
+from local_vector_index import LocalVectorIndex
+from entity_index import EntityGraphIndex
+from metrics import MetricsRegistry
+from serving import AdmissionController, NotReady, Overloaded, ReadWriteLock
+from ranking import (apply_neighbour_boost, filenames_from_rows, parse_rerank_output,
+                     ranked, reciprocal_rank_fusion)
+
+# langchain, the OpenAI client and the Neo4j driver take over a second to
+# import, so they are imported where first used (mostly by the background
+# warm-up) and the server can answer /health right away
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+    from langchain_community.vectorstores import Neo4jVector
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# Graph extraction schema. Changing any of these invalidates cached
+# extractions (see graph_schema_signature)
+ALLOWED_NODES = [
+    "Scene",           # Overall scene type
+    "Landscape",       # Natural landscapes
+    "Building",        # Built structures
+    "Person",          # People
+    "Activity",        # Activities
+    "NaturalFeature",  # Natural elements
+    "TimeContext",     # Temporal aspects
+    "Atmosphere",      # Mood/ambiance
+    "Object",         # Physical objects
+    "Weather",        # Weather conditions
+    "Location"        # Specific locations
+]
+
+ALLOWED_RELATIONSHIPS = [
+    "CONTAINS",           # Basic containment
+    "HAS_FEATURE",        # Scene features
+    "LOCATED_IN",         # Spatial location
+    "NEXT_TO",           # Adjacent relationships
+    "PART_OF",           # Component relationships
+    "INTERACTS_WITH",    # General interactions
+    "CREATES",           # Causal relationships
+    "INFLUENCES",        # Impact relationships
+    "USED_IN",          # Object usage
+    "EXPERIENCES"        # Experiential relationships
+]
+
+NODE_PROPERTIES = [
+    "type",
+    "description",
+    "color",
+    "atmosphere",
+    "time_of_day",
+    "weather",
+    "activity_level",
+    "importance"         # Added to help prioritize key elements
+]
+
+RELATIONSHIP_PROPERTIES = [
+    "description",
+    "spatial",
+    "temporal",
+    "impact",
+    "strength"          # Added to indicate relationship strength
+]
+
+# Cypher used by the incremental upsert path
+EXISTING_PHOTOS_QUERY = """
+    MATCH (d:Document)
+    WHERE d.filename IS NOT NULL
+    RETURN d.filename AS filename, d.content_hash AS content_hash
+"""
+
+EXISTING_PHOTOS_BY_NAME_QUERY = """
+    MATCH (d:Document)
+    WHERE d.filename IN $filenames
+    RETURN d.filename AS filename, d.content_hash AS content_hash
+"""
+
+# Removes the given photos' Document nodes together with every entity that no
+# other (surviving) photo still mentions
+REMOVE_PHOTO_SUBGRAPHS_QUERY = """
+    MATCH (d:Document)
+    WHERE d.filename IN $filenames
+    OPTIONAL MATCH (d)-[:MENTIONS]->(e)
+    WHERE NOT EXISTS {
+        MATCH (e)<-[:MENTIONS]-(other:Document)
+        WHERE NOT other.filename IN $filenames
+    }
+    WITH collect(DISTINCT d) AS docs, collect(DISTINCT e) AS orphans
+    FOREACH (n IN orphans | DETACH DELETE n)
+    FOREACH (n IN docs | DETACH DELETE n)
+"""
+
+# Takes the given photos off the provenance of the entity relationships their
+# extraction produced and deletes the relationships no other photo produced.
+# Runs before REMOVE_PHOTO_SUBGRAPHS_QUERY, while the MENTIONS links exist
+REMOVE_PHOTO_RELATIONSHIPS_QUERY = """
+    MATCH (d:Document)-[:MENTIONS]->(:__Entity__)-[r]->(:__Entity__)
+    WHERE d.filename IN $filenames AND r.sources IS NOT NULL
+    WITH DISTINCT r
+    SET r.sources = [f IN r.sources WHERE NOT f IN $filenames]
+    WITH r
+    WHERE size(r.sources) = 0
+    DELETE r
+"""
+
+# photo_keywords (versioned like the labels) indexes the Chunk text, which
+# carries the filename itself; entity hits are mapped back to their photo
+# through MENTIONS
+GRAPH_SEARCH_QUERY = """
+    CALL db.index.fulltext.queryNodes($keyword_index, $query) YIELD node, score
+    OPTIONAL MATCH (node)<-[:MENTIONS|IN_PHOTO]-(photo:Document)
+    WITH coalesce(photo.filename, node.filename) AS filename,
+         coalesce(photo.text, node.text) AS description, score
+    WHERE filename IS NOT NULL
+    RETURN filename, description, max(score) AS score
+    ORDER BY score DESC
+    LIMIT $limit
+"""
+
+# Batch searches: every query of the batch in one round-trip, each row
+# tagged with the position of its query
+BATCH_GRAPH_SEARCH_QUERY = """
+    UNWIND $queries AS q
+    CALL {
+        WITH q
+        CALL db.index.fulltext.queryNodes($keyword_index, q.query) YIELD node, score
+        OPTIONAL MATCH (node)<-[:MENTIONS|IN_PHOTO]-(photo:Document)
+        WITH coalesce(photo.filename, node.filename) AS filename,
+             coalesce(photo.text, node.text) AS description, score
+        WHERE filename IS NOT NULL
+        RETURN filename, description, max(score) AS score
+        ORDER BY score DESC
+        LIMIT $limit
+    }
+    RETURN q.index AS query_index, filename, description, score
+"""
+
+# The hybrid search Neo4jVector runs for single searches (vector UNION
+# fulltext, each normalised by its best score), for a batch of queries.
+# Queries left empty by Lucene escaping only get the vector branch
+BATCH_VECTOR_SEARCH_QUERY = """
+    UNWIND $queries AS q
+    CALL {
+        WITH q
+        CALL {
+            WITH q
+            CALL db.index.vector.queryNodes($vector_index, $k, q.embedding)
+            YIELD node, score
+            WITH collect({node: node, score: score}) AS nodes, max(score) AS max
+            UNWIND nodes AS n
+            RETURN n.node AS node, n.score / max AS score
+            UNION
+            WITH q
+            WITH q WHERE q.query <> ''
+            CALL db.index.fulltext.queryNodes($keyword_index, q.query, {limit: $k})
+            YIELD node, score
+            WITH collect({node: node, score: score}) AS nodes, max(score) AS max
+            UNWIND nodes AS n
+            RETURN n.node AS node, n.score / max AS score
+        }
+        WITH node, max(score) AS score
+        ORDER BY score DESC
+        LIMIT $k
+        RETURN node.filename AS filename, node.text AS text, score
+    }
+    RETURN q.index AS query_index, filename, text, score
+    ORDER BY query_index, score DESC
+"""
+
+# Photos sharing extracted entities with the given photos
+GRAPH_NEIGHBOURS_QUERY = """
+    MATCH (d:Document)-[:MENTIONS]->(e)<-[:MENTIONS]-(other:Document)
+    WHERE d.filename IN $filenames AND other <> d
+    RETURN other.filename AS filename, count(DISTINCT e) AS shared
+"""
+
+CHUNK_COUNT_QUERY = """
+    MATCH (c:Chunk)
+    WHERE c.embedding IS NOT NULL
+    RETURN count(c) AS count
+"""
+
+LOCAL_INDEX_SYNC_QUERY = """
+    MATCH (c:Chunk)
+    WHERE c.embedding IS NOT NULL
+    RETURN c.filename AS filename, c.text AS text, c.embedding AS embedding
+"""
+
+REMOVE_PHOTO_VECTORS_QUERY = """
+    MATCH (c:Chunk)
+    WHERE c.filename IN $filenames
+    DETACH DELETE c
+"""
+
+# Read back into the in-memory entity index when a version is opened
+ENTITY_MENTIONS_QUERY = """
+    MATCH (d:Document)-[:MENTIONS]->(e:__Entity__)
+    WHERE d.filename IS NOT NULL
+    RETURN d.filename AS filename, e.id AS entity
+"""
+
+ENTITY_RELATIONS_QUERY = """
+    MATCH (a:__Entity__)-[r]->(b:__Entity__)
+    RETURN a.id AS source, b.id AS target, r.sources AS sources
+"""
+
+# Blue/green rebuilds (see graph_versions). The live version is recorded in
+# the graph so a restarted server keeps serving the same one
+LIVE_VERSION_QUERY = """
+    MATCH (s:GraphRAGState {id: 'live'})
+    RETURN s.version AS version
+"""
+
+SET_LIVE_VERSION_QUERY = """
+    MERGE (s:GraphRAGState {id: 'live'})
+    SET s.version = $version, s.switched_at = datetime()
+"""
+
+CLEAR_LIVE_VERSION_QUERY = """
+    MATCH (s:GraphRAGState)
+    DELETE s
+"""
+
+# Each version gets a record when its build starts, stamped when it is
+# retired, so that a replica can tell a build still running elsewhere, or a
+# version other replicas may still be serving, from one left behind
+RECORD_VERSION_QUERY = """
+    MERGE (s:GraphRAGState {id: 'version', version: $version})
+    SET s.created_at = timestamp(), s.retired_at = null
+"""
+
+RETIRE_VERSION_QUERY = """
+    MATCH (s:GraphRAGState {id: 'version', version: $version})
+    SET s.retired_at = timestamp()
+"""
+
+VERSION_RECORDS_QUERY = """
+    MATCH (s:GraphRAGState {id: 'version'})
+    RETURN s.version AS version, timestamp() - s.created_at AS age_ms,
+           timestamp() - s.retired_at AS retired_ms
+"""
+
+FORGET_VERSION_QUERY = """
+    MATCH (s:GraphRAGState {id: 'version', version: $version})
+    DELETE s
+"""
+
+GRAPH_LABELS_QUERY = """
+    CALL db.labels() YIELD label
+    RETURN label AS name
+"""
+
+GRAPH_INDEXES_QUERY = """
+    SHOW INDEXES YIELD name
+    RETURN name
+"""
+
+INDEX_STATES_QUERY = """
+    SHOW INDEXES YIELD name, state
+    WHERE name IN $names
+    RETURN name, state
+"""
+
+AWAIT_INDEXES_QUERY = "CALL db.awaitIndexes($timeout)"
+
+# Run against one version's labels; deletes in batches so dropping a large
+# version never needs one huge transaction
+DELETE_VERSION_QUERY = """
+    MATCH (n)
+    WHERE n:Document OR n:Chunk OR n:__Entity__
+    CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+
+SEARCH_MODES = ("rerank", "fast")
+
+# Sample library used by test_graphrag and as the seed of the benchmark corpora
+SAMPLE_PHOTO_DESCRIPTIONS = {
+    "supercar.jpg": "The image showcases a striking green sports car, prominently displayed with its unique butterfly doors wide open, creating a dramatic effect. The car features a sleek and aerodynamic design, characterized by sharp lines and an aggressive front end. It is parked on a winding road, surrounded by a scenic landscape of lush greenery and rocky formations, suggesting a mountainous or coastal setting. The sunlight bathes the scene, enhancing the car's glossy finish and highlighting its features. The combination of the car's modern design and the natural surroundings creates a visually appealing contrast. The scene captures a sense of luxury and performance, inviting admiration for both the vehicle and its picturesque environment. Notable details include the intricate wheel design and the sophisticated interior visible through the open door, emphasizing the car's high",
+    "chicken_fight.jpg": "The image captures a dynamic scene of two fighting roosters engaged in a fierce bout. Each bird is in mid-air, showcasing their powerful wings and muscular bodies. The rooster on the left has dark plumage with a glossy sheen, while the rooster on the right displays vibrant orange and brown feathers, emphasizing their contrasting appearances. The setting appears to be a dirt arena, likely outdoor, with a slightly blurred, indistinct background suggesting trees or foliage. Dust can be seen rising from the ground, adding to the intensity of the action. The focus on the birds highlights their aggressive postures, with each bird aiming to outmaneuver the other. Their spurs are prominently visible, indicating the competitive nature of this scene. Overall, the image conveys",
+    "stone_ape.jpg": "The image features a surreal, cosmic scene centered around the profile of a large, expressive chimpanzee. It holds a mushroom in one hand, cleverly suggesting themes of growth, evolution, and consciousness. The chimp's gaze is directed towards a swirl of abstract shapes and symbols that cascade from its head, hinting at thoughts and ideas. Surrounding the chimp are various elements that depict the evolution of humanity and knowledge. We see iconic representations of human figures in various stages of development, alongside mathematical equations, musical notes, and references to science and space exploration, illustrating the journey from primitive to advanced thought. In the background, geometric and ageless symbols create a mystical backdrop, while the horizon features pyramids and a stylized cityscape, implying a",
+    "city-lights.jpeg": "The image captures a breathtaking view of a sprawling cityscape at twilight, showcasing Hong Kong's iconic skyline. Towering skyscrapers dominate the foreground, their windows aglow with warm lights, creating a vibrant urban atmosphere. The city is nestled against the backdrop of lush green hills, contrasting the natural landscape with the densely packed buildings. In the distance, the shimmering waters of Victoria Harbour reflect the colorful lights of the city, enhancing the scene's beauty. Notable structures such as the International Commerce Centre and the HSBC Building can be seen, further emphasizing Hong Kong's status as a financial hub. The sky transitions from soft pinks and purples to deeper blues as night approaches, adding to the overall tranquility of the moment. The entire composition conveys a sense of",
+    "beach_sunset.jpg": "The image captures a serene beach scene during sunset. The foreground features soft, sandy textures with gentle undulations, suggesting a relaxed atmosphere. The shoreline curves gracefully where the light golden sand meets the calm ocean water. The backdrop showcases a vibrant sky filled with a palette of warm hues—soft oranges, pinks, and yellows blending seamlessly with cool blues. Wispy clouds scatter across the sky, illuminated by the fading sunlight, creating a dramatic yet peaceful ambiance. As the sun dips toward the horizon, a shimmering reflection dances on the water's surface, adding a touch of sparkles to the serene scene. Small waves gently lap against the shore, enhancing the tranquility, while the overall composition evokes a sense of calm and natural beauty, making it a perfect",
+    "curved_road.jpg": "The image depicts a winding road on a hillside, characterized by its smooth, newly paved asphalt. In the foreground, there's a gravel shoulder where the ground transitions from pavement to dirt, with small rocky patches and sparse vegetation. To the left, a metal guardrail provides safety along the curve of the road, with yellow and black hazard markings indicating a sharp turn ahead. A vehicle, likely an SUV, is seen navigating the bend, moving into the distance. The landscape features dry, golden grass and a rocky hillside, suggesting a warm climate. In the background, rolling hills are visible, fading into a clearer sky. The overall atmosphere conveys a sense of rural tranquility, with open space and scenic views typical of a mountainous or hilly region.",
+    "gentlemen.jpeg": "The image features four men standing confidently next to a silver minivan parked in a residential area during the evening. They are dressed in formal attire, with suits and sunglasses, giving a stylish and sophisticated impression. The man on the left wears a blue suit with a patterned tie, exuding a confident demeanor. Next to him, a man in a gray plaid suit stands with his hands clasped, showcasing a more reserved posture. The third individual is dressed in a black suit with a white shirt and a dark tie, while the fourth man, on the far right, sports a black suit with a striped tie and has a subtle badge on his lapel. In the background, the setting includes a well-maintained house with a garage door, and",
+    "family-dinner.jpg": "The image features a lively group of five people gathered around a wooden dining table, sharing a meal. The setting is bright and inviting, with natural light streaming through large windows, revealing a modern, airy interior. At the center of the table is a large platter of spaghetti, complemented by pieces of bread on a cutting board. Each person has a plate with pasta, and there are glasses of water in front of them. The group consists of three women and two men, all displaying cheerful expressions and engaged in animated conversation. One woman, wearing a pink top, is gesturing with her hand as she speaks, adding warmth to the interaction. The others, dressed in casual attire, seem equally involved, with smiles and laughter contributing to a joyful atmosphere",
+    "coffee-shop.jpeg": "The image depicts a lively café atmosphere with a modern and inviting design. The interior features large windows that allow natural light to flood the space, highlighting the stylish furnishings and décor. On the left side, several patrons are seated at wooden tables, absorbed in work or conversation. A woman in a red sweater appears to be using her laptop, while another individual leans back, seemingly deep in thought. To the right, a barista is working behind the counter, preparing beverages, with an additional staff member assisting. The counter is neatly arranged with coffee-making equipment and colorful dishware, emphasizing the café's focus on quality service. The décor includes minimalist shelving adorned with various items, including decorative vases and potentially local art, contributing to the café's",
+    "mountain-hike.jpeg": "The image depicts a scenic mountain hiking trail with a hiker as the main subject. The hiker, carrying a large backpack, is seen walking along a narrow dirt path that winds through lush greenery and flowering shrubbery. This path is bordered by tall coniferous trees on either side, adding to the natural beauty of the setting. In the background, majestic snow-capped mountains rise dramatically, their peaks piercing the blue sky, which is scattered with a few wispy clouds. The vibrant colors of the surrounding foliage juxtapose beautifully with the rugged mountain terrain and clear, bright sky. The hiker appears focused on the trail ahead, using trekking poles to aid their ascent. This image captures a moment of solitude and adventure in a breathtaking outdoor environment,",
+    "puppies.jpg": "The image features a delightful scene of eight adorable puppies nestled in a wicker basket. The puppies vary in color, with some having predominantly white fur and others showcasing shades of gray and black. Their expressions are curious and playful, capturing the innocence and charm typical of young dogs. The setting is a lush, green outdoor space with soft grass beneath the basket, suggesting a warm and inviting day. In the background, hints of foliage, possibly bushes or small trees, add depth to the scene, creating a vibrant, natural ambiance. Notable details include the various positions of the puppies—some are sitting upright, others are leaning against each other, displaying their playful nature. The basket itself is light brown with a natural weave pattern, contributing to the overall cozy and",
+    "kittens.jpg": "The image features a group of six adorable kittens, gathered closely together on a colorful patchwork quilt. The kittens predominantly display a mix of black and white fur, with some having distinctive black markings on their faces and bodies. Their large, expressive eyes—ranging from green to blue—create a sense of curiosity and playfulness. The setting is cozy and inviting, with the vibrant quilt showcasing various patterns and colors, adding to the cheerful atmosphere. The kittens appear to be in a playful mood, with their ears perked up and whiskers twitching, as if they are eager to explore their surroundings or engage in playful antics with each other. The composition captures their youthful energy perfectly, making it an endearing and heartwarming scene.",
+    "chickfila.jpg": "The image depicts a Chick-fil-A restaurant, showcasing its distinctive exterior design. The building features a combination of brick and bright red panels, with the Chick-fil-A logo prominently displayed on the roof. Large windows line the front, allowing a view of the menu and interior. In the foreground, there is a paved parking area, which is clean and well-maintained. The landscaping includes some low shrubs, contributing to an inviting atmosphere. A drive-thru sign is visible, indicating the restaurant's services, while additional signage promotes menu items and specials. The clear blue sky above suggests a sunny day, enhancing the vibrant appearance of the establishment. Overall, the setting conveys a sense of accessibility and modernity, typical of fast-casual dining experiences.",
+    "the_amish.jpg": "The image features a group of five individuals posed outdoors in a scenic setting with greenery in the background. They appear to be dressed in attire reminiscent of traditional or perhaps Amish style clothing. On the left, a woman in a long, teal dress with a white apron and a cap smiles at the camera. Next to her stands a young boy wearing a gray shirt and black vest, with his hands in his pockets, giving a relaxed stance. Beside him, a teenage boy wears a blue shirt and a black vest, also with his hands in his pockets, suggesting a casual vibe. In the center, another young boy is dressed in a green shirt with a black vest and shorts, embodying a playful appearance. To the right stands another woman dressed",
+    "eiffel_tower.jpg": "The image showcases the iconic Eiffel Tower rising majestically against a vibrant sunset sky, characterized by a palette of oranges, pinks, and blues. Below the tower, you can see a tranquil water feature reflecting the stunning colors of the sky. The area features lush green lawns with neatly trimmed hedges and a variety of trees, their leaves glowing with the warm hues of dusk. In the foreground, a series of modern, curved structures and fountains create an elegant, artistic display. To the right, a carousel can be spotted, adding a playful touch to the scene. People are leisurely walking and enjoying the surroundings, contributing to the lively yet serene atmosphere of this famous Parisian landmark. The overall composition captures a beautiful blend of architecture, nature, and urban",
+    "gym_bro.jpg": "In the image, a muscular man is seated on a bench press within a gym setting, preparing for a lift. He is wearing a sleeveless workout shirt that showcases his well-defined arms and shoulders, paired with athletic shorts. His focused expression indicates he's concentrating on the task ahead. Behind him, a woman stands as a spotter, providing support and encouragement. She is dressed in a black zip-up jacket and fitted leggings, with a black mask covering her face. The gym environment is characterized by a spacious layout, equipped with various weightlifting equipment in the background, and has a moody, industrial aesthetic, highlighted by darker walls and subtle lighting. Notable details include the heavy weights on the barbell, indicating a challenging lift, and",
+    "desert.jpg": "The image captures a vast desert landscape characterized by rolling sand dunes with intricate ripples in the sand, showcasing patterns created by the wind. The dunes rise and fall in gentle waves, reflecting golden hues under sunlight against a bright blue sky dotted with wispy clouds.",
+    "tesla.jpg": "The image depicts a sleek silver Tesla car parked on a winding road through a picturesque landscape with rolling hills and mountains. The setting is illuminated by sunset's warm glow, with the car's shiny body reflecting sunlight, emphasizing its modern design and clean lines.",
+    "prius.jpg": "The image features a sleek, modern silver car, possibly a hybrid or electric model, navigating an open road. The vehicle is positioned dynamically, suggesting motion and speed, with a streamlined design that highlights its aerodynamic shape."
+}
+
+
+def graph_schema_signature(model_name: str) -> str:
+    """
+    Signature of everything that determines an extraction result besides the
+    description itself: model, schema and the transformer's prompt version
+    """
+    try:
+        transformer_version = importlib.metadata.version("langchain-experimental")
+    except importlib.metadata.PackageNotFoundError:
+        transformer_version = "unknown"
+    from llm_cache import content_key
+    return content_key(json.dumps({
+        "model": model_name,
+        "allowed_nodes": ALLOWED_NODES,
+        "allowed_relationships": ALLOWED_RELATIONSHIPS,
+        "node_properties": NODE_PROPERTIES,
+        "relationship_properties": RELATIONSHIP_PROPERTIES,
+        "strict_mode": True,
+        "transformer_version": transformer_version
+    }, sort_keys=True))
+
+
+def description_hash(description: str) -> str:
+    """
+    Content hash used to detect whether a photo description has changed
+    """
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def _serialized(method):
+    """
+    Run a PhotoGraphRAG method that changes the graph under the write lock,
+    so builds, upserts and stream ingests never interleave
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _exclusive(method):
+    """
+    Like _serialized, and additionally keeps searches out while it runs
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock, self._build_lock.write():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class PhotoGraphRAG:
     _instance = None
+    _instance_lock = threading.Lock()
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(PhotoGraphRAG, cls).__new__(cls)
-            cls._instance._initialized = False
+    def __new__(cls, *args, **kwargs):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(PhotoGraphRAG, cls).__new__(cls)
+                cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self):
+    def __init__(self, graph=None, llm=None, embeddings=None,
+                 vector_store_factory=None):
+        """
+        Neo4j, OpenAI and the Neo4j vector store are used unless other
+        backends are passed in (the offline benchmark uses in-memory ones).
+        Nothing is connected here: that happens on first use or in warm_up().
+        """
+        # Server threads may all construct the singleton at once
         if self._initialized:
             return
-
-        self.graph = Neo4jGraph()
-        self.llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
-        self.embeddings = OpenAIEmbeddings()
+        with self._instance_lock:
+            if self._initialized:
+                return
+            self._setup(graph, llm, embeddings, vector_store_factory)
+            self._initialized = True
+
+    def _setup(self, graph, llm, embeddings, vector_store_factory):
+        # Backends are created by _connect; these are the injected ones, if any
+        self._backends = {"graph": graph, "llm": llm, "embeddings": embeddings}
+        self.graph = None
+        self.llm = None
+        self.embeddings = None
+        self.query_embeddings = None
+        self.cache = None
+        self.live = None
+
+        # Readiness: _connect has succeeded. Failed attempts are retried with
+        # exponential backoff, by the warm-up thread or the next request
+        self.ready = False
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.ready_seconds = None
+        self.connect_attempts = 0
+        self.connect_error = None
+        self.connect_backoff = float(os.getenv("GRAPHRAG_CONNECT_BACKOFF", 1))
+        self.connect_backoff_max = float(
+            os.getenv("GRAPHRAG_CONNECT_BACKOFF_MAX", 30))
+        self._connect_lock = threading.Lock()
+        self._next_attempt = 0.0
+        self._warm_up_thread = None
+
+        # Stage latency histograms and counters served on /metrics
+        self.metrics = MetricsRegistry()
+        self.metrics.describe("graphrag_stage_seconds",
+                              "Latency of each search and ingest stage")
+        self.metrics.describe("graphrag_llm_tokens_total",
+                              "Tokens used by rerank LLM calls")
+        self.metrics.describe("graphrag_remote_calls_total",
+                              "Calls made to remote LLM and embedding APIs")
+        self.metrics.describe("graphrag_degraded_legs_total",
+                              "Retrieval legs that failed or timed out")
+        self.metrics.describe("graphrag_extraction_failures_total",
+                              "Photos whose graph extraction failed")
+        self.metrics.describe("graphrag_db_statements_total",
+                              "Cypher statements sent by bulk writes")
+        self.metrics.describe("graphrag_graph_versions_dropped_total",
+                              "Retired knowledge graph versions dropped")
 
         self.neo4j_uri = os.getenv("NEO4J_URI")
         self.neo4j_username = os.getenv("NEO4J_USERNAME")
         self.neo4j_password = os.getenv("NEO4J_PASSWORD")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
 
-        # Initialize vector store connection
+        # Bounded parallelism for LLM graph extraction
+        self.extraction_workers = int(
+            os.getenv("GRAPHRAG_EXTRACTION_WORKERS", 8))
+        self.extraction_retries = int(
+            os.getenv("GRAPHRAG_EXTRACTION_RETRIES", 4))
+
+        # Exact + semantic cache of search results, cleared on every rebuild
+        self.query_cache = QueryResultCache(
+            max_entries=int(os.getenv("GRAPHRAG_QUERY_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("GRAPHRAG_QUERY_CACHE_TTL", 3600)),
+            similarity_threshold=float(
+                os.getenv("GRAPHRAG_SEMANTIC_CACHE_THRESHOLD", 0.95))
+        )
+
+        # Retrieval-only ("fast") search tuning
+        self.fast_candidates = int(os.getenv("GRAPHRAG_FAST_CANDIDATES", 10))
+        self.neighbour_seeds = int(os.getenv("GRAPHRAG_NEIGHBOUR_SEEDS", 3))
+        self.neighbour_boost = float(os.getenv("GRAPHRAG_NEIGHBOUR_BOOST", 0.5))
+
+        # Shared pool for running the retrieval legs concurrently, sized for
+        # two legs per admitted search
+        self._retrieval_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv(
+                "GRAPHRAG_RETRIEVAL_WORKERS",
+                2 * int(os.getenv("GRAPHRAG_MAX_IN_FLIGHT", 64)))),
+            thread_name_prefix="retrieval")
+        self.vector_leg_timeout = float(
+            os.getenv("GRAPHRAG_VECTOR_LEG_TIMEOUT", 10))
+        self.graph_leg_timeout = float(
+            os.getenv("GRAPHRAG_GRAPH_LEG_TIMEOUT", 10))
+
+        # Batch searches: queries per call and rerank LLM calls in flight
+        # per batch
+        self.max_batch_queries = int(os.getenv("GRAPHRAG_MAX_BATCH_QUERIES", 64))
+        self.rerank_concurrency = int(os.getenv("GRAPHRAG_RERANK_CONCURRENCY", 8))
+
+        # Batched writer settings, shared by every graph version
+        self.write_batch_size = int(os.getenv("GRAPHRAG_WRITE_BATCH_SIZE", 1000))
+        self.rows_per_transaction = int(
+            os.getenv("GRAPHRAG_ROWS_PER_TRANSACTION", 20000))
+
+        # Optional in-process copy of photo_vectors for fast similarity search
+        self.use_local_index = os.getenv("GRAPHRAG_LOCAL_INDEX", "0") == "1"
+        self.local_index_path = os.getenv(
+            "GRAPHRAG_LOCAL_INDEX_PATH", os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                ".graphrag_index", "photo_vectors"))
+        self.local_index_ivf_lists = int(
+            os.getenv("GRAPHRAG_LOCAL_INDEX_IVF_LISTS", 0))
+        self.local_index_nprobe = int(os.getenv("GRAPHRAG_LOCAL_INDEX_NPROBE", 8))
+
+        # In-memory photo-entity incidence and entity co-occurrence, for the
+        # entity retrieval leg and the neighbour boost
+        self.use_entity_index = os.getenv("GRAPHRAG_ENTITY_INDEX", "1") == "1"
+        self.entity_neighbours = int(os.getenv("GRAPHRAG_ENTITY_NEIGHBOURS", 16))
+        self.entity_hop_decay = float(os.getenv("GRAPHRAG_ENTITY_HOP_DECAY", 0.5))
+        self.entity_relation_weight = float(
+            os.getenv("GRAPHRAG_ENTITY_RELATION_WEIGHT", 0.5))
+        self.entity_fusion_weight = float(
+            os.getenv("GRAPHRAG_ENTITY_FUSION_WEIGHT", 0.5))
+
+        # Blue/green rebuilds: searches read the live graph version while a
+        # rebuild fills a shadow one, which is validated before it goes live.
+        # Retired versions are dropped by a background worker
+        self.max_failed_ratio = float(
+            os.getenv("GRAPHRAG_MAX_FAILED_RATIO", 0.1))
+        self.index_await_timeout = float(
+            os.getenv("GRAPHRAG_INDEX_AWAIT_TIMEOUT", 300))
+        self._live_lock = threading.Lock()
+        self._gc_executor = ThreadPoolExecutor(max_workers=1,
+                                               thread_name_prefix="graph-gc")
+        self.shadow = None
+        self._last_version = 0
+
+        # With several replicas, each follows the live pointer in the graph,
+        # read at most every live_version_poll seconds. A retired version is
+        # dropped version_grace seconds later, once the other replicas have
+        # moved off it; an unfinished build older than stale_build_age is
+        # presumed dead
+        self.live_version_poll = float(
+            os.getenv("GRAPHRAG_LIVE_VERSION_POLL", 5))
+        self.version_grace = float(os.getenv("GRAPHRAG_VERSION_GRACE", 120))
+        self.stale_build_age = float(
+            os.getenv("GRAPHRAG_STALE_BUILD_AGE", 6 * 3600))
+        self._follow_lock = threading.Lock()
+        self._next_live_check = 0.0
+        self.vector_store_factory = vector_store_factory or self._connect_vector_store
+
+        # Builds, upserts and ingests are serialized; a reset also waits for
+        # in-flight searches and holds new ones back. A semaphore, not a lock:
+        # a reset stream holds it across yields, and the WSGI server may
+        # resume or close the generator on another thread
+        self._write_lock = threading.Semaphore(1)
+        self._build_lock = ReadWriteLock()
+        self.build_wait_timeout = float(
+            os.getenv("GRAPHRAG_BUILD_WAIT_TIMEOUT", 30))
+
+        # The rerank chain is built on first use
+        self._chain_lock = threading.Lock()
+        self.retrieval_chain = None
+
+        self.metrics.register_collector(self._collect_metrics)
+
+    def _connect(self):
+        """
+        Create the Neo4j graph, LLM, embeddings and caches and open the live
+        graph version. Steps that succeeded are kept, so a retry after a
+        failure picks up where the last attempt stopped.
+        """
+        if self.graph is None:
+            if self._backends["graph"] is not None:
+                self.graph = self._backends["graph"]
+            else:
+                from langchain_community.graphs import Neo4jGraph
+                self.graph = Neo4jGraph()
+
+        if self.llm is None:
+            if self._backends["llm"] is not None:
+                self.llm = self._backends["llm"]
+            else:
+                from langchain_openai import ChatOpenAI
+                self.llm = ChatOpenAI(temperature=0, model_name="gpt-4o-mini")
+
+        if self.cache is None:
+            from llm_cache import CachedEmbeddings, ContentCache, QueryEmbeddings
+            embeddings = self._backends["embeddings"]
+            if embeddings is None:
+                from langchain_openai import OpenAIEmbeddings
+                embeddings = OpenAIEmbeddings()
+
+            # Extractions and embeddings are cached on disk by content hash
+            cache = ContentCache(
+                os.getenv("GRAPHRAG_CACHE_PATH", os.path.join(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    ".graphrag_cache.sqlite3")),
+                max_entries=int(os.getenv("GRAPHRAG_CACHE_MAX_ENTRIES", 100000))
+            )
+            self.schema_signature = graph_schema_signature(self.llm.model_name)
+            cache.invalidate("graph", keep_signature=self.schema_signature)
+            self.embeddings = CachedEmbeddings(embeddings, cache)
+            # Search queries stay out of the disk cache
+            self.query_embeddings = QueryEmbeddings(
+                embeddings, max_entries=int(
+                    os.getenv("GRAPHRAG_QUERY_EMBEDDING_CACHE_SIZE", 4096)))
+            self.cache = cache
+
+        if self.live is None:
+            self.live = self._open_version(self._read_live_version())
+            self._next_live_check = time.monotonic() + self.live_version_poll
+            self._collect_stale_versions()
+
+    def _ensure_ready(self):
+        """
+        Connect if that has not happened yet; raises NotReady (503) while the
+        backends cannot be reached, without retrying before the backoff ends,
+        and while another thread's connection attempt is in progress
+        """
+        if self.ready:
+            return
+        # Another thread (usually the warm-up) is connecting; a slow attempt
+        # must not hold searches and their admission slots on the lock
+        if not self._connect_lock.acquire(blocking=False):
+            raise NotReady("PhotoGraphRAG is starting: connecting",
+                           retry_after=self.connect_backoff)
         try:
-            self.vector_store = Neo4jVector.from_existing_index(
-                OpenAIEmbeddings(),
-                url=self.neo4j_uri,
-                username=self.neo4j_username,
-                password=self.neo4j_password,
-                index_name="photo_vectors",
+            if self.ready:
+                return
+            if time.monotonic() < self._next_attempt:
+                raise NotReady(f"PhotoGraphRAG is starting: {self.connect_error}",
+                               retry_after=self._next_attempt - time.monotonic())
+            self.connect_attempts += 1
+            try:
+                self._connect()
+            except Exception as e:
+                self.connect_error = f"{type(e).__name__}: {e}"
+                backoff = min(self.connect_backoff * 2 ** (self.connect_attempts - 1),
+                              self.connect_backoff_max)
+                self._next_attempt = time.monotonic() + backoff
+                print(f"Warning: Could not connect (attempt {self.connect_attempts}, "
+                      f"retrying in {backoff:.1f}s): {e}")
+                raise NotReady(f"PhotoGraphRAG is starting: {self.connect_error}",
+                               retry_after=backoff) from e
+            self.connect_error = None
+            self.ready_seconds = time.monotonic() - self._started
+            self.ready = True
+            print(f"PhotoGraphRAG ready in {self.ready_seconds:.2f} seconds")
+        finally:
+            self._connect_lock.release()
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Connect, retrying until the backends answer, then import the
+        extraction code and build the rerank chain so the first requests do
+        not pay for them. Runs in a daemon thread unless background=False.
+        """
+        if background:
+            if self._warm_up_thread is None or not self._warm_up_thread.is_alive():
+                self._warm_up_thread = threading.Thread(
+                    target=self.warm_up, args=(False,), name="warm-up", daemon=True)
+                self._warm_up_thread.start()
+            return self._warm_up_thread
+
+        while not self.ready:
+            try:
+                self._ensure_ready()
+            except NotReady:
+                time.sleep(max(self._next_attempt - time.monotonic(), 0.01))
+        try:
+            import langchain_experimental.graph_transformers  # noqa: F401
+            self.setup_retrieval_chain()
+        except Exception as e:
+            print(f"Warning: Warm-up could not build the rerank chain: {e}")
+        return None
+
+    def startup_status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "ready_seconds": (round(self.ready_seconds, 3)
+                              if self.ready_seconds is not None else None),
+            "connect_attempts": self.connect_attempts,
+            "last_error": self.connect_error,
+            "warming_up": (self._warm_up_thread is not None
+                           and self._warm_up_thread.is_alive())
+        }
+
+    def _connect_vector_store(self, version: GraphVersion) -> "Neo4jVector":
+        """
+        Hybrid vector store over a graph version's existing
+        photo_vectors/photo_keywords indexes
+        """
+        from langchain_community.vectorstores import Neo4jVector
+        return Neo4jVector.from_existing_index(
+            self.query_embeddings,
+            url=self.neo4j_uri,
+            username=self.neo4j_username,
+            password=self.neo4j_password,
+            index_name=version.vector_index,
+            keyword_index_name=version.keyword_index,
+            search_type="hybrid"
+        )
+
+    @property
+    def rebuilding(self) -> bool:
+        """
+        Whether a full rebuild or reset is running or waiting to start
+        """
+        return self.shadow is not None or self._build_lock.writing
+
+    @property
+    def vector_store(self):
+        return self.live.vector_store if self.live is not None else None
+
+    @property
+    def local_index(self) -> Optional[LocalVectorIndex]:
+        return self.live.local_index if self.live is not None else None
+
+    # Graph versions
+
+    def _new_version(self, version: int) -> GraphVersion:
+        """
+        Writer and local index for a graph version, without connecting to it
+        """
+        writer = BulkGraphWriter.for_graph(
+            self.graph,
+            batch_size=self.write_batch_size,
+            rows_per_transaction=self.rows_per_transaction,
+            index_name=versioned(VECTOR_INDEX, version),
+            keyword_index_name=versioned(KEYWORD_INDEX, version),
+            document_label=versioned(DOCUMENT_LABEL, version),
+            chunk_label=versioned(CHUNK_LABEL, version),
+            entity_label=versioned(BASE_ENTITY_LABEL, version)
+        )
+        local_index = None
+        if self.use_local_index:
+            local_index = LocalVectorIndex(
+                path=versioned(self.local_index_path, version),
+                ivf_lists=self.local_index_ivf_lists,
+                nprobe=self.local_index_nprobe
+            )
+        entity_index = None
+        if self.use_entity_index:
+            entity_index = EntityGraphIndex(
+                max_neighbours=self.entity_neighbours,
+                hop_decay=self.entity_hop_decay,
+                relation_weight=self.entity_relation_weight
             )
+        return GraphVersion(version, writer, local_index, entity_index)
+
+    def _open_version(self, version: int) -> GraphVersion:
+        """
+        A graph version with its vector store connected and its local index
+        loaded, ready to serve searches
+        """
+        graph_version = self._new_version(version)
+        try:
+            graph_version.vector_store = self.vector_store_factory(graph_version)
         except Exception as e:
             print(f"Warning: Could not initialize vector store: {e}")
-            self.vector_store = None
-
-        self._initialized = True
+        if graph_version.local_index is not None:
+            self._load_local_index(graph_version)
+        if graph_version.entity_index is not None:
+            self._load_entity_index(graph_version)
+        return graph_version
+
+    def _read_live_version(self) -> int:
+        # Raises, so that connecting is retried rather than serving version 0
+        rows = self.graph.query(LIVE_VERSION_QUERY)
+        return int(rows[0]["version"] or 0) if rows else 0
+
+    def _graph_versions(self) -> set:
+        """
+        Every version with nodes or indexes in the database
+        """
+        names = [row["name"] for row in self.graph.query(GRAPH_LABELS_QUERY)]
+        names += [row["name"] for row in self.graph.query(GRAPH_INDEXES_QUERY)]
+        return versions_in(names)
 
-    def reset_knowledge_graph(self):
+    @contextmanager
+    def _pinned_live(self) -> Iterator[GraphVersion]:
         """
-        Reset the Neo4j database by clearing all nodes, relationships, and indexes
+        The live version, kept from being dropped until the caller is done
         """
-        print("Resetting Neo4j database...")
+        self._follow_live()
+        with self._live_lock:
+            live = self.live
+            live.acquire()
         try:
-            # Clear all nodes and relationships
-            self.graph.query("""
-                MATCH (n)
-                DETACH DELETE n
-            """)
+            yield live
+        finally:
+            live.release()
 
-            # Drop existing indexes if they exist
+    def _version_records(self) -> Dict[int, Dict]:
+        return {row["version"]: row
+                for row in self.graph.query(VERSION_RECORDS_QUERY)}
+
+    def _follow_live(self):
+        """
+        Serve the version another replica has made live. The pointer is read
+        at most every live_version_poll seconds, by one search while the
+        others go on with the current version
+        """
+        if time.monotonic() < self._next_live_check or \
+                not self._follow_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() < self._next_live_check:
+                return
+            self._next_live_check = time.monotonic() + self.live_version_poll
             try:
-                self.graph.query(
-                    "CALL db.index.fulltext.drop('photo_keywords')")
-            except:
-                print("No photo_keywords index to drop")
+                version = self._read_live_version()
+            except Exception as e:
+                print(f"Warning: Could not read the live graph version: {e}")
+                return
+            # Our own switch persists the pointer before it swaps live
+            shadow = self.shadow
+            if version == self.live.version or \
+                    (shadow is not None and version == shadow.version):
+                return
+
+            print(f"Following knowledge graph version {version}, "
+                  f"made live by another replica")
+            opened = self._open_version(version)
+            with self._live_lock:
+                previous, self.live = self.live, opened
+            self.query_cache.clear()
+            # The replica that switched drops the old version after the
+            # grace period; only this process's copy goes now
+            self._gc_executor.submit(self._release, previous)
+            self._gc_executor.submit(self._collect_stale_versions)
+        finally:
+            self._follow_lock.release()
+
+    def _start_shadow(self) -> GraphVersion:
+        """
+        Fresh version for a rebuild to write into while searches use live
+        """
+        # Never reuse a number a queued drop may still be about to delete
+        # or another replica is building
+        version = max(self._graph_versions() | set(self._version_records())
+                      | {self.live.version, self._last_version}) + 1
+        self._last_version = version
+        self.graph.query(RECORD_VERSION_QUERY, {"version": version})
+        self.shadow = self._new_version(version)
+        print(f"Building knowledge graph version {version}")
+        return self.shadow
+
+    def _validate(self, version: GraphVersion, ingested: int, failed: int):
+        """
+        Check a rebuilt version before it goes live: few enough extraction
+        failures, one vector row per ingested photo, online indexes and a
+        vector search that answers
+        """
+        total = ingested + failed
+        if total and failed / total > self.max_failed_ratio:
+            raise GraphValidationError(
+                f"Extraction failed for {failed} of {total} photos")
+        count = version.query(self.graph, CHUNK_COUNT_QUERY)[0]["count"]
+        if count != ingested:
+            raise GraphValidationError(
+                f"Expected {ingested} photo vectors in version "
+                f"{version.version}, found {count}")
+        if not ingested:
+            return
 
+        self.graph.query(AWAIT_INDEXES_QUERY,
+                         {"timeout": int(self.index_await_timeout)})
+        names = [version.vector_index, version.keyword_index]
+        states = {
+            row["name"]: row["state"]
+            for row in self.graph.query(INDEX_STATES_QUERY, {"names": names})
+        }
+        offline = [name for name in names if states.get(name) != "ONLINE"]
+        if offline:
+            raise GraphValidationError(f"Indexes not online: {offline}")
+
+        if not self._vector_leg("photo", k=1, version=version):
+            raise GraphValidationError(
+                f"Probe search returned nothing from version {version.version}")
+
+    def _switch_to(self, version: GraphVersion):
+        """
+        Make a validated shadow version live and retire the previous one
+        """
+        if version.vector_store is None:
+            version.vector_store = self.vector_store_factory(version)
+        if version.entity_index is not None:
+            version.entity_index.refresh()
+        if version.local_index is not None:
+            version.local_index.flush()
+        # Persist first so a crash never leaves the pointer on a dropped version
+        self.graph.query(SET_LIVE_VERSION_QUERY, {"version": version.version})
+        with self._live_lock:
+            previous, self.live = self.live, version
+        self.shadow = None
+        self.query_cache.clear()
+        print(f"Knowledge graph version {version.version} is live")
+        self._retire(previous, self.version_grace)
+
+    def _abandon_shadow(self):
+        shadow, self.shadow = self.shadow, None
+        if shadow is not None:
+            print(f"Discarding knowledge graph version {shadow.version}")
+            self._retire(shadow)
+
+    def _retire(self, version: GraphVersion, grace: float = 0.0):
+        """
+        Drop a version in the background once its last search here has
+        finished, and no sooner than grace seconds from now so that other
+        replicas can move off it first
+        """
+        def drop():
             try:
-                self.graph.query("CALL db.index.vector.drop('photo_vectors')")
-            except:
-                print("No photo_vectors index to drop")
+                self._drop_version(version)
+            except Exception as e:
+                print(f"Warning: Could not drop graph version {version.version}: {e}")
+        if not grace:
+            self._gc_executor.submit(drop)
+            return
+        try:
+            self.graph.query(RETIRE_VERSION_QUERY, {"version": version.version})
+        except Exception as e:
+            print(f"Warning: Could not mark graph version {version.version} "
+                  f"retired: {e}")
+        timer = threading.Timer(grace, self._gc_executor.submit, args=(drop,))
+        timer.daemon = True
+        timer.start()
+
+    def _release(self, version: GraphVersion):
+        """
+        Let go of a version another replica retires: wait for this process's
+        searches on it, then delete its local index files
+        """
+        version.wait_idle()
+        if version.local_index is not None:
+            version.local_index.delete()
+
+    def _drop_version(self, version: GraphVersion):
+        """
+        Delete a version's nodes, indexes, constraints and local index files
+        """
+        version.wait_idle()
+        version.query(self.graph, DELETE_VERSION_QUERY)
+        for statement in version.writer.drop_statements():
+            self.graph.query(statement)
+        if version.local_index is not None:
+            version.local_index.delete()
+        self.graph.query(FORGET_VERSION_QUERY, {"version": version.version})
+        self.metrics.inc("graphrag_graph_versions_dropped_total")
+        print(f"Dropped knowledge graph version {version.version}")
+
+    def _collect_stale_versions(self):
+        """
+        Retire versions left behind by an interrupted rebuild or a crash.
+        Versions retired less than version_grace seconds ago may still be
+        served by other replicas, and recent unfinished ones may be another
+        replica's build in progress; those are left alone.
+        """
+        try:
+            records = self._version_records()
+            present = self._graph_versions() | set(records)
+        except Exception as e:
+            print(f"Warning: Could not list graph versions: {e}")
+            return
+        shadow = self.shadow
+        for version in sorted(present - {self.live.version}):
+            if shadow is not None and version == shadow.version:
+                continue
+            record = records.get(version)
+            if record is not None:
+                if record["retired_ms"] is not None:
+                    if record["retired_ms"] < self.version_grace * 1000:
+                        continue
+                elif record["age_ms"] < self.stale_build_age * 1000:
+                    continue
+            self._retire(self._new_version(version))
+
+    @_exclusive
+    def reset_knowledge_graph(self):
+        """
+        Reset the Neo4j database by dropping every graph version with its
+        nodes, relationships and indexes
+        """
+        self._ensure_ready()
+        print("Resetting Neo4j database...")
+        try:
+            for version in sorted(self._graph_versions() | {self.live.version}):
+                self._drop_version(self._new_version(version))
+            self.graph.query(CLEAR_LIVE_VERSION_QUERY)
+
+            # The indexes are gone, so start over from an empty version 0
+            with self._live_lock:
+                self.live = self._new_version(0)
+            self.query_cache.clear()
 
             print("Database reset complete")
         except Exception as e:
             print(f"Error during reset: {str(e)}")
             raise e
 
+    @_serialized
     def build_knowledge_graph(self, photo_descriptions: Dict[str, str]):
         """
-        Build knowledge graph from photo descriptions using LLM extraction
-        """
-        # Reset the database first
-        print("\nResetting existing knowledge graph...")
-        start_time = time.time()
-        self.reset_knowledge_graph()
-        end_time = time.time()
-        print(f"Reset completed in {end_time - start_time:.2f} seconds")
+        Build knowledge graph from photo descriptions using LLM extraction.
 
-        print("\nPhoto Descriptions:")
-        print(photo_descriptions)
+        The graph is built as a new shadow version while searches keep using
+        the live one. It goes live only after passing validation; otherwise
+        it is discarded, a GraphValidationError is raised and the live
+        version stays as it was.
+        """
+        self._ensure_ready()
+        timings = {}
+        shadow = self._start_shadow()
 
         # Convert photo descriptions to documents
-        documents = []
+        documents = self._photo_documents(photo_descriptions)
+        print(f"Ingesting {len(documents)} photos")
+
+        try:
+            failures = self._ingest_documents(documents, shadow, timings=timings)
+            ingested = len(documents) - len(failures)
+            with self.metrics.stage("validate", timings):
+                self._validate(shadow, ingested, len(failures))
+            with self.metrics.stage("switch", timings):
+                self._switch_to(shadow)
+        except BaseException:
+            self._abandon_shadow()
+            raise
+        return {
+            "ingested": ingested,
+            "failed": failures,
+            "version": shadow.version,
+            "timings": timings
+        }
+
+    @_serialized
+    def upsert_photos(self, photo_descriptions: Dict[str, str],
+                      deleted: Optional[Iterable[str]] = None,
+                      prune: bool = False,
+                      target: Optional[GraphVersion] = None,
+                      persist: bool = True) -> Dict:
+        """
+        Incrementally update the knowledge graph instead of rebuilding it.
+
+        Photos whose description hash is unchanged are skipped. New and
+        changed photos are extracted first; deleted photos and changed ones
+        that extracted have their Document, orphaned entities and vector rows
+        removed, and the extractions are then added to the existing
+        photo_vectors/photo_keywords indexes. A changed photo whose
+        extraction fails keeps its previous version. With prune=True the
+        given photos are treated as the whole library and anything else in the
+        graph is deleted. Changes go to the live version unless another
+        target version (a rebuild's shadow) is given.
+
+        "added" and "updated" list the photos that were written; photos
+        whose extraction failed are listed under "failed" instead. The local
+        vector index is saved at the end unless persist=False, for callers
+        that save it once after many upserts.
+        """
+        return self._upsert_photos(photo_descriptions, deleted, prune, target,
+                                   persist)
+
+    def _upsert_photos(self, photo_descriptions: Dict[str, str],
+                       deleted: Optional[Iterable[str]] = None,
+                       prune: bool = False,
+                       target: Optional[GraphVersion] = None,
+                       persist: bool = True) -> Dict:
+        """
+        Body of upsert_photos, for callers that already hold the write lock
+        """
+        self._ensure_ready()
+        timings = {}
+        version = target or self.live
+
+        # Only look up the photos involved unless the whole library is given
+        if prune:
+            rows = version.query(self.graph, EXISTING_PHOTOS_QUERY)
+        else:
+            rows = version.query(self.graph, EXISTING_PHOTOS_BY_NAME_QUERY, {
+                "filenames": list(photo_descriptions) + list(deleted or [])
+            })
+        existing = {row["filename"]: row["content_hash"] for row in rows}
+
+        added, updated, unchanged = [], [], []
         for filename, description in photo_descriptions.items():
-            doc = Document(
+            if filename not in existing:
+                added.append(filename)
+            elif existing[filename] != description_hash(description):
+                updated.append(filename)
+            else:
+                unchanged.append(filename)
+
+        if prune:
+            removed = [f for f in existing if f not in photo_descriptions]
+        else:
+            removed = [f for f in (deleted or [])
+                       if f in existing and f not in photo_descriptions]
+
+        # Extract first so that an update whose re-extraction fails keeps its
+        # previous subgraph and vectors instead of dropping out of search
+        changed = added + updated
+        documents, graph_documents, failures = [], [], []
+        if changed:
+            print(f"Extracting {len(changed)} new or changed photos")
+            documents, graph_documents, failures = self._extract_documents(
+                self._photo_documents({f: photo_descriptions[f] for f in changed}),
+                timings=timings)
+        # Photos whose extraction failed were not written; report them only
+        # under "failed"
+        if failures:
+            failed = {f["filename"] for f in failures}
+            added = [f for f in added if f not in failed]
+            updated = [f for f in updated if f not in failed]
+
+        stale = updated + removed
+        if stale:
+            print(f"Removing stale subgraphs for {len(stale)} photos")
+            with self.metrics.stage("remove", timings):
+                self._remove_photos(stale, version)
+
+        if documents:
+            print(f"Ingesting {len(documents)} new or changed photos")
+            self._write_documents(documents, graph_documents, version, timings)
+
+        # A shadow version is not searched yet, so cached results still hold
+        if (stale or documents) and version is self.live:
+            self.query_cache.clear()
+        if persist and version.local_index is not None:
+            with self.metrics.stage("local_index_save", timings):
+                version.local_index.flush()
+
+        return {
+            "added": added,
+            "updated": updated,
+            "deleted": removed,
+            "unchanged": len(unchanged),
+            "failed": failures,
+            "timings": timings
+        }
+
+    def ingest_ndjson(self, lines: Iterable, batch_size: int = 32,
+                      reset: bool = False) -> Iterator[Dict]:
+        """
+        Stream-ingest photos given as NDJSON lines, one
+        {"filename": ..., "description": ...} object per line.
+
+        Lines are consumed lazily and upserted in micro-batches of batch_size,
+        so memory stays flat however many photos are sent. Yields one
+        progress event per batch, an event per malformed line and a final
+        "done" event with totals and throughput. Extraction failures are
+        counted in "failed_count"; batch events also list them in
+        "failures". The done event counts each filename once: "ingested"
+        photos are in the graph, "failed_count" ones are not.
+
+        With reset=True the photos replace the whole library: they are
+        streamed into a shadow graph version that goes live, like a full
+        rebuild, only once the stream is complete and validates. The done
+        event follows validation and is followed by a last "live" event.
+        """
+        self._ensure_ready()
+        if not reset:
+            try:
+                done = yield from self._ingest_lines(lines, batch_size)
+            finally:
+                # Saved once for the whole stream rather than per batch
+                if self.live.local_index is not None:
+                    self.live.local_index.flush()
+            yield done
+            return done
+
+        with self._write_lock:
+            shadow = self._start_shadow()
+            try:
+                done = yield from self._ingest_lines(lines, batch_size, shadow)
+                self._validate(shadow, done["ingested"], done["failed_count"])
+                self._switch_to(shadow)
+            except BaseException:
+                self._abandon_shadow()
+                raise
+        yield done
+        yield {"event": "live", "version": shadow.version}
+        return done
+
+    def _ingest_lines(self, lines: Iterable, batch_size: int,
+                      target: Optional[GraphVersion] = None) -> Iterator[Dict]:
+        """
+        Body of ingest_ndjson: yields the batch and error events and returns
+        the done event, which the caller yields once the photos are accepted
+        """
+        # A reset stream already holds the write lock for the whole stream
+        upsert = self._upsert_photos if target is not None else self.upsert_photos
+        totals = {"photos": 0, "added": 0, "updated": 0, "unchanged": 0,
+                  "failed_count": 0, "errors": 0}
+        started = time.time()
+        batch: Dict[str, str] = {}
+        batch_number = 0
+        # Outcome per filename, as of its last batch
+        ingested, failed = set(), set()
+
+        def flush():
+            nonlocal batch, batch_number
+            batch_number += 1
+            batch_started = time.time()
+            summary = upsert(batch, target=target, persist=False)
+            now = time.time()
+            totals["photos"] += len(batch)
+            for key in ("added", "updated"):
+                totals[key] += len(summary[key])
+            totals["unchanged"] += summary["unchanged"]
+            totals["failed_count"] += len(summary["failed"])
+            for filename in summary["added"] + summary["updated"]:
+                ingested.add(filename)
+                failed.discard(filename)
+            for failure in summary["failed"]:
+                failed.add(failure["filename"])
+                ingested.discard(failure["filename"])
+            event = {
+                "event": "batch",
+                "batch": batch_number,
+                "photos": len(batch),
+                "added": len(summary["added"]),
+                "updated": len(summary["updated"]),
+                "unchanged": summary["unchanged"],
+                "failed_count": len(summary["failed"]),
+                "failures": summary["failed"],
+                "batch_seconds": round(now - batch_started, 3),
+                "total_photos": totals["photos"],
+                "elapsed_seconds": round(now - started, 3),
+                "photos_per_second": round(
+                    totals["photos"] / max(now - started, 1e-9), 2)
+            }
+            batch = {}
+            return event
+
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                filename, description = record["filename"], record["description"]
+                if not isinstance(filename, str) or not isinstance(description, str):
+                    raise ValueError("filename and description must be strings")
+            except (ValueError, KeyError, TypeError) as e:
+                totals["errors"] += 1
+                yield {"event": "error", "line": line_number, "error": str(e)}
+                continue
+
+            batch[filename] = description
+            if len(batch) >= batch_size:
+                yield flush()
+
+        if batch:
+            yield flush()
+
+        elapsed = time.time() - started
+        return {
+            "event": "done",
+            **totals,
+            "ingested": len(ingested),
+            "failed_count": len(failed),
+            "batches": batch_number,
+            "elapsed_seconds": round(elapsed, 3),
+            "photos_per_second": round(totals["photos"] / max(elapsed, 1e-9), 2)
+        }
+
+    def _photo_documents(self, photo_descriptions: Dict[str, str]) -> List["Document"]:
+        """
+        Wrap photo descriptions in Documents keyed by filename
+        """
+        from langchain.docstore.document import Document
+        return [
+            Document(
                 page_content=description,
-                metadata={"filename": filename}
+                metadata={
+                    "id": filename,
+                    "filename": filename,
+                    "content_hash": description_hash(description)
+                }
             )
-            documents.append(doc)
-
-        print("\nDocuments:")
-        print(documents)
+            for filename, description in photo_descriptions.items()
+        ]
 
-        # Extract entities and relationships using LLM
-        llm_transformer = LLMGraphTransformer(
+    def _create_graph_transformer(self) -> "LLMGraphTransformer":
+        """
+        Extract entities and relationships using LLM
+        """
+        from langchain_experimental.graph_transformers import LLMGraphTransformer
+        return LLMGraphTransformer(
             llm=self.llm,
-            allowed_nodes=[
-                "Scene",           # Overall scene type
-                "Landscape",       # Natural landscapes
-                "Building",        # Built structures
-                "Person",          # People
-                "Activity",        # Activities
-                "NaturalFeature",  # Natural elements
-                "TimeContext",     # Temporal aspects
-                "Atmosphere",      # Mood/ambiance
-                "Object",         # Physical objects
-                "Weather",        # Weather conditions
-                "Location"        # Specific locations
-            ],
-            allowed_relationships=[
-                "CONTAINS",           # Basic containment
-                "HAS_FEATURE",        # Scene features
-                "LOCATED_IN",         # Spatial location
-                "NEXT_TO",           # Adjacent relationships
-                "PART_OF",           # Component relationships
-                "INTERACTS_WITH",    # General interactions
-                "CREATES",           # Causal relationships
-                "INFLUENCES",        # Impact relationships
-                "USED_IN",          # Object usage
-                "EXPERIENCES"        # Experiential relationships
-            ],
-            node_properties=[
-                "type",
-                "description",
-                "color",
-                "atmosphere",
-                "time_of_day",
-                "weather",
-                "activity_level",
-                "importance"         # Added to help prioritize key elements
-            ],
-            relationship_properties=[
-                "description",
-                "spatial",
-                "temporal",
-                "impact",
-                "strength"          # Added to indicate relationship strength
-            ],
+            allowed_nodes=ALLOWED_NODES,
+            allowed_relationships=ALLOWED_RELATIONSHIPS,
+            node_properties=NODE_PROPERTIES,
+            relationship_properties=RELATIONSHIP_PROPERTIES,
             strict_mode=True
         )
 
-        # Convert to graph documents and store in Neo4j
-        graph_documents = llm_transformer.convert_to_graph_documents(documents)
-        self.graph.add_graph_documents(
-            graph_documents,
-            baseEntityLabel=True,
-            include_source=True
-        )
+    def _ingest_documents(self, documents: List["Document"], version: GraphVersion,
+                          progress=None,
+                          timings: Optional[Dict] = None) -> List[Dict]:
+        """
+        Extract, store and embed documents into the given graph version,
+        creating its indexes if needed.
+        Documents whose extraction fails are left out of the graph and the
+        vector index so that a later upsert picks them up again; their
+        failures are returned. Stage durations are added to timings.
+        """
+        documents, graph_documents, failures = self._extract_documents(
+            documents, progress, timings)
+        self._write_documents(documents, graph_documents, version, timings)
+        return failures
+
+    def _extract_documents(self, documents: List["Document"], progress=None,
+                           timings: Optional[Dict] = None
+                           ) -> Tuple[List["Document"], List, List[Dict]]:
+        """
+        Extract the graph documents of documents concurrently. Returns the
+        documents that succeeded, their graph documents and the failures.
+        """
+        from llm_cache import cached_extraction
+        llm_transformer = self._create_graph_transformer()
+
+        def report(completed, total, failed):
+            if progress:
+                progress(completed, total, failed)
+            elif completed % 25 == 0 or completed == total:
+                print(f"Extracted {completed}/{total} documents ({failed} failed)")
+
+        with self.metrics.stage("extraction", timings):
+            graph_documents, failures = extract_graph_documents(
+                documents,
+                cached_extraction(llm_transformer.process_response,
+                                  self.cache, self.schema_signature),
+                max_workers=self.extraction_workers,
+                max_retries=self.extraction_retries,
+                progress=report
+            )
+        self.metrics.inc("graphrag_extraction_failures_total", len(failures))
+        if failures:
+            failed = {f["index"] for f in failures}
+            documents = [d for i, d in enumerate(documents) if i not in failed]
+            print(f"Extraction failed for {len(failures)} documents")
+        return documents, graph_documents, failures
+
+    def _write_documents(self, documents: List["Document"], graph_documents: List,
+                         version: GraphVersion, timings: Optional[Dict] = None):
+        """
+        Store extracted documents with their embeddings in the given graph
+        version and its local indexes
+        """
+        if not documents:
+            return
 
-        # Vector embeddings
-        self.vector_store = Neo4jVector.from_documents(
-            documents,
-            self.embeddings,
-            index_name="photo_vectors",
-            keyword_index_name="photo_keywords",
-            search_type="hybrid"
-        )
+        # Vector embeddings, computed once and shared with the local index
+        texts = [doc.page_content for doc in documents]
+        with self.metrics.stage("embedding", timings):
+            vectors = self.embeddings.embed_documents(texts)
+
+        # Nodes, relationships, MENTIONS links and vectors in bulk UNWIND batches
+        with self.metrics.stage("graph_write", timings):
+            written = version.writer.write(graph_documents, documents, vectors)
+        self.metrics.inc("graphrag_db_statements_total", written["statements"],
+                         {"operation": "write"})
+        print(f"Wrote {len(documents)} documents in {written['statements']} "
+              f"statements and {written['transactions']} transactions")
+
+        if version.vector_store is None:
+            version.vector_store = self.vector_store_factory(version)
+
+        if version.local_index is not None:
+            with self.metrics.stage("local_index", timings):
+                version.local_index.upsert(
+                    [doc.metadata["filename"] for doc in documents], texts, vectors)
+
+        if version.entity_index is not None:
+            with self.metrics.stage("entity_index", timings):
+                version.entity_index.add(graph_documents)
+
+    def _remove_photos(self, filenames: List[str], version: GraphVersion):
+        """
+        Delete the subgraph and vector rows belonging to the given photos
+        """
+        version.query(self.graph, REMOVE_PHOTO_RELATIONSHIPS_QUERY,
+                      {"filenames": filenames})
+        version.query(self.graph, REMOVE_PHOTO_SUBGRAPHS_QUERY,
+                      {"filenames": filenames})
+        version.query(self.graph, REMOVE_PHOTO_VECTORS_QUERY,
+                      {"filenames": filenames})
+        if version.local_index is not None:
+            version.local_index.remove(filenames)
+        if version.entity_index is not None:
+            version.entity_index.remove(filenames)
+
+    def _load_local_index(self, version: GraphVersion):
+        """
+        Load a version's local vector index from disk, re-syncing it from the
+        photo_vectors rows in Neo4j when it is missing or out of date
+        """
+        local_index = version.local_index
+        try:
+            loaded = local_index.load()
+            count = version.query(self.graph, CHUNK_COUNT_QUERY)[0]["count"]
+            if loaded and count == len(local_index):
+                return
+            print(f"Syncing local vector index from Neo4j ({count} rows)")
+            rows = version.query(self.graph, LOCAL_INDEX_SYNC_QUERY)
+            local_index.replace_all(
+                [row["filename"] for row in rows],
+                [row["text"] for row in rows],
+                [row["embedding"] for row in rows]
+            )
+        except Exception as e:
+            print(f"Warning: Could not sync local vector index: {e}")
+
+    def _load_entity_index(self, version: GraphVersion):
+        """
+        Fill a version's entity index from its MENTIONS links and entity
+        relationships in Neo4j
+        """
+        try:
+            mentions = version.query(self.graph, ENTITY_MENTIONS_QUERY)
+            relations = version.query(self.graph, ENTITY_RELATIONS_QUERY)
+            version.entity_index.replace_all(
+                [(row["filename"], row["entity"]) for row in mentions],
+                [(row["source"], row["target"], row["sources"]) for row in relations]
+            )
+            version.entity_index.refresh()
+        except Exception as e:
+            print(f"Warning: Could not load entity index: {e}")
 
     def setup_retrieval_chain(self):
         """
         Set up the hybrid retrieval chain combining graph and vector search
         """
-        if not hasattr(self, 'retrieval_chain'):
+        if self.retrieval_chain is not None:
+            return
+        self._ensure_ready()
+        from langchain.prompts import ChatPromptTemplate
+        from langchain.schema.output_parser import StrOutputParser
+        from langchain.schema.runnable import RunnablePassthrough
+        # Concurrent first searches must not build (and publish) it twice
+        with self._chain_lock:
+            if self.retrieval_chain is not None:
+                return
             template = """Given the following structured and unstructured search results about photos, 
             analyze both the direct content and the relationships between elements to find the most relevant photos.
 
@@ -210,50 +1463,656 @@ class PhotoGraphRAG:
             prompt = ChatPromptTemplate.from_template(template)
 
             def retriever(query: str) -> str:
-                # Get results from vector similarity search
-                vector_results = [
-                    f"Photo {doc.metadata['filename']}: {doc.page_content}"
-                    for doc in self.vector_store.similarity_search(query, k=5)
-                ]
-
-                # Get results from graph pattern matching
-                graph_results = self.graph.query(f"""
-                    CALL db.index.fulltext.queryNodes("photo_keywords", $query) YIELD node
-                    MATCH (node)<-[:MENTIONS|IN_PHOTO]-(photo:Document)
-                    RETURN DISTINCT photo.filename AS filename, photo.page_content AS description
-                    LIMIT 3
-                """, {"query": query})
-
-                final_context = f"""
-                Vector Search Results:
-                {' '.join(vector_results)}
-                
-                Graph Search Results:
-                {graph_results}
-                """
-
-                return final_context
+                # Vector and graph search run concurrently
+                return self.format_context(self.retrieve(query))
 
             # Build the chain
+            self.rerank_prompt = prompt
+            # Kept unparsed for batch reranks, which need the usage metadata
+            self.rerank_chain = prompt | self.llm
+            self.answer_chain = self.rerank_chain | StrOutputParser()
             self.retrieval_chain = (
                 {"context": retriever, "query": RunnablePassthrough()}
-                | prompt
-                | self.llm
-                | StrOutputParser()
+                | self.answer_chain
             )
 
+    def format_context(self, results: Dict) -> str:
+        """
+        Render retrieval results into the context block of the prompt
+        """
+        vector_results = [
+            f"Photo {doc.metadata['filename']}: {doc.page_content}"
+            for doc, _ in results["vector"]
+        ]
+        graph_results = results["graph"]
+
+        final_context = f"""
+        Vector Search Results:
+        {' '.join(vector_results)}
+        
+        Graph Search Results:
+        {graph_results}
+        """
+
+        # Photos reached through matched entities and their co-occurring ones
+        if results.get("entity"):
+            entity_results = [
+                f"Photo {row['filename']}"
+                + (f" (mentions {', '.join(row['entities'])})"
+                   if row["entities"] else " (related entities)")
+                for row in results["entity"]
+            ]
+            final_context += f"""
+        Entity Graph Results:
+        {'; '.join(entity_results)}
+        """
+
+        return final_context
+
+    def retrieve(self, query: str,
+                 embedding: Optional[List[float]] = None,
+                 k: int = 5, graph_limit: int = 3,
+                 timings: Optional[Dict] = None,
+                 version: Optional[GraphVersion] = None) -> Dict:
+        """
+        Run the vector leg (query embedding + similarity search), the graph
+        leg (fulltext lookup) and, with the entity index, the entity leg
+        (in-memory 2-hop expansion) concurrently, each with its own timeout.
+        A precomputed query embedding skips the embedding call. All legs read
+        the given graph version, the live one by default.
+
+        If one leg fails or times out the other leg's results are still
+        returned and the failure is recorded under "degraded"; only when both
+        legs fail is an error raised.
+        """
+        version = version or self.live
+        legs = {"vector": self._start_vector_leg(query, embedding, k, timings,
+                                                 version)}
+        legs.update(self._start_keyword_legs(query, k, graph_limit, timings,
+                                             version))
+        return self._finish_legs(query, legs)
+
+    def _start_vector_leg(self, query: str, embedding: Optional[List[float]],
+                          k: int, timings: Optional[Dict],
+                          version: GraphVersion):
+        return (self._retrieval_executor.submit(
+            self._vector_leg, query, embedding, k, timings, version),
+            self.vector_leg_timeout)
+
+    def _start_keyword_legs(self, query: str, k: int, graph_limit: int,
+                            timings: Optional[Dict],
+                            version: GraphVersion) -> Dict:
+        """
+        Submit the legs that need no query embedding: graph and entity
+        """
+        legs = {
+            "graph": (self._retrieval_executor.submit(
+                self._graph_leg, query, graph_limit, timings, version),
+                self.graph_leg_timeout)
+        }
+        if version.entity_index is not None:
+            legs["entity"] = (self._retrieval_executor.submit(
+                self._entity_leg, query, k, timings, version),
+                self.graph_leg_timeout)
+        return legs
+
+    def _finish_legs(self, query: str, legs: Dict) -> Dict:
+        results, degraded = self._await_legs(legs)
+        if degraded:
+            print(f"Degraded retrieval for query {query!r}: {degraded}")
+        results["degraded"] = degraded
+        return results
+
+    def retrieve_batch(self, queries: List[str],
+                       embeddings: List[List[float]],
+                       k: int = 5, graph_limit: int = 3,
+                       timings: Optional[Dict] = None,
+                       version: Optional[GraphVersion] = None) -> List[Dict]:
+        """
+        retrieve() for many queries at once, given their embeddings. Each leg
+        covers the whole batch: one matrix product or one UNWIND query for
+        the vector leg, one UNWIND fulltext query for the graph leg. Returns
+        one result dict per query, in input order; a failed leg degrades
+        every query of the batch.
+        """
+        version = version or self.live
+        legs = {
+            "vector": (self._retrieval_executor.submit(
+                self._vector_leg_batch, queries, embeddings, k, timings,
+                version),
+                self.vector_leg_timeout),
+            "graph": (self._retrieval_executor.submit(
+                self._graph_leg_batch, queries, graph_limit, timings, version),
+                self.graph_leg_timeout)
+        }
+        if version.entity_index is not None:
+            legs["entity"] = (self._retrieval_executor.submit(
+                lambda: [self._entity_leg(query, k, timings, version)
+                         for query in queries]),
+                self.graph_leg_timeout)
+
+        results, degraded = self._await_legs(legs)
+        if degraded:
+            print(f"Degraded retrieval for a batch of {len(queries)} "
+                  f"queries: {degraded}")
+        return [
+            {**{name: rows[i] if rows else [] for name, rows in results.items()},
+             "degraded": degraded}
+            for i in range(len(queries))
+        ]
+
+    def _await_legs(self, legs: Dict):
+        """
+        Wait for the submitted retrieval legs, each up to its own timeout.
+        Failed or timed out legs get empty results and are returned in
+        degraded; RuntimeError if every leg failed.
+        """
+        results, degraded = {}, {}
+        started = time.monotonic()
+        for name, (future, timeout) in legs.items():
+            remaining = max(0.0, started + timeout - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                future.cancel()
+                degraded[name] = f"timed out after {timeout:.2f} seconds"
+                results[name] = []
+            except Exception as e:
+                degraded[name] = str(e)
+                results[name] = []
+            if name in degraded:
+                self.metrics.inc("graphrag_degraded_legs_total", 1, {"leg": name})
+
+        if len(degraded) == len(legs):
+            raise RuntimeError(f"All retrieval legs failed: {degraded}")
+        return results, degraded
+
+    def _vector_leg(self, query: str, embedding: Optional[List[float]] = None,
+                    k: int = 5, timings: Optional[Dict] = None,
+                    version: Optional[GraphVersion] = None):
+        """
+        Embed the query and run the vector similarity search, in process when
+        the local index is enabled and in Neo4j otherwise
+        """
+        version = version or self.live
+        if embedding is None:
+            with self.metrics.stage("embedding", timings):
+                embedding = self.query_embeddings.embed_query(query)
+        with self.metrics.stage("vector", timings):
+            local_index = version.local_index
+            if local_index is not None and len(local_index):
+                from langchain.docstore.document import Document
+                return [
+                    (Document(page_content=text, metadata={"filename": filename}),
+                     score)
+                    for filename, text, score in local_index.search(embedding, k=k)
+                ]
+            if version.vector_store is None:
+                raise RuntimeError(
+                    f"No vector index for graph version {version.version}")
+            return version.vector_store.similarity_search_with_score_by_vector(
+                embedding, k=k, query=query)
+
+    def _graph_leg(self, query: str, limit: int = 3,
+                   timings: Optional[Dict] = None,
+                   version: Optional[GraphVersion] = None):
+        """
+        Get results from graph pattern matching
+        """
+        from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+        version = version or self.live
+        with self.metrics.stage("graph", timings):
+            return version.query(self.graph, GRAPH_SEARCH_QUERY,
+                                 {"query": remove_lucene_chars(query),
+                                  "limit": limit,
+                                  "keyword_index": version.keyword_index})
+
+    def _entity_leg(self, query: str, limit: int = 5,
+                    timings: Optional[Dict] = None,
+                    version: Optional[GraphVersion] = None):
+        """
+        Photos mentioning entities that match the query, or entities that
+        co-occur with them, scored from the in-memory entity index
+        """
+        version = version or self.live
+        with self.metrics.stage("entity", timings):
+            return version.entity_index.search(query, limit)
+
+    def _vector_leg_batch(self, queries: List[str],
+                          embeddings: List[List[float]], k: int = 5,
+                          timings: Optional[Dict] = None,
+                          version: Optional[GraphVersion] = None) -> List[List]:
+        """
+        _vector_leg for a batch of queries and their embeddings: one matrix
+        product with the local index, otherwise one UNWIND query running the
+        same hybrid search as the Neo4j vector store
+        """
+        from langchain.docstore.document import Document
+        from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+        version = version or self.live
+        with self.metrics.stage("vector", timings):
+            local_index = version.local_index
+            if local_index is not None and len(local_index):
+                hits = local_index.search_batch(embeddings, k=k)
+            else:
+                hits = [[] for _ in embeddings]
+                for row in version.query(self.graph, BATCH_VECTOR_SEARCH_QUERY, {
+                        "queries": [{"index": i, "embedding": embedding,
+                                     "query": remove_lucene_chars(query).strip()}
+                                    for i, (query, embedding)
+                                    in enumerate(zip(queries, embeddings))],
+                        "k": k,
+                        "vector_index": version.vector_index,
+                        "keyword_index": version.keyword_index}):
+                    hits[row["query_index"]].append(
+                        (row["filename"], row["text"], row["score"]))
+            return [
+                [(Document(page_content=text, metadata={"filename": filename}),
+                  score)
+                 for filename, text, score in query_hits]
+                for query_hits in hits
+            ]
+
+    def _graph_leg_batch(self, queries: List[str], limit: int = 3,
+                         timings: Optional[Dict] = None,
+                         version: Optional[GraphVersion] = None) -> List[List[Dict]]:
+        """
+        Fulltext lookups for a batch of queries in one round-trip
+        """
+        from langchain_community.vectorstores.neo4j_vector import remove_lucene_chars
+        version = version or self.live
+        rows = [[] for _ in queries]
+        # Lucene rejects empty queries; those simply get no graph hits
+        keywords = [{"index": i, "query": remove_lucene_chars(query)}
+                    for i, query in enumerate(queries)]
+        keywords = [q for q in keywords if q["query"].strip()]
+        if not keywords:
+            return rows
+        with self.metrics.stage("graph", timings):
+            for row in version.query(self.graph, BATCH_GRAPH_SEARCH_QUERY,
+                                     {"queries": keywords, "limit": limit,
+                                      "keyword_index": version.keyword_index}):
+                rows[row.pop("query_index")].append(row)
+        return rows
+
     def search_photos(self, query: str) -> str:
         """
         Search for most relevant photo given a natural language query
         """
-        if not hasattr(self, 'retrieval_chain'):
+        return self.search_photos_detailed(query)["result"]
+
+    def search_photos_detailed(self, query: str, mode: str = "rerank",
+                               timings: Optional[Dict] = None) -> Dict:
+        """
+        Search for the most relevant photos, going through the exact and then
+        the semantic query cache before running retrieval.
+
+        mode="rerank" asks the LLM to pick photos from the retrieved context
+        and returns its raw answer as "result" alongside the parsed
+        "filenames", "match_factors" and "reasoning". mode="fast" skips the
+        LLM and returns "results", the vector and graph hits fused locally
+        with reciprocal rank fusion plus a boost for graph neighbours.
+        Both include "cache", describing any cache hit. Per-stage durations
+        (ms) are added to timings when it is given.
+
+        Searches read the live graph version, which a rebuild only replaces
+        once its shadow version is complete; only a reset holds them back.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(
+                f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        self._ensure_ready()
+        if mode == "rerank":
             self.setup_retrieval_chain()
 
-        return self.retrieval_chain.invoke(query)
+        # Waits (up to build_wait_timeout) while a reset is running
+        with self._build_lock.read(self.build_wait_timeout), \
+                self._pinned_live() as live, \
+                self.metrics.stage("search", timings, mode=mode):
+            return self._search(query, mode, timings, live)
+
+    def _search(self, query: str, mode: str, timings: Optional[Dict],
+                live: GraphVersion) -> Dict:
+        with self.metrics.stage("cache_lookup", timings):
+            hit = self.query_cache.get(query, namespace=mode)
+        if hit:
+            return {**hit["value"], "cache": hit["cache"]}
+
+        # Remember the generation so a rebuild during this search drops it
+        generation = self.query_cache.generation
+        if mode == "fast":
+            k = graph_limit = self.fast_candidates
+        else:
+            k, graph_limit = 5, 3
+
+        # The keyword legs need no embedding, so they start right away and
+        # run while the query is embedded for the semantic cache lookup; a
+        # semantic hit just abandons them
+        legs = self._start_keyword_legs(query, k, graph_limit, timings, live)
+        embedding = None
+        if self.query_cache.semantic_enabled:
+            try:
+                with self.metrics.stage("embedding", timings):
+                    embedding = self.query_embeddings.embed_query(query)
+            except Exception as e:
+                # The vector leg tries again and degrades if it fails too
+                print(f"Warning: Could not embed query {query!r}: {e}")
+            else:
+                with self.metrics.stage("cache_lookup", timings):
+                    hit = self.query_cache.get_similar(embedding, namespace=mode)
+                if hit:
+                    for future, _ in legs.values():
+                        future.cancel()
+                    return {**hit["value"], "cache": hit["cache"]}
+        legs["vector"] = self._start_vector_leg(query, embedding, k, timings, live)
+        results = self._finish_legs(query, legs)
+
+        if mode == "fast":
+            with self.metrics.stage("fusion", timings):
+                response = {"mode": mode, **self._fuse_results(results, live)}
+        else:
+            with self.metrics.stage("prompt_render", timings):
+                prompt_value = self.rerank_prompt.invoke({
+                    "context": self.format_context(results),
+                    "query": query
+                })
+            with self.metrics.stage("llm", timings):
+                message = self.llm.invoke(prompt_value)
+            self._record_llm_usage(message)
+            with self.metrics.stage("parse", timings):
+                from langchain.schema.output_parser import StrOutputParser
+                result = StrOutputParser().invoke(message)
+                response = {"mode": mode, "result": result,
+                            **parse_rerank_output(result)}
+
+        # Degraded answers are not worth keeping around
+        if not results["degraded"]:
+            self.query_cache.put(query, response, embedding, generation,
+                                 namespace=mode)
+        return {**response, "degraded": results["degraded"],
+                "cache": {"hit": False}}
+
+    def search_photos_batch(self, queries: List[str], mode: str = "rerank",
+                            timings: Optional[Dict] = None) -> List[Dict]:
+        """
+        Answer many queries in one call: one response per query, in input
+        order, each shaped like search_photos_detailed's plus its "query".
+
+        Queries missing from the exact cache are embedded with a single
+        embeddings call, checked against the semantic cache and retrieved
+        together (see retrieve_batch). In rerank mode their prompts go
+        through the rerank chain's batch, at most rerank_concurrency LLM
+        calls at a time; a query whose LLM call fails gets an "error" instead
+        of failing the batch. Repeated queries are searched once.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(
+                f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        if len(queries) > self.max_batch_queries:
+            raise ValueError(f"Too many queries in one batch: {len(queries)}, "
+                             f"at most {self.max_batch_queries}")
+        self._ensure_ready()
+        if mode == "rerank":
+            self.setup_retrieval_chain()
+
+        with self._build_lock.read(self.build_wait_timeout), \
+                self._pinned_live() as live, \
+                self.metrics.stage("search_batch", timings, mode=mode):
+            responses = self._search_batch(list(dict.fromkeys(queries)), mode,
+                                           timings, live)
+        return [{"query": query, **responses[query]} for query in queries]
+
+    def _search_batch(self, queries: List[str], mode: str,
+                      timings: Optional[Dict], live: GraphVersion) -> Dict[str, Dict]:
+        responses = {}
+        with self.metrics.stage("cache_lookup", timings):
+            for query in queries:
+                hit = self.query_cache.get(query, namespace=mode)
+                if hit:
+                    responses[query] = {**hit["value"], "cache": hit["cache"]}
+        pending = [query for query in queries if query not in responses]
+        if not pending:
+            return responses
+
+        generation = self.query_cache.generation
+        with self.metrics.stage("embedding", timings):
+            embeddings = self.query_embeddings.embed_documents(pending)
+        if self.query_cache.semantic_enabled:
+            with self.metrics.stage("cache_lookup", timings):
+                for query, embedding in zip(pending, embeddings):
+                    hit = self.query_cache.get_similar(embedding, namespace=mode)
+                    if hit:
+                        responses[query] = {**hit["value"], "cache": hit["cache"]}
+            embeddings = [embedding for query, embedding in zip(pending, embeddings)
+                          if query not in responses]
+            pending = [query for query in pending if query not in responses]
+            if not pending:
+                return responses
+
+        if mode == "fast":
+            results = self.retrieve_batch(pending, embeddings,
+                                          k=self.fast_candidates,
+                                          graph_limit=self.fast_candidates,
+                                          timings=timings, version=live)
+            with self.metrics.stage("fusion", timings):
+                answers = [{"mode": mode, **self._fuse_results(r, live)}
+                           for r in results]
+        else:
+            results = self.retrieve_batch(pending, embeddings, timings=timings,
+                                          version=live)
+            answers = self._rerank_batch(pending, results, timings)
+
+        for query, embedding, result, answer in zip(pending, embeddings,
+                                                    results, answers):
+            # Neither failed nor degraded answers are worth keeping around
+            if "error" not in answer and not result["degraded"]:
+                self.query_cache.put(query, answer, embedding, generation,
+                                     namespace=mode)
+            responses[query] = {**answer, "degraded": result["degraded"],
+                                "cache": {"hit": False}}
+        return responses
+
+    def _rerank_batch(self, queries: List[str], results: List[Dict],
+                      timings: Optional[Dict]) -> List[Dict]:
+        """
+        Rerank answers for a batch of retrieved queries through the rerank
+        chain's batch, at most rerank_concurrency LLM calls in flight
+        """
+        from langchain.schema.output_parser import StrOutputParser
+        with self.metrics.stage("prompt_render", timings):
+            inputs = [{"context": self.format_context(result), "query": query}
+                      for query, result in zip(queries, results)]
+        with self.metrics.stage("llm", timings):
+            messages = self.rerank_chain.batch(
+                inputs, config={"max_concurrency": self.rerank_concurrency},
+                return_exceptions=True)
+
+        answers = []
+        parser = StrOutputParser()
+        with self.metrics.stage("parse", timings):
+            for query, message in zip(queries, messages):
+                if isinstance(message, Exception):
+                    print(f"Rerank failed for query {query!r}: {message}")
+                    answers.append({"mode": "rerank", "error": str(message)})
+                    continue
+                self._record_llm_usage(message)
+                result = parser.invoke(message)
+                answers.append({"mode": "rerank", "result": result,
+                                **parse_rerank_output(result)})
+        return answers
+
+    def _record_llm_usage(self, message):
+        """
+        Count LLM calls and tokens from the response usage metadata
+        """
+        self.metrics.inc("graphrag_remote_calls_total", 1, {"service": "llm"})
+        usage = getattr(message, "usage_metadata", None) or {}
+        for kind in ("input_tokens", "output_tokens"):
+            if usage.get(kind):
+                self.metrics.inc("graphrag_llm_tokens_total", usage[kind],
+                                 {"type": kind.split("_")[0]})
+
+    def _collect_metrics(self):
+        """
+        Scrape-time samples for state owned by the caches and the local index
+        """
+        yield ("graphrag_ready", "gauge",
+               "1 once the backends are connected", {}, int(self.ready))
+        if self.ready_seconds is not None:
+            yield ("graphrag_startup_seconds", "gauge",
+                   "Time from construction to ready", {}, self.ready_seconds)
+        if not self.ready:
+            return
+
+        content = self.cache.stats()
+        for kind in set(content["hits"]) | set(content["misses"]):
+            hits = content["hits"].get(kind, 0)
+            misses = content["misses"].get(kind, 0)
+            yield ("graphrag_content_cache_hits_total", "counter",
+                   "Extraction/embedding cache hits", {"kind": kind}, hits)
+            yield ("graphrag_content_cache_misses_total", "counter",
+                   "Extraction/embedding cache misses", {"kind": kind}, misses)
+            yield ("graphrag_cache_hit_ratio", "gauge", "Cache hit ratio",
+                   {"cache": kind}, hits / max(hits + misses, 1))
+        # Every extraction cache miss is one LLMGraphTransformer call
+        yield ("graphrag_remote_calls_total", "counter", "",
+               {"service": "extraction"}, content["misses"].get("graph", 0))
+        yield ("graphrag_remote_calls_total", "counter", "",
+               {"service": "embedding"},
+               self.embeddings.remote_calls + self.query_embeddings.remote_calls)
+        query_vectors = self.query_embeddings.stats()
+        yield ("graphrag_cache_hit_ratio", "gauge", "Cache hit ratio",
+               {"cache": "query_embedding"},
+               query_vectors["hits"]
+               / max(query_vectors["hits"] + query_vectors["misses"], 1))
+
+        queries = self.query_cache.stats()
+        hits = sum(queries["hits"].values())
+        for kind, value in queries["hits"].items():
+            yield ("graphrag_query_cache_hits_total", "counter",
+                   "Search result cache hits", {"type": kind}, value)
+        yield ("graphrag_query_cache_misses_total", "counter",
+               "Search result cache misses", {}, queries["misses"])
+        yield ("graphrag_cache_hit_ratio", "gauge", "Cache hit ratio",
+               {"cache": "query"}, hits / max(hits + queries["misses"], 1))
+
+        live, shadow = self.live, self.shadow
+        yield ("graphrag_graph_version", "gauge",
+               "Knowledge graph version being served", {"role": "live"},
+               live.version)
+        if shadow is not None:
+            yield ("graphrag_graph_version", "gauge", "", {"role": "shadow"},
+                   shadow.version)
+        if live.local_index is not None:
+            yield ("graphrag_local_index_size", "gauge",
+                   "Photos in the local vector index", {}, len(live.local_index))
+        if live.entity_index is not None:
+            stats = live.entity_index.stats()
+            for key in ("photos", "entities", "neighbour_links", "bytes"):
+                yield ("graphrag_entity_index_size", "gauge",
+                       "Entity index size", {"unit": key}, stats[key])
+
+    def _fuse_results(self, results: Dict,
+                      version: Optional[GraphVersion] = None) -> Dict:
+        """
+        Rank retrieval results locally: reciprocal rank fusion of the vector
+        and graph legs, then a boost for photos sharing entities with the
+        top fused hits
+        """
+        version = version or self.live
+        fused = reciprocal_rank_fusion({
+            "vector": [doc.metadata.get("filename") for doc, _ in results["vector"]],
+            "graph": filenames_from_rows(results["graph"]),
+            "entity": filenames_from_rows(results.get("entity", []))
+        }, weights={"entity": self.entity_fusion_weight})
+
+        seeds = [r["filename"] for r in ranked(fused, self.neighbour_seeds)]
+        if seeds and self.neighbour_boost:
+            try:
+                # Answered in memory when the entity index is enabled
+                if version.entity_index is not None:
+                    shared = version.entity_index.shared_entities(seeds)
+                else:
+                    shared = {
+                        row["filename"]: row["shared"]
+                        for row in version.query(
+                            self.graph, GRAPH_NEIGHBOURS_QUERY, {"filenames": seeds})
+                    }
+                apply_neighbour_boost(fused, shared, self.neighbour_boost)
+            except Exception as e:
+                print(f"Warning: Could not compute graph neighbours: {e}")
+
+        results = ranked(fused, self.fast_candidates)
+        return {
+            "filenames": [r["filename"] for r in results],
+            "results": results
+        }
+
+# Create PhotoGraphRAG instance. GRAPHRAG_EAGER_INIT=0 leaves it to the
+# importer, e.g. the offline benchmark, which wires in its own backends, or
+# else to the first request (get_photo_rag).
+# Construction is cheap; the backends are connected by a background warm-up
+# (GRAPHRAG_WARM_UP=0 defers that to the first request)
+photo_rag = (PhotoGraphRAG() if os.getenv("GRAPHRAG_EAGER_INIT", "1") == "1"
+             else None)
+if photo_rag is not None and os.getenv("GRAPHRAG_WARM_UP", "1") == "1":
+    photo_rag.warm_up()
+
+# Bounded in-flight searches; beyond the queue requests get 429/503 instead of
+# piling up behind slow LLM calls
+search_admission = AdmissionController(
+    max_in_flight=int(os.getenv("GRAPHRAG_MAX_IN_FLIGHT", 64)),
+    max_queue=int(os.getenv("GRAPHRAG_MAX_QUEUE", 128)),
+    queue_timeout=float(os.getenv("GRAPHRAG_QUEUE_TIMEOUT", 5)),
+    name="searches"
+)
+
+# Batches are capped on their own: one holds up to GRAPHRAG_MAX_BATCH_QUERIES
+# searches and GRAPHRAG_RERANK_CONCURRENCY LLM calls, far more than the one
+# search slot it would take from search_admission
+batch_admission = AdmissionController(
+    max_in_flight=int(os.getenv("GRAPHRAG_MAX_BATCHES_IN_FLIGHT", 2)),
+    max_queue=int(os.getenv("GRAPHRAG_MAX_BATCH_QUEUE", 4)),
+    queue_timeout=float(os.getenv("GRAPHRAG_QUEUE_TIMEOUT", 5)),
+    name="batch searches"
+)
+
+_photo_rag_lock = threading.Lock()
+_instrumented = None
+
+
+def get_photo_rag() -> PhotoGraphRAG:
+    """
+    The instance the endpoints serve, with the admission collectors
+    registered on it. Created on the first request if nothing was set up at
+    import (GRAPHRAG_EAGER_INIT=0) or injected since.
+    """
+    global photo_rag, _instrumented
+    rag = photo_rag
+    if rag is not None and rag is _instrumented:
+        return rag
+    with _photo_rag_lock:
+        if photo_rag is None:
+            photo_rag = PhotoGraphRAG()
+        if photo_rag is not _instrumented:
+            photo_rag.metrics.register_collector(search_admission.collect)
+            photo_rag.metrics.register_collector(batch_admission.collect)
+            _instrumented = photo_rag
+        return photo_rag
 
 
-# Create PhotoGraphRAG instance
-photo_rag = PhotoGraphRAG()
+if photo_rag is not None:
+    get_photo_rag()
+
+
+def overloaded_response(e: Overloaded):
+    """
+    429/503 answer with a Retry-After hint for a rejected request
+    """
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+    return response
 
 
 @app.route('/build_knowledge_graph', methods=['POST'])
@@ -268,6 +2127,7 @@ def build_graph():
         }
     }
     """
+    photo_rag = get_photo_rag()
     try:
         data = request.get_json()
         if not data or 'photos' not in data:
@@ -276,64 +2136,295 @@ def build_graph():
         photo_descriptions = data['photos']
         start_time = time.time()
 
-        photo_rag.build_knowledge_graph(photo_descriptions)
+        summary = photo_rag.build_knowledge_graph(photo_descriptions)
 
         end_time = time.time()
         return jsonify({
             "message": "Knowledge graph built successfully",
+            **summary,
             "time_taken": f"{end_time - start_time:.2f} seconds"
         })
 
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/upsert_photos', methods=['POST'])
+def upsert_photos():
+    """
+    Endpoint to incrementally add, update or delete photos in the knowledge graph
+    Expected JSON format:
+    {
+        "photos": {
+            "1.jpg": "A desert sand storm...",
+            "2.jpg": "A serene mountain lake..."
+        },
+        "deleted": ["3.jpg"],   (optional)
+        "prune": false          (optional, treat "photos" as the full library)
+    }
+    """
+    photo_rag = get_photo_rag()
+    try:
+        data = request.get_json()
+        if not data or 'photos' not in data:
+            return jsonify({"error": "No photo data provided"}), 400
+        if not isinstance(data['photos'], dict):
+            return jsonify({"error": "photos must be an object of filename: description"}), 400
+        deleted = data.get('deleted')
+        if deleted is not None and (
+                not isinstance(deleted, list)
+                or not all(isinstance(name, str) for name in deleted)):
+            return jsonify({"error": "deleted must be a list of filenames"}), 400
+
+        start_time = time.time()
+
+        summary = photo_rag.upsert_photos(
+            data['photos'],
+            deleted=deleted,
+            prune=bool(data.get('prune', False))
+        )
+
+        end_time = time.time()
+        return jsonify({
+            "message": "Knowledge graph updated successfully",
+            **summary,
+            "time_taken": f"{end_time - start_time:.2f} seconds"
+        })
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/ingest_stream', methods=['POST'])
+def ingest_stream():
+    """
+    Endpoint to stream-ingest photos without holding the whole library in memory
+    Expected NDJSON body, one photo per line:
+        {"filename": "1.jpg", "description": "A desert sand storm..."}
+        {"filename": "2.jpg", "description": "A serene mountain lake..."}
+    Query parameters:
+        batch_size   photos per micro-batch (default GRAPHRAG_INGEST_BATCH_SIZE)
+        reset        "true" to replace the knowledge graph with these photos
+    Progress is streamed back as NDJSON, or as server-sent events when the
+    client sends "Accept: text/event-stream".
+    """
+    photo_rag = get_photo_rag()
+    try:
+        batch_size = int(request.args.get(
+            'batch_size', os.getenv("GRAPHRAG_INGEST_BATCH_SIZE", 32)))
+        if batch_size < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "batch_size must be a positive integer"}), 400
+    reset = request.args.get('reset', 'false').lower() == 'true'
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+
+    def generate():
+        try:
+            for event in photo_rag.ingest_ndjson(request.stream, batch_size, reset):
+                payload = json.dumps(event)
+                yield f"data: {payload}\n\n" if sse else payload + "\n"
+        except Exception as e:
+            payload = json.dumps({"event": "error", "error": str(e)})
+            yield f"data: {payload}\n\n" if sse else payload + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson'
+    )
+
+
 @app.route('/search_photos', methods=['POST'])
 def search_photos():
     """
     Endpoint to search photos based on a query
     Expected JSON format:
     {
-        "query": "Busy downtown"
+        "query": "Busy downtown",
+        "mode": "rerank",   (optional, "rerank" or "fast")
+        "timings": false    (optional, include a per-stage breakdown in ms)
     }
     """
+    photo_rag = get_photo_rag()
     try:
         data = request.get_json()
         if not data or 'query' not in data:
             return jsonify({"error": "No query provided"}), 400
 
         query = data['query']
-        print("SEARCH PHOTOS HAS BEEN CALLED")
-        print("QUERY: " + query)
+        mode = data.get('mode', 'rerank')
+        timings = {} if data.get('timings') else None
+        if mode not in SEARCH_MODES:
+            return jsonify({"error": f"Unknown search mode: {mode}"}), 400
+
+        start_time = time.time()
+        with search_admission.admit():
+            result = photo_rag.search_photos_detailed(query, mode=mode,
+                                                      timings=timings)
+        end_time = time.time()
+
+        if timings is not None:
+            result["timings"] = timings
+        return jsonify({
+            **result,
+            "time_taken": f"{end_time - start_time:.2f} seconds"
+        })
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 
-        # Ensure retrieval chain is set up
-        # photo_rag.setup_retrieval_chain()
+@app.route('/search_photos/batch', methods=['POST'])
+def search_photos_batch():
+    """
+    Endpoint to answer many search queries in one call. Batches have their own
+    admission pool (GRAPHRAG_MAX_BATCHES_IN_FLIGHT); results come back in the
+    order of the queries.
+    Expected JSON format:
+    {
+        "queries": ["Busy downtown", "Sunset at the beach"],
+        "mode": "rerank",   (optional, "rerank" or "fast")
+        "timings": false    (optional, include a per-stage breakdown in ms
+                             for the whole batch)
+    }
+    """
+    photo_rag = get_photo_rag()
+    try:
+        data = request.get_json()
+        if not data or 'queries' not in data:
+            return jsonify({"error": "No queries provided"}), 400
+
+        queries = data['queries']
+        mode = data.get('mode', 'rerank')
+        timings = {} if data.get('timings') else None
+        if not isinstance(queries, list) or not queries or \
+                not all(isinstance(query, str) for query in queries):
+            return jsonify({"error": "queries must be a non-empty list of strings"}), 400
+        if len(queries) > photo_rag.max_batch_queries:
+            return jsonify({"error": f"Too many queries: {len(queries)}, "
+                                     f"at most {photo_rag.max_batch_queries}"}), 400
+        if mode not in SEARCH_MODES:
+            return jsonify({"error": f"Unknown search mode: {mode}"}), 400
 
         start_time = time.time()
-        result = photo_rag.search_photos(query)
+        with batch_admission.admit():
+            results = photo_rag.search_photos_batch(queries, mode=mode,
+                                                    timings=timings)
         end_time = time.time()
 
+        response = {"mode": mode, "results": results}
+        if timings is not None:
+            response["timings"] = timings
         return jsonify({
-            "result": result,
+            **response,
             "time_taken": f"{end_time - start_time:.2f} seconds"
         })
 
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus-style metrics: stage latency histograms, call/token counters
+    and cache hit rates
+    """
+    photo_rag = get_photo_rag()
+    return Response(photo_rag.metrics.render(),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """
+    Liveness probe: the process is up and serving requests
+    """
+    return jsonify({"status": "alive"})
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 503 until the backends are connected
+    """
+    photo_rag = get_photo_rag()
+    status = photo_rag.startup_status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
-    Basic health check endpoint
+    Basic health check endpoint. Always answers while the process is up
+    ("live"); "ready" says whether searches can be served yet
     """
+    photo_rag = get_photo_rag()
+    if not photo_rag.ready:
+        return jsonify({
+            "status": "starting",
+            "live": True,
+            "ready": False,
+            "startup": photo_rag.startup_status(),
+            "searches": search_admission.stats(),
+            "batch_searches": batch_admission.stats()
+        })
     return jsonify({
         "status": "healthy",
+        "live": True,
+        "ready": True,
+        "startup": photo_rag.startup_status(),
         "neo4j_connected": photo_rag.graph is not None,
-        "vector_store_initialized": photo_rag.vector_store is not None
+        "vector_store_initialized": photo_rag.vector_store is not None,
+        "cache": photo_rag.cache.stats(),
+        "query_cache": photo_rag.query_cache.stats(),
+        "query_embedding_cache": photo_rag.query_embeddings.stats(),
+        "local_index": (photo_rag.local_index.stats()
+                        if photo_rag.local_index is not None else None),
+        "entity_index": (photo_rag.live.entity_index.stats()
+                         if photo_rag.live.entity_index is not None else None),
+        "rebuilding": photo_rag.rebuilding,
+        "graph_version": photo_rag.live.version,
+        "shadow_version": (photo_rag.shadow.version
+                           if photo_rag.shadow is not None else None),
+        "searches": search_admission.stats(),
+        "batch_searches": batch_admission.stats()
     })
 
 
+def run_server(host: str = '0.0.0.0', port: int = 7500):
+    """
+    Serve the app with waitress, a production WSGI server that hands requests
+    to a pool of worker threads. There should be enough threads for every
+    admitted and queued search and batch plus a few for builds, /health and
+    /metrics; connections beyond that wait in waitress, up to
+    GRAPHRAG_CONNECTION_LIMIT.
+    Falls back to the threaded Flask development server without waitress.
+    """
+    threads = int(os.getenv(
+        "GRAPHRAG_SERVER_THREADS",
+        search_admission.max_in_flight + search_admission.max_queue
+        + batch_admission.max_in_flight + batch_admission.max_queue + 8))
+    try:
+        from waitress import serve
+    except ImportError:
+        print("Warning: waitress is not installed, using the Flask development server")
+        app.run(host=host, port=port, threaded=True)
+        return
+    print(f"Serving on {host}:{port} with {threads} threads")
+    serve(app, host=host, port=port, threads=threads,
+          connection_limit=int(os.getenv("GRAPHRAG_CONNECTION_LIMIT", 2 * threads)),
+          channel_timeout=int(os.getenv("GRAPHRAG_CHANNEL_TIMEOUT", 300)))
+
+
 def test_graphrag():
     """
     Test function to verify PhotoGraphRAG functionality directly without Flask
@@ -350,27 +2441,7 @@ def test_graphrag():
             f"PhotoGraphRAG Instantiated in {end_time - start_time:.2f} seconds\n")
 
         # Test data
-        photo_descriptions = {
-            "supercar.jpg": "The image showcases a striking green sports car, prominently displayed with its unique butterfly doors wide open, creating a dramatic effect. The car features a sleek and aerodynamic design, characterized by sharp lines and an aggressive front end. It is parked on a winding road, surrounded by a scenic landscape of lush greenery and rocky formations, suggesting a mountainous or coastal setting. The sunlight bathes the scene, enhancing the car's glossy finish and highlighting its features. The combination of the car's modern design and the natural surroundings creates a visually appealing contrast. The scene captures a sense of luxury and performance, inviting admiration for both the vehicle and its picturesque environment. Notable details include the intricate wheel design and the sophisticated interior visible through the open door, emphasizing the car's high",
-            "chicken_fight.jpg": "The image captures a dynamic scene of two fighting roosters engaged in a fierce bout. Each bird is in mid-air, showcasing their powerful wings and muscular bodies. The rooster on the left has dark plumage with a glossy sheen, while the rooster on the right displays vibrant orange and brown feathers, emphasizing their contrasting appearances. The setting appears to be a dirt arena, likely outdoor, with a slightly blurred, indistinct background suggesting trees or foliage. Dust can be seen rising from the ground, adding to the intensity of the action. The focus on the birds highlights their aggressive postures, with each bird aiming to outmaneuver the other. Their spurs are prominently visible, indicating the competitive nature of this scene. Overall, the image conveys",
-            "stone_ape.jpg": "The image features a surreal, cosmic scene centered around the profile of a large, expressive chimpanzee. It holds a mushroom in one hand, cleverly suggesting themes of growth, evolution, and consciousness. The chimp's gaze is directed towards a swirl of abstract shapes and symbols that cascade from its head, hinting at thoughts and ideas. Surrounding the chimp are various elements that depict the evolution of humanity and knowledge. We see iconic representations of human figures in various stages of development, alongside mathematical equations, musical notes, and references to science and space exploration, illustrating the journey from primitive to advanced thought. In the background, geometric and ageless symbols create a mystical backdrop, while the horizon features pyramids and a stylized cityscape, implying a",
-            "city-lights.jpeg": "The image captures a breathtaking view of a sprawling cityscape at twilight, showcasing Hong Kong's iconic skyline. Towering skyscrapers dominate the foreground, their windows aglow with warm lights, creating a vibrant urban atmosphere. The city is nestled against the backdrop of lush green hills, contrasting the natural landscape with the densely packed buildings. In the distance, the shimmering waters of Victoria Harbour reflect the colorful lights of the city, enhancing the scene's beauty. Notable structures such as the International Commerce Centre and the HSBC Building can be seen, further emphasizing Hong Kong's status as a financial hub. The sky transitions from soft pinks and purples to deeper blues as night approaches, adding to the overall tranquility of the moment. The entire composition conveys a sense of",
-            "beach_sunset.jpg": "The image captures a serene beach scene during sunset. The foreground features soft, sandy textures with gentle undulations, suggesting a relaxed atmosphere. The shoreline curves gracefully where the light golden sand meets the calm ocean water. The backdrop showcases a vibrant sky filled with a palette of warm hues—soft oranges, pinks, and yellows blending seamlessly with cool blues. Wispy clouds scatter across the sky, illuminated by the fading sunlight, creating a dramatic yet peaceful ambiance. As the sun dips toward the horizon, a shimmering reflection dances on the water's surface, adding a touch of sparkles to the serene scene. Small waves gently lap against the shore, enhancing the tranquility, while the overall composition evokes a sense of calm and natural beauty, making it a perfect",
-            "curved_road.jpg": "The image depicts a winding road on a hillside, characterized by its smooth, newly paved asphalt. In the foreground, there's a gravel shoulder where the ground transitions from pavement to dirt, with small rocky patches and sparse vegetation. To the left, a metal guardrail provides safety along the curve of the road, with yellow and black hazard markings indicating a sharp turn ahead. A vehicle, likely an SUV, is seen navigating the bend, moving into the distance. The landscape features dry, golden grass and a rocky hillside, suggesting a warm climate. In the background, rolling hills are visible, fading into a clearer sky. The overall atmosphere conveys a sense of rural tranquility, with open space and scenic views typical of a mountainous or hilly region.",
-            "gentlemen.jpeg": "The image features four men standing confidently next to a silver minivan parked in a residential area during the evening. They are dressed in formal attire, with suits and sunglasses, giving a stylish and sophisticated impression. The man on the left wears a blue suit with a patterned tie, exuding a confident demeanor. Next to him, a man in a gray plaid suit stands with his hands clasped, showcasing a more reserved posture. The third individual is dressed in a black suit with a white shirt and a dark tie, while the fourth man, on the far right, sports a black suit with a striped tie and has a subtle badge on his lapel. In the background, the setting includes a well-maintained house with a garage door, and",
-            "family-dinner.jpg": "The image features a lively group of five people gathered around a wooden dining table, sharing a meal. The setting is bright and inviting, with natural light streaming through large windows, revealing a modern, airy interior. At the center of the table is a large platter of spaghetti, complemented by pieces of bread on a cutting board. Each person has a plate with pasta, and there are glasses of water in front of them. The group consists of three women and two men, all displaying cheerful expressions and engaged in animated conversation. One woman, wearing a pink top, is gesturing with her hand as she speaks, adding warmth to the interaction. The others, dressed in casual attire, seem equally involved, with smiles and laughter contributing to a joyful atmosphere",
-            "coffee-shop.jpeg": "The image depicts a lively café atmosphere with a modern and inviting design. The interior features large windows that allow natural light to flood the space, highlighting the stylish furnishings and décor. On the left side, several patrons are seated at wooden tables, absorbed in work or conversation. A woman in a red sweater appears to be using her laptop, while another individual leans back, seemingly deep in thought. To the right, a barista is working behind the counter, preparing beverages, with an additional staff member assisting. The counter is neatly arranged with coffee-making equipment and colorful dishware, emphasizing the café's focus on quality service. The décor includes minimalist shelving adorned with various items, including decorative vases and potentially local art, contributing to the café's",
-            "mountain-hike.jpeg": "The image depicts a scenic mountain hiking trail with a hiker as the main subject. The hiker, carrying a large backpack, is seen walking along a narrow dirt path that winds through lush greenery and flowering shrubbery. This path is bordered by tall coniferous trees on either side, adding to the natural beauty of the setting. In the background, majestic snow-capped mountains rise dramatically, their peaks piercing the blue sky, which is scattered with a few wispy clouds. The vibrant colors of the surrounding foliage juxtapose beautifully with the rugged mountain terrain and clear, bright sky. The hiker appears focused on the trail ahead, using trekking poles to aid their ascent. This image captures a moment of solitude and adventure in a breathtaking outdoor environment,",
-            "puppies.jpg": "The image features a delightful scene of eight adorable puppies nestled in a wicker basket. The puppies vary in color, with some having predominantly white fur and others showcasing shades of gray and black. Their expressions are curious and playful, capturing the innocence and charm typical of young dogs. The setting is a lush, green outdoor space with soft grass beneath the basket, suggesting a warm and inviting day. In the background, hints of foliage, possibly bushes or small trees, add depth to the scene, creating a vibrant, natural ambiance. Notable details include the various positions of the puppies—some are sitting upright, others are leaning against each other, displaying their playful nature. The basket itself is light brown with a natural weave pattern, contributing to the overall cozy and",
-            "kittens.jpg": "The image features a group of six adorable kittens, gathered closely together on a colorful patchwork quilt. The kittens predominantly display a mix of black and white fur, with some having distinctive black markings on their faces and bodies. Their large, expressive eyes—ranging from green to blue—create a sense of curiosity and playfulness. The setting is cozy and inviting, with the vibrant quilt showcasing various patterns and colors, adding to the cheerful atmosphere. The kittens appear to be in a playful mood, with their ears perked up and whiskers twitching, as if they are eager to explore their surroundings or engage in playful antics with each other. The composition captures their youthful energy perfectly, making it an endearing and heartwarming scene.",
-            "chickfila.jpg": "The image depicts a Chick-fil-A restaurant, showcasing its distinctive exterior design. The building features a combination of brick and bright red panels, with the Chick-fil-A logo prominently displayed on the roof. Large windows line the front, allowing a view of the menu and interior. In the foreground, there is a paved parking area, which is clean and well-maintained. The landscaping includes some low shrubs, contributing to an inviting atmosphere. A drive-thru sign is visible, indicating the restaurant's services, while additional signage promotes menu items and specials. The clear blue sky above suggests a sunny day, enhancing the vibrant appearance of the establishment. Overall, the setting conveys a sense of accessibility and modernity, typical of fast-casual dining experiences.",
-            "the_amish.jpg": "The image features a group of five individuals posed outdoors in a scenic setting with greenery in the background. They appear to be dressed in attire reminiscent of traditional or perhaps Amish style clothing. On the left, a woman in a long, teal dress with a white apron and a cap smiles at the camera. Next to her stands a young boy wearing a gray shirt and black vest, with his hands in his pockets, giving a relaxed stance. Beside him, a teenage boy wears a blue shirt and a black vest, also with his hands in his pockets, suggesting a casual vibe. In the center, another young boy is dressed in a green shirt with a black vest and shorts, embodying a playful appearance. To the right stands another woman dressed",
-            "eiffel_tower.jpg": "The image showcases the iconic Eiffel Tower rising majestically against a vibrant sunset sky, characterized by a palette of oranges, pinks, and blues. Below the tower, you can see a tranquil water feature reflecting the stunning colors of the sky. The area features lush green lawns with neatly trimmed hedges and a variety of trees, their leaves glowing with the warm hues of dusk. In the foreground, a series of modern, curved structures and fountains create an elegant, artistic display. To the right, a carousel can be spotted, adding a playful touch to the scene. People are leisurely walking and enjoying the surroundings, contributing to the lively yet serene atmosphere of this famous Parisian landmark. The overall composition captures a beautiful blend of architecture, nature, and urban",
-            "gym_bro.jpg": "In the image, a muscular man is seated on a bench press within a gym setting, preparing for a lift. He is wearing a sleeveless workout shirt that showcases his well-defined arms and shoulders, paired with athletic shorts. His focused expression indicates he's concentrating on the task ahead. Behind him, a woman stands as a spotter, providing support and encouragement. She is dressed in a black zip-up jacket and fitted leggings, with a black mask covering her face. The gym environment is characterized by a spacious layout, equipped with various weightlifting equipment in the background, and has a moody, industrial aesthetic, highlighted by darker walls and subtle lighting. Notable details include the heavy weights on the barbell, indicating a challenging lift, and",
-            "desert.jpg": "The image captures a vast desert landscape characterized by rolling sand dunes with intricate ripples in the sand, showcasing patterns created by the wind. The dunes rise and fall in gentle waves, reflecting golden hues under sunlight against a bright blue sky dotted with wispy clouds.",
-            "tesla.jpg": "The image depicts a sleek silver Tesla car parked on a winding road through a picturesque landscape with rolling hills and mountains. The setting is illuminated by sunset's warm glow, with the car's shiny body reflecting sunlight, emphasizing its modern design and clean lines.",
-            "prius.jpg": "The image features a sleek, modern silver car, possibly a hybrid or electric model, navigating an open road. The vehicle is positioned dynamically, suggesting motion and speed, with a streamlined design that highlights its aerodynamic shape."
-        }
+        photo_descriptions = SAMPLE_PHOTO_DESCRIPTIONS
         # Test building knowledge graph
         print("Testing knowledge graph construction...")
         start_time = time.time()
@@ -407,4 +2478,4 @@ if __name__ == "__main__":
 
     # For running the Flask server:
     port = int(os.getenv("PORT", 7500))
-    app.run(host='0.0.0.0', port=port)
+    run_server(port=port)
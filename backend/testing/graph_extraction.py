@@ -0,0 +1,141 @@
+"""
+Concurrent LLM graph extraction used by PhotoGraphRAG ingest.
+
+LLMGraphTransformer.convert_to_graph_documents extracts one document after
+another, so ingest time is dominated by sequential LLM round-trips. This module
+fans the per-document extraction out over a bounded thread pool, retries rate
+limited or transient failures with exponential backoff and isolates failures so
+one bad document does not abort the whole ingest.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    True for OpenAI style 429 / RateLimitError failures
+    """
+    return _status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    True for failures that are worth retrying (rate limits, timeouts, 5xx)
+    """
+    if is_rate_limit_error(error):
+        return True
+    status = _status_code(error)
+    if status is not None and status >= 500:
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Cooldown:
+    """
+    Shared pause so that a rate limit seen by one worker slows down all of them
+    """
+
+    def __init__(self, sleep: Callable[[float], None]):
+        self._lock = threading.Lock()
+        self._until = 0.0
+        self._sleep = sleep
+
+    def wait(self):
+        with self._lock:
+            remaining = self._until - time.monotonic()
+        if remaining > 0:
+            self._sleep(remaining)
+
+    def extend(self, delay: float):
+        with self._lock:
+            self._until = max(self._until, time.monotonic() + delay)
+
+
+def extract_graph_documents(
+    documents: Sequence[Any],
+    process_document: Callable[[Any], Any],
+    max_workers: int = 8,
+    max_retries: int = 4,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Tuple[List[Any], List[Dict]]:
+    """
+    Run process_document over documents with at most max_workers in flight.
+
+    Returns (graph_documents, failures). graph_documents keeps the input order
+    and only contains successful extractions; failures holds one
+    {"index", "filename", "error"} entry per document that still failed after
+    max_retries retries. progress, if given, is called as
+    progress(completed, total, failed) after every document.
+    """
+    total = len(documents)
+    results: List[Any] = [None] * total
+    failures: List[Dict] = []
+    cooldown = _Cooldown(sleep)
+    progress_lock = threading.Lock()
+    completed = 0
+
+    def run(index: int):
+        attempt = 0
+        while True:
+            cooldown.wait()
+            try:
+                return process_document(documents[index])
+            except Exception as e:
+                if attempt >= max_retries or not is_transient_error(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(max_delay, base_delay * (2 ** attempt))
+                    delay *= 1 + random.random() * 0.25
+                if is_rate_limit_error(e):
+                    cooldown.extend(delay)
+                else:
+                    sleep(delay)
+                attempt += 1
+
+    if total == 0:
+        return [], []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+        futures = {executor.submit(run, i): i for i in range(total)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                metadata = getattr(documents[index], "metadata", {}) or {}
+                failures.append({
+                    "index": index,
+                    "filename": metadata.get("filename"),
+                    "error": str(e)
+                })
+            with progress_lock:
+                completed += 1
+                if progress:
+                    progress(completed, total, len(failures))
+
+    failed = {f["index"] for f in failures}
+    failures.sort(key=lambda f: f["index"])
+    return [r for i, r in enumerate(results) if i not in failed], failures
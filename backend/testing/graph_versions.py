@@ -0,0 +1,119 @@
+"""
+Versioned graph namespaces for blue/green knowledge graph rebuilds.
+
+Each build writes into its own version:
+- the Document, Chunk and __Entity__ nodes carry versioned labels
+  (Document_v3, ...);
+- the vector, fulltext, constraint and filename indexes get versioned names
+  (photo_vectors_v3, ...).
+
+Searches keep reading the live version while a rebuild fills a shadow one.
+Once the shadow validates, the live pointer switches in one step; other
+replicas notice the new pointer when they next poll it. The previous version
+is dropped in the background after a grace period and after the last local
+search reading it has finished. Version 0 uses the original unversioned
+names, so graphs built before versioning keep working.
+"""
+import re
+import threading
+from typing import Iterable, Optional, Set
+
+from entity_index import EntityGraphIndex
+from graph_writer import BASE_ENTITY_LABEL, BulkGraphWriter
+from local_vector_index import LocalVectorIndex
+
+DOCUMENT_LABEL = "Document"
+CHUNK_LABEL = "Chunk"
+VECTOR_INDEX = "photo_vectors"
+KEYWORD_INDEX = "photo_keywords"
+
+_BASE_LABELS = re.compile(
+    rf":({DOCUMENT_LABEL}|{CHUNK_LABEL}|{BASE_ENTITY_LABEL})(?![\w`])")
+_VERSIONED_NAME = re.compile(
+    rf"^(?:{DOCUMENT_LABEL}|{VECTOR_INDEX})(?:_v(\d+))?$")
+
+
+class GraphValidationError(RuntimeError):
+    """
+    A rebuilt version failed its checks and was not switched live
+    """
+
+
+def versioned(name: str, version: int) -> str:
+    return f"{name}_v{version}" if version else name
+
+
+def namespaced(query: str, version: int) -> str:
+    """
+    Rewrite the Document/Chunk/__Entity__ labels of a Cypher query to the
+    given version's labels
+    """
+    if not version:
+        return query
+    return _BASE_LABELS.sub(
+        lambda m: f":`{versioned(m.group(1), version)}`", query)
+
+
+def versions_in(names: Iterable[str]) -> Set[int]:
+    """
+    Versions named by Document labels or photo_vectors index names
+    """
+    found = set()
+    for name in names:
+        match = _VERSIONED_NAME.match(name or "")
+        if match:
+            found.add(int(match.group(1) or 0))
+    return found
+
+
+class GraphVersion:
+    """
+    One namespace of the knowledge graph: its bulk writer, its vector store
+    connection and its optional local vector and entity indexes, plus a
+    count of the searches currently reading it
+    """
+
+    def __init__(self, version: int, writer: BulkGraphWriter,
+                 local_index: Optional[LocalVectorIndex] = None,
+                 entity_index: Optional[EntityGraphIndex] = None):
+        self.version = version
+        self.writer = writer
+        self.local_index = local_index
+        self.entity_index = entity_index
+        self.vector_store = None
+        self._cond = threading.Condition()
+        self._readers = 0
+
+    @property
+    def vector_index(self) -> str:
+        return versioned(VECTOR_INDEX, self.version)
+
+    @property
+    def keyword_index(self) -> str:
+        return versioned(KEYWORD_INDEX, self.version)
+
+    def query(self, graph, query: str, params: Optional[dict] = None):
+        return graph.query(namespaced(query, self.version), params or {})
+
+    def acquire(self):
+        """
+        Register a search reading this version; pair with release()
+        """
+        with self._cond:
+            self._readers += 1
+
+    def release(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until no search is reading this version
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._readers, timeout)
+
+    def __repr__(self) -> str:
+        return f"GraphVersion({self.version})"
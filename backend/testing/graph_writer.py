@@ -0,0 +1,263 @@
+"""
+Bulk Neo4j writer for extracted graph documents and photo embeddings.
+
+Neo4jGraph.add_graph_documents issues two queries per document and
+Neo4jVector adds another round of writes for the vectors. For large ingests
+the database round-trips dominate, so this writer collects every node,
+relationship, MENTIONS link and embedding row, sends them as parameterized
+UNWIND batches and commits them in a few large transactions. Constraints and
+indexes are created once up front.
+"""
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+BASE_ENTITY_LABEL = "__Entity__"
+
+
+def _clean(name: str) -> str:
+    return name.replace("`", "")
+
+
+def _relationship_type(name: str) -> str:
+    return _clean(name.replace(" ", "_").upper())
+
+
+class BulkGraphWriter:
+    """
+    Writes graph documents and embedding rows with batched UNWIND statements.
+
+    session_factory returns a neo4j Session-like object (a context manager
+    with run() and execute_write()); by default it is built from the
+    Neo4jGraph driver. The statements, transactions and round_trips counters
+    record how much database traffic a write caused.
+    """
+
+    def __init__(self, session_factory: Callable[[], Any],
+                 batch_size: int = 1000, rows_per_transaction: int = 20000,
+                 index_name: str = "photo_vectors",
+                 keyword_index_name: str = "photo_keywords",
+                 document_label: str = "Document", chunk_label: str = "Chunk",
+                 entity_label: str = BASE_ENTITY_LABEL):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.rows_per_transaction = rows_per_transaction
+        self.index_name = index_name
+        self.keyword_index_name = keyword_index_name
+        self.document_label = document_label
+        self.chunk_label = chunk_label
+        self.entity_label = entity_label
+        self.schema_ready = False
+        self.statements = 0
+        self.transactions = 0
+
+    @classmethod
+    def for_graph(cls, graph, **kwargs) -> "BulkGraphWriter":
+        """
+        Writer sharing the driver of a langchain Neo4jGraph
+        """
+        return cls(lambda: graph._driver.session(database=graph._database),
+                   **kwargs)
+
+    @property
+    def round_trips(self) -> int:
+        # Every statement is one round-trip and every commit another
+        return self.statements + self.transactions
+
+    def schema_statements(self, dimension: int) -> List[Tuple[str, Dict]]:
+        # Named after their label so drop_statements can find them again
+        return [
+            (f"CREATE CONSTRAINT `{self.entity_label}_id` IF NOT EXISTS "
+             f"FOR (n:`{self.entity_label}`) REQUIRE n.id IS UNIQUE", {}),
+            (f"CREATE CONSTRAINT `{self.document_label}_id` IF NOT EXISTS "
+             f"FOR (d:`{self.document_label}`) REQUIRE d.id IS UNIQUE", {}),
+            (f"CREATE CONSTRAINT `{self.chunk_label}_id` IF NOT EXISTS "
+             f"FOR (c:`{self.chunk_label}`) REQUIRE c.id IS UNIQUE", {}),
+            (f"CREATE INDEX `{self.document_label}_filename` IF NOT EXISTS "
+             f"FOR (d:`{self.document_label}`) ON (d.filename)", {}),
+            (f"CREATE INDEX `{self.chunk_label}_filename` IF NOT EXISTS "
+             f"FOR (c:`{self.chunk_label}`) ON (c.filename)", {}),
+            (f"CREATE VECTOR INDEX {self.index_name} IF NOT EXISTS "
+             f"FOR (c:`{self.chunk_label}`) ON c.embedding "
+             "OPTIONS { indexConfig: { "
+             "`vector.dimensions`: toInteger($dimension), "
+             "`vector.similarity_function`: 'cosine' }}",
+             {"dimension": dimension}),
+            (f"CREATE FULLTEXT INDEX {self.keyword_index_name} IF NOT EXISTS "
+             f"FOR (n:`{self.chunk_label}`) ON EACH [n.text]", {}),
+        ]
+
+    def drop_statements(self) -> List[str]:
+        """
+        Statements removing everything schema_statements creates
+        """
+        return [
+            f"DROP INDEX `{self.index_name}` IF EXISTS",
+            f"DROP INDEX `{self.keyword_index_name}` IF EXISTS",
+            f"DROP INDEX `{self.document_label}_filename` IF EXISTS",
+            f"DROP INDEX `{self.chunk_label}_filename` IF EXISTS",
+        ] + [
+            f"DROP CONSTRAINT `{label}_id` IF EXISTS"
+            for label in (self.entity_label, self.document_label, self.chunk_label)
+        ]
+
+    def ensure_schema(self, dimension: int):
+        """
+        Create constraints and indexes once; later calls are free
+        """
+        if self.schema_ready:
+            return
+        with self.session_factory() as session:
+            for query, params in self.schema_statements(dimension):
+                session.run(query, params).consume()
+                self.statements += 1
+        self.schema_ready = True
+
+    def write(self, graph_documents: Sequence[Any], documents: Sequence[Any],
+              vectors: Sequence[Sequence[float]]) -> Dict:
+        """
+        Write the extracted graph documents plus one Chunk (text, metadata,
+        embedding) per document, in as few transactions as the configured
+        rows_per_transaction allows. Returns the statement/transaction counts
+        for this write.
+        """
+        statements_before = self.statements
+        transactions_before = self.transactions
+        if vectors:
+            self.ensure_schema(len(vectors[0]))
+
+        statements = self.plan(graph_documents, documents, vectors)
+        for transaction in self._pack(statements):
+            def work(tx, transaction=transaction):
+                for query, rows in transaction:
+                    tx.run(query, {"rows": rows}).consume()
+            with self.session_factory() as session:
+                session.execute_write(work)
+            self.statements += len(transaction)
+            self.transactions += 1
+
+        return {
+            "statements": self.statements - statements_before,
+            "transactions": self.transactions - transactions_before
+        }
+
+    def plan(self, graph_documents: Sequence[Any], documents: Sequence[Any],
+             vectors: Sequence[Sequence[float]]) -> List[Tuple[str, List[Dict]]]:
+        """
+        Group everything to write into (query, rows) UNWIND batches, in
+        dependency order: documents, entities, MENTIONS, relationships, chunks
+        """
+        document_rows: Dict[str, Dict] = {}
+        entity_rows: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        mention_rows: List[Dict] = []
+        relationship_rows: Dict[str, List[Dict]] = defaultdict(list)
+
+        for graph_document in graph_documents:
+            source = graph_document.source
+            doc_id = source.metadata["id"]
+            document_rows[doc_id] = {
+                "id": doc_id,
+                "text": source.page_content,
+                "metadata": source.metadata
+            }
+            for node in graph_document.nodes:
+                label = _clean(node.type)
+                row = entity_rows[label].setdefault(
+                    node.id, {"id": node.id, "properties": {}})
+                row["properties"].update(node.properties)
+                mention_rows.append({"document": doc_id, "entity": node.id})
+            for rel in graph_document.relationships:
+                relationship_rows[_relationship_type(rel.type)].append({
+                    "source": rel.source.id,
+                    "target": rel.target.id,
+                    "photo": source.metadata.get("filename"),
+                    "properties": rel.properties
+                })
+
+        chunk_rows = [
+            {
+                "id": doc.metadata["id"],
+                "text": doc.page_content,
+                "metadata": doc.metadata,
+                "embedding": list(vector)
+            }
+            for doc, vector in zip(documents, vectors)
+        ]
+
+        statements: List[Tuple[str, List[Dict]]] = []
+        statements += self._batches(self._document_query(),
+                                    list(document_rows.values()))
+        for label, rows in entity_rows.items():
+            statements += self._batches(self._entity_query(label),
+                                        list(rows.values()))
+        statements += self._batches(self._mention_query(), mention_rows)
+        for rel_type, rows in relationship_rows.items():
+            statements += self._batches(self._relationship_query(rel_type), rows)
+        statements += self._batches(self._chunk_query(), chunk_rows)
+        return statements
+
+    def _batches(self, query: str, rows: List[Dict]) -> List[Tuple[str, List[Dict]]]:
+        return [(query, rows[i:i + self.batch_size])
+                for i in range(0, len(rows), self.batch_size)]
+
+    def _pack(self, statements: Iterable[Tuple[str, List[Dict]]]
+              ) -> List[List[Tuple[str, List[Dict]]]]:
+        transactions, current, rows = [], [], 0
+        for statement in statements:
+            if current and rows + len(statement[1]) > self.rows_per_transaction:
+                transactions.append(current)
+                current, rows = [], 0
+            current.append(statement)
+            rows += len(statement[1])
+        if current:
+            transactions.append(current)
+        return transactions
+
+    # Cypher
+
+    def _document_query(self) -> str:
+        return (
+            "UNWIND $rows AS row "
+            f"MERGE (d:`{self.document_label}` {{id: row.id}}) "
+            "SET d.text = row.text "
+            "SET d += row.metadata"
+        )
+
+    def _entity_query(self, label: str) -> str:
+        return (
+            "UNWIND $rows AS row "
+            f"MERGE (n:`{self.entity_label}` {{id: row.id}}) "
+            "SET n += row.properties "
+            f"SET n:`{label}`"
+        )
+
+    def _mention_query(self) -> str:
+        return (
+            "UNWIND $rows AS row "
+            f"MATCH (d:`{self.document_label}` {{id: row.document}}) "
+            f"MATCH (n:`{self.entity_label}` {{id: row.entity}}) "
+            "MERGE (d)-[:MENTIONS]->(n)"
+        )
+
+    def _relationship_query(self, rel_type: str) -> str:
+        return (
+            "UNWIND $rows AS row "
+            f"MERGE (s:`{self.entity_label}` {{id: row.source}}) "
+            f"MERGE (t:`{self.entity_label}` {{id: row.target}}) "
+            f"MERGE (s)-[r:`{rel_type}`]->(t) "
+            "SET r += row.properties "
+            # Photos whose extraction produced the relationship, so removing
+            # a photo can drop the edges only it contributed
+            "SET r.sources = coalesce(r.sources, []) + "
+            "[p IN [row.photo] WHERE p IS NOT NULL "
+            "AND NOT p IN coalesce(r.sources, [])]"
+        )
+
+    def _chunk_query(self) -> str:
+        return (
+            "UNWIND $rows AS row "
+            f"MERGE (c:`{self.chunk_label}` {{id: row.id}}) "
+            "SET c.text = row.text "
+            "SET c += row.metadata "
+            "WITH c, row "
+            "CALL db.create.setNodeVectorProperty(c, 'embedding', row.embedding)"
+        )
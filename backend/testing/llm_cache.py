@@ -0,0 +1,277 @@
+"""
+Persistent content-addressed cache for LLM graph extractions and embeddings.
+
+Entries are keyed on (model name, prompt/schema signature, description hash)
+and stored in a local SQLite file, so rebuilding the knowledge graph from
+descriptions that have not changed makes no remote LLM or embedding calls.
+The cache is bounded by entry count and evicts the least recently used rows.
+
+Search queries are embedded through QueryEmbeddings instead, a small
+in-memory LRU: arbitrary user queries would otherwise write to SQLite on the
+hot path and evict the extraction entries the disk cache exists to keep.
+"""
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_community.graphs.graph_document import GraphDocument
+
+
+def content_key(*parts: str) -> str:
+    """
+    Stable cache key for the given parts
+    """
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ContentCache:
+    """
+    Size-bounded LRU cache backed by SQLite.
+
+    Every entry belongs to a kind ("graph", "embedding") and carries the
+    signature it was produced under, so entries written for an older
+    extraction schema can be dropped with invalidate(kind, keep_signature).
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                value BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self._conn.commit()
+
+    def get(self, kind: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?",
+                (time.time(), key))
+            self._conn.commit()
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return row[0]
+
+    def get_many(self, kind: str, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Look up several keys in one statement; missing keys are left out
+        """
+        if not keys:
+            return {}
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})",
+                    chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found])
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits[kind] = self.hits.get(kind, 0) + hits
+            self.misses[kind] = self.misses.get(kind, 0) + len(keys) - hits
+        return found
+
+    def put(self, kind: str, key: str, value: bytes, signature: str = ""):
+        self.put_many(kind, {key: value}, signature)
+
+    def put_many(self, kind: str, values: Dict[str, bytes], signature: str = ""):
+        if not values:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                [(key, kind, signature, value, now)
+                 for key, value in values.items()])
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_access LIMIT ?
+                )
+            """, (count - self.max_entries,))
+
+    def invalidate(self, kind: Optional[str] = None,
+                   keep_signature: Optional[str] = None) -> int:
+        """
+        Drop entries of the given kind (all kinds if None). With keep_signature
+        only entries produced under a different signature are removed.
+        """
+        query, params = "DELETE FROM entries WHERE 1 = 1", []
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        if keep_signature is not None:
+            query += " AND signature != ?"
+            params.append(keep_signature)
+        with self._lock:
+            removed = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses)
+        }
+
+
+def cached_extraction(process_document: Callable[[Any], GraphDocument],
+                      cache: ContentCache,
+                      signature: str) -> Callable[[Any], GraphDocument]:
+    """
+    Wrap a per-document graph extraction so results are served from the cache.
+    Only nodes and relationships are cached; the source is always the caller's
+    document so identical descriptions under different filenames stay apart.
+    """
+    def process(document) -> GraphDocument:
+        key = content_key("graph", signature, document.metadata.get(
+            "content_hash") or content_key(document.page_content))
+        cached = cache.get("graph", key)
+        if cached is not None:
+            nodes, relationships = pickle.loads(cached)
+            return GraphDocument(nodes=nodes, relationships=relationships,
+                                 source=document)
+
+        graph_document = process_document(document)
+        cache.put("graph", key, pickle.dumps(
+            (graph_document.nodes, graph_document.relationships)), signature)
+        return graph_document
+
+    return process
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from the cache and sends
+    only the misses to the underlying model, in a single batched call.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: ContentCache,
+                 model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(
+            embeddings, "model", type(embeddings).__name__)
+        # Calls (and texts) actually sent to the underlying model
+        self.remote_calls = 0
+        self.remote_texts = 0
+
+    def _key(self, text: str) -> str:
+        return content_key("embedding", self.model_name, content_key(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self.cache.get_many("embedding", keys)
+
+        missing = list(dict.fromkeys(
+            text for text, key in zip(texts, keys) if key not in cached))
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            self.remote_calls += 1
+            self.remote_texts += len(missing)
+            fresh = {
+                self._key(text): array("f", vector).tobytes()
+                for text, vector in zip(missing, vectors)
+            }
+            self.cache.put_many("embedding", fresh, self.model_name)
+            cached.update(fresh)
+
+        return [array("f", cached[key]).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class QueryEmbeddings(Embeddings):
+    """
+    In-memory LRU of search query embeddings, bounded by max_entries; misses
+    are sent to the underlying model in a single batched call
+    """
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = 4096):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.remote_calls = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get(text)
+                if vector is not None:
+                    self._entries.move_to_end(text)
+                    found[text] = vector
+            hits = sum(1 for text in texts if text in found)
+            self.hits += hits
+            self.misses += len(texts) - hits
+
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            with self._lock:
+                self.remote_calls += 1
+                for text, vector in zip(missing, vectors):
+                    found[text] = vector
+                    if self.max_entries:
+                        self._entries[text] = vector
+                        self._entries.move_to_end(text)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return [found[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
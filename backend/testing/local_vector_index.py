@@ -0,0 +1,390 @@
+"""
+In-process NumPy vector index used as a read-path accelerator for
+PhotoGraphRAG.
+
+Neo4j stays the source of truth: the index holds a copy of the photo
+description embeddings written to photo_vectors, kept in sync by the ingest
+path, and answers top-k cosine queries with vectorized dot products instead of
+a Bolt round-trip. The float32 matrix is persisted as a .npy file and memory
+mapped on load. For larger collections an optional IVF mode (k-means coarse
+quantizer) restricts each query to the nprobe closest lists.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class _Snapshot:
+    """
+    Immutable view of the index; readers never see a half-applied update.
+
+    Rows are only ever appended: a replaced or removed photo keeps its row,
+    marked in dead, until the index is compacted.
+    """
+
+    def __init__(self, filenames: List[str], texts: List[str],
+                 matrix: np.ndarray, centroids: Optional[np.ndarray] = None,
+                 lists: Optional[List[np.ndarray]] = None,
+                 dead: Optional[np.ndarray] = None):
+        self.filenames = filenames
+        self.texts = texts
+        self.matrix = matrix
+        self.centroids = centroids
+        self.lists = lists
+        self.dead = dead
+        self.size = len(filenames) - (int(dead.sum()) if dead is not None else 0)
+
+    def live_rows(self) -> np.ndarray:
+        if self.dead is None:
+            return np.arange(len(self.filenames))
+        return np.flatnonzero(~self.dead)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest scores along the last axis, best first
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def _score(cosine: float) -> float:
+    """
+    Cosine similarity on Neo4j's vector index scale
+    """
+    return (1.0 + float(cosine)) / 2.0
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped float32 embedding matrix with exact or IVF top-k search.
+
+    Upserts append rows to a preallocated buffer and to the IVF lists of
+    their nearest centroids; replaced and removed rows are masked until they
+    make up compact_ratio of the matrix. The coarse quantizer is trained
+    once the index reaches ivf_min_size and retrained only after it grows by
+    ivf_retrain_growth. Changes are written to disk by flush(), which the
+    caller runs once per ingest.
+    """
+
+    def __init__(self, path: Optional[str] = None, ivf_lists: int = 0,
+                 nprobe: int = 8, ivf_min_size: int = 10000,
+                 query_batch_size: int = 64, ivf_retrain_growth: float = 2.0,
+                 compact_ratio: float = 0.25):
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.ivf_min_size = ivf_min_size
+        self.query_batch_size = query_batch_size
+        self.ivf_retrain_growth = ivf_retrain_growth
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot([], [], np.zeros((0, 0), dtype=np.float32))
+        # Writer state: row storage with spare capacity, the live row of
+        # each filename and the size the IVF quantizer was trained at
+        self._buffer = self._snapshot.matrix
+        self._rows: Dict[str, int] = {}
+        self._trained_size = 0
+        self._unsaved = False
+
+    def __len__(self) -> int:
+        return self._snapshot.size
+
+    @property
+    def dimension(self) -> int:
+        return self._snapshot.matrix.shape[1] if len(self) else 0
+
+    # Persistence
+
+    def _files(self) -> Tuple[str, str]:
+        return f"{self.path}.npy", f"{self.path}.json"
+
+    def load(self) -> bool:
+        """
+        Memory-map a previously saved index; returns False if there is none
+        """
+        if not self.path:
+            return False
+        matrix_file, meta_file = self._files()
+        if not (os.path.exists(matrix_file) and os.path.exists(meta_file)):
+            return False
+        with open(meta_file) as f:
+            meta = json.load(f)
+        matrix = np.load(matrix_file, mmap_mode="r")
+        if matrix.shape[0] != len(meta["filenames"]):
+            return False
+        with self._lock:
+            self._reset(meta["filenames"], meta["texts"], matrix)
+            self._unsaved = False
+        return True
+
+    def save(self):
+        """
+        Write the live rows to disk
+        """
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = self._snapshot
+            self._unsaved = False
+        rows = snapshot.live_rows()
+        matrix = np.asarray(snapshot.matrix)
+        if snapshot.dead is not None:
+            matrix = matrix[rows]
+        matrix_file, meta_file = self._files()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(matrix_file)), exist_ok=True)
+            # Write to temporary files and swap so a crash never leaves a torn index
+            np.save(matrix_file + ".tmp.npy", matrix)
+            with open(meta_file + ".tmp", "w") as f:
+                json.dump({"filenames": [snapshot.filenames[i] for i in rows],
+                           "texts": [snapshot.texts[i] for i in rows]}, f)
+            os.replace(matrix_file + ".tmp.npy", matrix_file)
+            os.replace(meta_file + ".tmp", meta_file)
+        except BaseException:
+            self._unsaved = True
+            raise
+
+    def flush(self):
+        """
+        Save the index if it changed since it was last loaded or saved
+        """
+        if self._unsaved:
+            self.save()
+
+    # Mutation, mirrored from the ingest path
+
+    def replace_all(self, filenames: Sequence[str], texts: Sequence[str],
+                    vectors: Sequence[Sequence[float]]):
+        matrix = _normalize(vectors) if len(filenames) else \
+            np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            self._reset(list(filenames), list(texts), matrix)
+        self.save()
+
+    def upsert(self, filenames: Sequence[str], texts: Sequence[str],
+               vectors: Sequence[Sequence[float]]):
+        if not filenames:
+            return
+        new_rows = _normalize(vectors)
+        with self._lock:
+            current = self._snapshot
+            if not current.size:
+                self._reset(list(filenames), list(texts), new_rows)
+                self._unsaved = True
+                return
+            dead = self._mark_dead(current, filenames)
+            start = len(current.filenames)
+            end = start + len(filenames)
+            # Rows past the end of the current snapshot are invisible to its
+            # readers, so they can be written into the shared buffer
+            if end > self._buffer.shape[0]:
+                buffer = np.empty((max(end, 2 * self._buffer.shape[0]),
+                                   self._buffer.shape[1]), dtype=np.float32)
+                buffer[:start] = current.matrix
+                self._buffer = buffer
+            self._buffer[start:end] = new_rows
+            for row, filename in enumerate(filenames, start=start):
+                self._rows[filename] = row
+            dead = np.concatenate([dead, np.zeros(len(filenames), dtype=bool)])
+
+            centroids, lists = current.centroids, current.lists
+            if centroids is not None:
+                lists = list(lists)
+                assignment = np.argmax(new_rows @ centroids.T, axis=1)
+                for c in np.unique(assignment):
+                    lists[c] = np.concatenate(
+                        [lists[c], start + np.flatnonzero(assignment == c)])
+            self._publish(current.filenames + list(filenames),
+                          current.texts + list(texts),
+                          self._buffer[:end], centroids, lists, dead)
+
+    def remove(self, filenames: Iterable[str]):
+        with self._lock:
+            current = self._snapshot
+            removed = [f for f in filenames if f in self._rows]
+            if not removed:
+                return
+            dead = self._mark_dead(current, removed)
+            self._publish(current.filenames, current.texts, current.matrix,
+                          current.centroids, current.lists, dead)
+
+    def clear(self):
+        self.replace_all([], [], [])
+
+    def delete(self):
+        """
+        Empty the index and remove its files, e.g. for a retired graph version
+        """
+        with self._lock:
+            self._reset([], [], np.zeros((0, 0), dtype=np.float32))
+            self._unsaved = False
+        if self.path:
+            for file in self._files():
+                if os.path.exists(file):
+                    os.remove(file)
+
+    def _mark_dead(self, current: _Snapshot, filenames: Iterable[str]) -> np.ndarray:
+        """
+        A copy of the snapshot's dead mask with the rows of filenames set
+        """
+        dead = current.dead.copy() if current.dead is not None else \
+            np.zeros(len(current.filenames), dtype=bool)
+        for filename in filenames:
+            row = self._rows.pop(filename, None)
+            if row is not None:
+                dead[row] = True
+        return dead
+
+    def _publish(self, filenames: List[str], texts: List[str], matrix: np.ndarray,
+                 centroids: Optional[np.ndarray], lists: Optional[List[np.ndarray]],
+                 dead: np.ndarray):
+        """
+        Swap in the snapshot after a mutation, compacting or (re)training the
+        quantizer first when a threshold is crossed
+        """
+        self._unsaved = True
+        snapshot = _Snapshot(filenames, texts, matrix, centroids, lists,
+                             dead if dead.any() else None)
+        if not snapshot.size:
+            self._reset([], [], np.zeros((0, 0), dtype=np.float32))
+            return
+        if self.ivf_lists and snapshot.size >= self.ivf_min_size and (
+                centroids is None
+                or snapshot.size >= self._trained_size * self.ivf_retrain_growth):
+            rows = snapshot.live_rows()
+            self._reset([filenames[i] for i in rows], [texts[i] for i in rows],
+                        np.asarray(matrix)[rows])
+            return
+        if len(filenames) - snapshot.size > self.compact_ratio * len(filenames):
+            snapshot = self._compact(snapshot)
+        self._snapshot = snapshot
+
+    def _compact(self, snapshot: _Snapshot) -> _Snapshot:
+        """
+        Drop the dead rows, renumbering the IVF lists rather than retraining
+        """
+        rows = snapshot.live_rows()
+        self._buffer = np.asarray(snapshot.matrix)[rows]
+        filenames = [snapshot.filenames[i] for i in rows]
+        self._rows = {filename: i for i, filename in enumerate(filenames)}
+        lists = None
+        if snapshot.centroids is not None:
+            renumber = np.cumsum(~snapshot.dead) - 1
+            lists = [renumber[l[~snapshot.dead[l]]] for l in snapshot.lists]
+        return _Snapshot(filenames, [snapshot.texts[i] for i in rows],
+                         self._buffer, snapshot.centroids, lists)
+
+    def _reset(self, filenames: List[str], texts: List[str], matrix: np.ndarray):
+        """
+        Replace the whole index, training the quantizer if it is large enough
+        """
+        self._buffer = matrix
+        self._rows = {filename: i for i, filename in enumerate(filenames)}
+        self._trained_size = 0
+        if self.ivf_lists and len(filenames) >= self.ivf_min_size:
+            centroids, lists = self._train_ivf(np.asarray(matrix))
+            self._trained_size = len(filenames)
+            self._snapshot = _Snapshot(filenames, texts, matrix, centroids, lists)
+        else:
+            self._snapshot = _Snapshot(filenames, texts, matrix)
+
+    def _train_ivf(self, matrix: np.ndarray, iterations: int = 10,
+                   sample_size: int = 50000):
+        """
+        Spherical k-means on a sample of the rows, then assign every row
+        """
+        rng = np.random.default_rng(0)
+        n_lists = min(self.ivf_lists, matrix.shape[0])
+        sample = matrix
+        if matrix.shape[0] > sample_size:
+            sample = matrix[rng.choice(matrix.shape[0], sample_size, replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignment = np.concatenate([
+            np.argmax(matrix[i:i + 8192] @ centroids.T, axis=1)
+            for i in range(0, matrix.shape[0], 8192)
+        ])
+        lists = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+        return centroids, lists
+
+    # Queries
+
+    def search(self, vector: Sequence[float], k: int = 5) -> List[Tuple[str, str, float]]:
+        """
+        Top-k (filename, text, score) for one query embedding. Scores are
+        (1 + cosine) / 2 in [0, 1], like Neo4j's cosine vector index.
+        """
+        return self.search_batch([vector], k)[0]
+
+    def search_batch(self, vectors: Sequence[Sequence[float]],
+                     k: int = 5) -> List[List[Tuple[str, str, float]]]:
+        """
+        Top-k for many query embeddings with one matrix product per batch
+        """
+        snapshot = self._snapshot
+        if not snapshot.size or not len(vectors):
+            return [[] for _ in vectors]
+        queries = _normalize(vectors)
+        if snapshot.centroids is not None:
+            return [self._search_ivf(snapshot, q, k) for q in queries]
+
+        k = min(k, snapshot.size)
+        results = []
+        for start in range(0, len(queries), self.query_batch_size):
+            block = queries[start:start + self.query_batch_size]
+            scores = block @ snapshot.matrix.T
+            if snapshot.dead is not None:
+                scores[:, snapshot.dead] = -np.inf
+            for row, indices in zip(scores, _top_k(scores, k)):
+                results.append([
+                    (snapshot.filenames[i], snapshot.texts[i], _score(row[i]))
+                    for i in indices
+                ])
+        return results
+
+    def _search_ivf(self, snapshot: _Snapshot, query: np.ndarray,
+                    k: int) -> List[Tuple[str, str, float]]:
+        probes = _top_k(snapshot.centroids @ query, self.nprobe)
+        candidates = np.concatenate([snapshot.lists[p] for p in probes])
+        if snapshot.dead is not None:
+            candidates = candidates[~snapshot.dead[candidates]]
+        if not len(candidates):
+            return []
+        candidates.sort()
+        scores = snapshot.matrix[candidates] @ query
+        return [
+            (snapshot.filenames[candidates[i]], snapshot.texts[candidates[i]],
+             _score(scores[i]))
+            for i in _top_k(scores, k)
+        ]
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "size": snapshot.size,
+            "dimension": self.dimension,
+            "mode": "ivf" if snapshot.centroids is not None else "exact",
+            "path": self.path
+        }
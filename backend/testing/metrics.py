@@ -0,0 +1,148 @@
+"""
+Stage-level latency instrumentation for the GraphRAG service.
+
+A MetricsRegistry holds latency histograms and counters keyed by metric name
+and labels, plus collectors that report values owned elsewhere (cache hit
+counts, index sizes) at scrape time. render() produces the Prometheus text
+exposition format served by /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, labels, value) reported by a collector
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe histograms, counters and scrape-time collectors
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float,
+                labels: Optional[Dict[str, str]] = None):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0,
+            labels: Optional[Dict[str, str]] = None):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    @contextmanager
+    def stage(self, stage: str, timings: Optional[Dict[str, float]] = None,
+              **labels: str):
+        """
+        Time a block as graphrag_stage_seconds{stage=...}; when a timings dict
+        is given the duration (ms) is also added to it under the stage name
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("graphrag_stage_seconds", elapsed,
+                         {"stage": stage, **labels})
+            if timings is not None:
+                timings[stage] = round(
+                    timings.get(stage, 0.0) + elapsed * 1000, 3)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: Optional[str] = None):
+            lines.append(f"# HELP {name} {help_text or self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = {n: dict(s) for n, s in self._histograms.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for labels, hist in sorted(histograms[name].items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f"{name}_bucket"
+                                 f"{_format_labels(labels, {'le': repr(bound)})} {count}")
+                lines.append(f"{name}_bucket"
+                             f"{_format_labels(labels, {'le': '+Inf'})} {hist.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+
+        # Collected samples may extend a counter that is also incremented here
+        collected: Dict[str, Tuple[str, str, List[Tuple[Labels, float]]]] = {}
+        for name, series in counters.items():
+            collected[name] = ("counter", self._help.get(name, name),
+                               sorted(series.items()))
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                entry = collected.setdefault(
+                    name, (kind, self._help.get(name, help_text), []))
+                entry[2].append((_labels(labels), value))
+        for name in sorted(collected):
+            kind, help_text, samples = collected[name]
+            header(name, kind, help_text)
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
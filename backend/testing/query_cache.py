@@ -0,0 +1,175 @@
+"""
+Two-level result cache in front of PhotoGraphRAG.search_photos.
+
+Level one is an exact cache keyed on the normalized query text within a
+namespace (the search mode). Level two is a semantic cache that reuses a
+previous answer when the query embedding is within a cosine similarity
+threshold of a cached query. Both levels share TTL and LRU eviction, and clear() bumps a generation counter so that answers computed
+against a knowledge graph that has since been rebuilt are never stored.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case-fold, collapse whitespace and drop surrounding punctuation
+    """
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" .,!?;:\"'")
+
+
+class QueryResultCache:
+    """
+    Thread-safe exact + semantic cache with TTL and LRU eviction
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0,
+                 similarity_threshold: float = 0.95,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.generation = 0
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # Stacked unit embeddings of the cached queries, rebuilt lazily
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity_threshold <= 1.0
+
+    def get(self, query: str, namespace: str = "") -> Optional[Dict]:
+        """
+        Exact lookup; returns {"value", "cache"} or None
+        """
+        key = self._key(query, namespace)
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                # With semantic matching on, get_similar() records the miss
+                if not self.semantic_enabled:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits["exact"] += 1
+            return self._hit(entry, "exact", 1.0)
+
+    def get_similar(self, embedding: Sequence[float],
+                    namespace: str = "") -> Optional[Dict]:
+        """
+        Semantic lookup against every live cached query embedding in the
+        namespace
+        """
+        if not self.semantic_enabled:
+            return None
+        vector = self._unit(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._rebuild_matrix()
+            if not self._matrix_keys:
+                self.misses += 1
+                return None
+            scores = self._matrix @ vector
+            for index in np.argsort(-scores):
+                similarity = float(scores[index])
+                if similarity < self.similarity_threshold:
+                    break
+                key = self._matrix_keys[index]
+                entry = self._live_entry(key)
+                if entry is None or entry["namespace"] != namespace:
+                    continue
+                self._entries.move_to_end(key)
+                self.hits["semantic"] += 1
+                return self._hit(entry, "semantic", similarity)
+            self.misses += 1
+            return None
+
+    def put(self, query: str, value: Any,
+            embedding: Optional[Sequence[float]] = None,
+            generation: Optional[int] = None, namespace: str = ""):
+        """
+        Store a result. Results computed under an older generation (i.e.
+        before the last clear()) are dropped.
+        """
+        key = self._key(query, namespace)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = {
+                "query": query,
+                "namespace": namespace,
+                "value": value,
+                "embedding": None if embedding is None else self._unit(embedding),
+                "stored_at": self._clock()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+            self.generation += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "generation": self.generation,
+                "hits": dict(self.hits),
+                "misses": self.misses
+            }
+
+    @staticmethod
+    def _key(query: str, namespace: str) -> str:
+        return f"{namespace}\x1f{normalize_query(query)}"
+
+    def _live_entry(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._clock() - entry["stored_at"] > self.ttl:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        return entry
+
+    def _hit(self, entry: Dict, kind: str, similarity: float) -> Dict:
+        return {
+            "value": entry["value"],
+            "cache": {
+                "hit": True,
+                "type": kind,
+                "similarity": round(similarity, 4),
+                "matched_query": entry["query"],
+                "age_seconds": round(self._clock() - entry["stored_at"], 2)
+            }
+        }
+
+    def _rebuild_matrix(self):
+        keys = [k for k, e in self._entries.items() if e["embedding"] is not None]
+        self._matrix_keys = keys
+        if keys:
+            self._matrix = np.stack([self._entries[k]["embedding"] for k in keys])
+        else:
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
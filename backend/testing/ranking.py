@@ -0,0 +1,107 @@
+"""
+Local ranking helpers for the retrieval-only search path and for parsing the
+LLM re-ranking answer into structured output.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Standard reciprocal rank fusion constant; dampens the weight of top ranks
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(ranked_lists: Dict[str, Sequence[str]],
+                           k: int = RRF_K,
+                           weights: Optional[Dict[str, float]] = None
+                           ) -> Dict[str, Dict]:
+    """
+    Fuse several best-first lists of filenames.
+
+    Returns {filename: {"score", "sources"}} where score is the weighted sum
+    of 1 / (k + rank) over every list the filename appears in.
+    """
+    fused: Dict[str, Dict] = {}
+    for source, filenames in ranked_lists.items():
+        weight = (weights or {}).get(source, 1.0)
+        seen = set()
+        for rank, filename in enumerate(filenames, start=1):
+            if filename is None or filename in seen:
+                continue
+            seen.add(filename)
+            entry = fused.setdefault(filename, {"score": 0.0, "sources": []})
+            entry["score"] += weight / (k + rank)
+            entry["sources"].append(source)
+    return fused
+
+
+def apply_neighbour_boost(fused: Dict[str, Dict], shared: Dict[str, float],
+                          weight: float = 0.5, k: int = RRF_K):
+    """
+    Boost photos that share graph entities with the top results. shared maps
+    filename -> number (or weight) of shared entities; the best connected
+    neighbour gets weight / (k + 1), i.e. a fraction of a first-place vote.
+    """
+    if not shared:
+        return
+    top = max(shared.values())
+    if top <= 0:
+        return
+    for filename, count in shared.items():
+        entry = fused.setdefault(filename, {"score": 0.0, "sources": []})
+        entry["score"] += weight * (count / top) / (k + 1)
+        entry["sources"].append("neighbour")
+
+
+def ranked(fused: Dict[str, Dict], limit: Optional[int] = None) -> List[Dict]:
+    """
+    Fused scores as a best-first list of {"filename", "score", "sources"}
+    """
+    results = [
+        {"filename": filename, "score": round(entry["score"], 6),
+         "sources": entry["sources"]}
+        for filename, entry in fused.items()
+    ]
+    results.sort(key=lambda r: (-r["score"], r["filename"]))
+    return results[:limit] if limit else results
+
+
+def _bracketed_list(value: str) -> List[str]:
+    value = value.strip().strip("[]")
+    return [item.strip().strip("'\"") for item in value.split(",")
+            if item.strip().strip("'\"")]
+
+
+def parse_rerank_output(text: str) -> Dict:
+    """
+    Split the LLM answer ("Filename: [...]", "Primary Match Factors:",
+    "Detailed Reasoning:") into filenames, match factors and reasoning
+    """
+    filenames: List[str] = []
+    factors: List[str] = []
+    reasoning: List[str] = []
+    section = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("Filename:"):
+            filenames = _bracketed_list(stripped.split(":", 1)[1])
+            section = None
+        elif stripped.startswith("Primary Match Factors:"):
+            section = "factors"
+        elif stripped.startswith("Detailed Reasoning:"):
+            section = "reasoning"
+            rest = stripped.split(":", 1)[1].strip()
+            if rest:
+                reasoning.append(rest)
+        elif section == "factors" and stripped.startswith("-"):
+            factors.extend(_bracketed_list(stripped[1:]) if "[" in stripped
+                           else [stripped[1:].strip()])
+        elif section == "reasoning" and stripped:
+            reasoning.append(stripped)
+    return {
+        "filenames": filenames,
+        "match_factors": factors,
+        "reasoning": " ".join(reasoning)
+    }
+
+
+def filenames_from_rows(rows: Iterable[Dict]) -> List[str]:
+    return [row.get("filename") for row in rows if row.get("filename")]
+
@@ -0,0 +1,166 @@
+"""
+Concurrency controls for serving PhotoGraphRAG from a threaded WSGI server.
+
+AdmissionController bounds how many requests are worked on at once and how
+many may wait for a slot. Past that, callers are turned away with Overloaded
+(429 when the wait queue is full, 503 when no slot frees up in time) instead
+of piling up behind slow LLM calls. NotReady is the same kind of answer for
+requests that arrive before the backends are connected. ReadWriteLock lets
+any number of searches run together while a reset, which empties the graph,
+runs alone.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class Overloaded(Exception):
+    """
+    The request was rejected to protect the service; status is the HTTP
+    status to answer with and retry_after a hint in seconds
+    """
+
+    def __init__(self, message: str, status: int = 503,
+                 retry_after: float = 1.0):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class NotReady(Overloaded):
+    """
+    The backends are not connected yet (or any more); retry_after is when
+    the next connection attempt is due
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message, status=503, retry_after=retry_after)
+
+
+class AdmissionController:
+    """
+    At most max_in_flight callers inside admit() at a time, at most
+    max_queue more waiting up to queue_timeout seconds for a slot
+    """
+
+    def __init__(self, max_in_flight: int = 64, max_queue: int = 128,
+                 queue_timeout: float = 5.0, name: str = "requests"):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        with self._cond:
+            if self._in_flight >= self.max_in_flight:
+                if self._waiting >= self.max_queue:
+                    self.rejected["queue_full"] += 1
+                    raise Overloaded(
+                        f"Too many concurrent {self.name}, try again later",
+                        status=429, retry_after=self.queue_timeout)
+                self._waiting += 1
+                try:
+                    if not self._cond.wait_for(
+                            lambda: self._in_flight < self.max_in_flight,
+                            self.queue_timeout):
+                        self.rejected["timeout"] += 1
+                        raise Overloaded(
+                            f"Timed out waiting for a free slot for {self.name}",
+                            status=503, retry_after=self.queue_timeout)
+                finally:
+                    self._waiting -= 1
+            self._in_flight += 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected)
+            }
+
+    def collect(self):
+        """
+        Metrics collector (see MetricsRegistry.register_collector)
+        """
+        stats = self.stats()
+        labels = {"pool": self.name}
+        yield ("graphrag_requests_in_flight", "gauge",
+               "Requests being served", labels, stats["in_flight"])
+        yield ("graphrag_requests_waiting", "gauge",
+               "Requests waiting for a slot", labels, stats["waiting"])
+        for reason, count in stats["rejected"].items():
+            yield ("graphrag_requests_rejected_total", "counter",
+                   "Requests turned away by admission control",
+                   {**labels, "reason": reason}, count)
+
+
+class ReadWriteLock:
+    """
+    Shared/exclusive lock that prefers writers: once a writer is waiting no
+    new readers get in, so a rebuild is not starved by a stream of searches
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @property
+    def writing(self) -> bool:
+        return self._writer or self._writers_waiting > 0
+
+    @contextmanager
+    def read(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Shared access; raises Overloaded (503) if a writer holds the lock
+        for longer than timeout seconds
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: not self._writer and not self._writers_waiting,
+                    timeout):
+                raise Overloaded("Knowledge graph rebuild in progress",
+                                 status=503, retry_after=timeout or 1.0)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                self._cond.wait_for(
+                    lambda: not self._writer and not self._readers)
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
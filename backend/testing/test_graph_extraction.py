@@ -0,0 +1,155 @@
+"""
+Concurrency, retries and failure isolation of extract_graph_documents, with
+a fake extraction and a recorded sleep
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import graph_extraction
+from graph_extraction import extract_graph_documents
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=429, headers=headers)
+
+
+def _documents(n: int):
+    return [SimpleNamespace(page_content=f"photo {i}",
+                            metadata={"filename": f"{i}.jpg"})
+            for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(graph_extraction.random, "random", lambda: 0.0)
+
+
+class _Sleeps(list):
+    def sleep(self, seconds):
+        self.append(seconds)
+
+
+@pytest.fixture
+def sleeps():
+    return _Sleeps()
+
+
+def _flaky(errors):
+    """
+    process_document raising the errors queued for a document, in order,
+    before returning its extraction
+    """
+    lock = threading.Lock()
+    calls = {}
+
+    def process_document(document):
+        filename = document.metadata["filename"]
+        with lock:
+            calls[filename] = calls.get(filename, 0) + 1
+            queued = errors.get(filename, [])
+            error = queued.pop(0) if queued else None
+        if error is not None:
+            raise error
+        return f"graph of {filename}"
+
+    process_document.calls = calls
+    return process_document
+
+
+def test_documents_are_extracted_concurrently():
+    lock = threading.Lock()
+    in_flight, peak = 0, 0
+
+    def process_document(document):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return document.metadata["filename"]
+
+    started = time.monotonic()
+    graph_documents, failures = extract_graph_documents(
+        _documents(16), process_document, max_workers=8)
+    elapsed = time.monotonic() - started
+
+    assert graph_documents == [f"{i}.jpg" for i in range(16)]
+    assert failures == []
+    assert peak == 8
+    # Two waves of 8 instead of 16 sequential calls (0.8s)
+    assert elapsed < 0.4
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    process_document = _flaky({"1.jpg": [TimeoutError(), TimeoutError()]})
+
+    graph_documents, failures = extract_graph_documents(
+        _documents(3), process_document, max_workers=1, base_delay=1.0,
+        sleep=sleeps.sleep)
+
+    assert graph_documents == ["graph of 0.jpg", "graph of 1.jpg", "graph of 2.jpg"]
+    assert failures == []
+    assert process_document.calls["1.jpg"] == 3
+    assert sleeps == [1.0, 2.0]
+
+
+def test_backoff_is_capped_and_retries_run_out(sleeps):
+    process_document = _flaky({"0.jpg": [TimeoutError("slow")] * 10})
+
+    graph_documents, failures = extract_graph_documents(
+        _documents(1), process_document, max_retries=4, base_delay=1.0,
+        max_delay=3.0, sleep=sleeps.sleep)
+
+    assert graph_documents == []
+    assert failures == [{"index": 0, "filename": "0.jpg", "error": "slow"}]
+    assert process_document.calls["0.jpg"] == 5
+    assert sleeps == [1.0, 2.0, 3.0, 3.0]
+
+
+def test_rate_limits_pause_through_the_shared_cooldown(sleeps):
+    process_document = _flaky({
+        "0.jpg": [RateLimitError(retry_after=5)],
+        "1.jpg": [RateLimitError()],
+    })
+
+    graph_documents, failures = extract_graph_documents(
+        _documents(2), process_document, max_workers=1, base_delay=1.0,
+        sleep=sleeps.sleep)
+
+    assert failures == []
+    assert len(graph_documents) == 2
+    # The recorded sleep does not advance the clock, so the Retry-After pause
+    # of 0.jpg still holds: 0.jpg's retry and 1.jpg's first attempt both wait
+    # it out, and 1.jpg's own shorter backoff does not cut it short
+    assert sleeps == [pytest.approx(5.0, abs=0.1)] * 3
+
+
+def test_failures_are_isolated_per_document(sleeps):
+    process_document = _flaky({
+        "1.jpg": [ValueError("bad output")],
+        "3.jpg": [KeyError("nodes")],
+    })
+    progress = []
+
+    graph_documents, failures = extract_graph_documents(
+        _documents(5), process_document, max_workers=4, sleep=sleeps.sleep,
+        progress=lambda *args: progress.append(args))
+
+    assert graph_documents == ["graph of 0.jpg", "graph of 2.jpg", "graph of 4.jpg"]
+    assert failures == [
+        {"index": 1, "filename": "1.jpg", "error": "bad output"},
+        {"index": 3, "filename": "3.jpg", "error": "'nodes'"},
+    ]
+    # Errors that are not transient are not retried
+    assert process_document.calls["1.jpg"] == 1
+    assert sleeps == []
+    assert [completed for completed, _, _ in progress] == [1, 2, 3, 4, 5]
+    assert progress[-1] == (5, 5, 2)
@@ -0,0 +1,95 @@
+"""
+Database traffic of BulkGraphWriter against the benchmark's in-memory Neo4j
+stand-in
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark import InMemoryGraph
+from graph_writer import BulkGraphWriter
+
+SCHEMA_STATEMENTS = 7
+
+
+def _documents(n: int):
+    """
+    n photos, each mentioning the shared "beach" and its own animal, which
+    are related to each other
+    """
+    graph_documents, documents, vectors = [], [], []
+    for i in range(n):
+        source = SimpleNamespace(
+            page_content=f"dog {i} on the beach",
+            metadata={"id": f"{i}.jpg", "filename": f"{i}.jpg"})
+        beach = SimpleNamespace(id="beach", type="Place", properties={})
+        animal = SimpleNamespace(id=f"dog {i}", type="Animal", properties={})
+        graph_documents.append(SimpleNamespace(
+            source=source,
+            nodes=[beach, animal],
+            relationships=[SimpleNamespace(source=animal, target=beach,
+                                           type="located at", properties={})]))
+        documents.append(source)
+        vectors.append([1.0, float(i), 0.0])
+    return graph_documents, documents, vectors
+
+
+def _writer(graph: InMemoryGraph, **kwargs) -> BulkGraphWriter:
+    return BulkGraphWriter.for_graph(
+        graph, index_name="photo_vectors_v1",
+        keyword_index_name="photo_keywords_v1", document_label="Document_v1",
+        chunk_label="Chunk_v1", entity_label="__Entity___v1", **kwargs)
+
+
+@pytest.mark.parametrize("batch_size, rows_per_transaction, statements, transactions", [
+    # documents 2, Place 1, Animal 2, MENTIONS 4, LOCATED_AT 2, chunks 2
+    (4, 20000, 13, 1),
+    # Greedy packing of 4-row statements (one 1-row) into 8-row transactions
+    (4, 8, 13, 7),
+    # One statement per row kind and label
+    (1000, 20000, 6, 1),
+    # A statement larger than rows_per_transaction still goes in one piece
+    (1000, 1, 6, 6),
+])
+def test_write_counts(batch_size, rows_per_transaction, statements, transactions):
+    graph = InMemoryGraph()
+    writer = _writer(graph, batch_size=batch_size,
+                     rows_per_transaction=rows_per_transaction)
+
+    written = writer.write(*_documents(8))
+
+    assert written == {"statements": SCHEMA_STATEMENTS + statements,
+                       "transactions": transactions}
+    assert writer.round_trips == SCHEMA_STATEMENTS + statements + transactions
+    counts = graph.counter.snapshot()
+    assert counts["db_statements"] == SCHEMA_STATEMENTS + statements
+    assert counts["db_transactions"] == transactions
+
+
+def test_schema_is_created_once():
+    graph = InMemoryGraph()
+    writer = _writer(graph, batch_size=4)
+    graph_documents, documents, vectors = _documents(8)
+
+    first = writer.write(graph_documents[:4], documents[:4], vectors[:4])
+    second = writer.write(graph_documents[4:], documents[4:], vectors[4:])
+
+    # documents, Place, Animal, MENTIONS 2, LOCATED_AT, chunks
+    assert first["statements"] == SCHEMA_STATEMENTS + 7
+    assert second["statements"] == 7
+    assert writer.statements == first["statements"] + second["statements"]
+    assert writer.transactions == 2
+
+
+def test_rows_reach_the_graph():
+    graph = InMemoryGraph()
+    _writer(graph, batch_size=3, rows_per_transaction=5).write(*_documents(8))
+
+    store = graph.store(1)
+    assert sorted(store.chunks) == sorted(f"{i}.jpg" for i in range(8))
+    assert len(store.documents) == 8
+    assert len(store.entities) == 9
+    assert store.mentions["0.jpg"] == {"beach", "dog 0"}
+    assert len(store.relationships) == 8
+    # Each relationship records the photo whose extraction produced it
+    assert store.relationships[("dog 0", "LOCATED_AT", "beach")] == {"0.jpg"}
@@ -0,0 +1,151 @@
+"""
+LocalVectorIndex against a brute-force reference: exact and IVF search,
+masked rows and compaction, and the save/load round-trip
+"""
+import numpy as np
+import pytest
+
+from local_vector_index import LocalVectorIndex
+
+DIMENSION = 16
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+class _Reference:
+    """
+    Dict of unit vectors searched by sorting every score
+    """
+
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, filenames, vectors):
+        self.vectors.update(zip(filenames, _unit(vectors)))
+
+    def remove(self, filenames):
+        for filename in filenames:
+            self.vectors.pop(filename, None)
+
+    def search(self, query, k):
+        query = _unit(query)
+        scores = {f: (1 + float(v @ query)) / 2 for f, v in self.vectors.items()}
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def _mutate(index, reference, rng, steps=40):
+    """
+    Random upserts (new and replaced photos) and removals applied to both
+    """
+    for _ in range(steps):
+        if rng.random() < 0.7 or not reference.vectors:
+            filenames = list(dict.fromkeys(
+                f"{i}.jpg" for i in rng.integers(0, 400, rng.integers(1, 40))))
+            vectors = rng.normal(size=(len(filenames), DIMENSION))
+            index.upsert(filenames, [f"text {f}" for f in filenames], vectors)
+            reference.upsert(filenames, vectors)
+        else:
+            filenames = list(rng.choice(sorted(reference.vectors),
+                                        min(len(reference.vectors), 20),
+                                        replace=False))
+            index.remove(filenames + ["missing.jpg"])
+            reference.remove(filenames)
+        assert len(index) == len(reference.vectors)
+
+
+def test_exact_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    index, reference = LocalVectorIndex(), _Reference()
+    _mutate(index, reference, rng)
+
+    queries = rng.normal(size=(10, DIMENSION))
+    for query, hits in zip(queries, index.search_batch(queries, k=5)):
+        expected = reference.search(query, 5)
+        assert [f for f, _, _ in hits] == [f for f, _ in expected]
+        assert [s for _, _, s in hits] == pytest.approx([s for _, s in expected],
+                                                        abs=1e-5)
+        assert all(text == f"text {f}" for f, text, _ in hits)
+    assert index.stats()["mode"] == "exact"
+
+
+def test_ivf_search_returns_live_rows_with_exact_scores():
+    rng = np.random.default_rng(1)
+    index = LocalVectorIndex(ivf_lists=8, nprobe=8, ivf_min_size=100)
+    reference = _Reference()
+    _mutate(index, reference, rng)
+    assert index.stats()["mode"] == "ivf"
+
+    queries = rng.normal(size=(10, DIMENSION))
+    for query, hits in zip(queries, index.search_batch(queries, k=5)):
+        # Probing every list makes IVF exhaustive
+        expected = reference.search(query, 5)
+        assert [f for f, _, _ in hits] == [f for f, _ in expected]
+        assert [s for _, _, s in hits] == pytest.approx([s for _, s in expected],
+                                                        abs=1e-5)
+
+
+def test_replaced_and_removed_rows_are_masked_then_compacted():
+    index = LocalVectorIndex(compact_ratio=0.5)
+    index.upsert(["a", "b", "c", "d"], ["a", "b", "c", "d"], np.eye(4, DIMENSION))
+
+    index.upsert(["a"], ["a v2"], [np.eye(DIMENSION)[1]])
+    # The old row of "a" stays in the matrix, masked
+    assert len(index) == 4
+    assert index._snapshot.matrix.shape[0] == 5
+    hits = index.search(np.eye(DIMENSION)[1], k=4)
+    assert [f for f, _, _ in hits][:2] in (["a", "b"], ["b", "a"])
+    assert [text for f, text, _ in hits if f == "a"] == ["a v2"]
+    assert hits[0][2] == pytest.approx(1.0)
+
+    index.remove(["b", "c"])
+    # Three of five rows are dead, past compact_ratio
+    assert len(index) == 2
+    assert index._snapshot.matrix.shape[0] == 2
+    assert sorted(f for f, _, _ in index.search(np.ones(DIMENSION), k=5)) == ["a", "d"]
+
+    index.remove(["a", "d"])
+    assert len(index) == 0
+    assert index.search(np.ones(DIMENSION)) == []
+
+
+def test_opposite_vectors_score_zero():
+    index = LocalVectorIndex()
+    index.upsert(["same", "opposite"], ["", ""], [[1.0, 0.0], [-1.0, 0.0]])
+
+    scores = {f: score for f, _, score in index.search([1.0, 0.0], k=2)}
+
+    assert scores == {"same": pytest.approx(1.0), "opposite": pytest.approx(0.0)}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    path = str(tmp_path / "index" / "photo_vectors")
+    index, reference = LocalVectorIndex(path=path), _Reference()
+    _mutate(index, reference, rng, steps=20)
+    # Mutations are written by flush(), not on every upsert
+    assert LocalVectorIndex(path=path).load() is False
+    index.flush()
+
+    loaded = LocalVectorIndex(path=path)
+    assert loaded.load()
+
+    assert len(loaded) == len(reference.vectors)
+    # Only live rows are written
+    assert loaded._snapshot.matrix.shape[0] == len(reference.vectors)
+    queries = rng.normal(size=(5, DIMENSION))
+    assert loaded.search_batch(queries, k=5) == index.search_batch(queries, k=5)
+
+
+def test_delete_removes_the_files(tmp_path):
+    path = str(tmp_path / "photo_vectors")
+    index = LocalVectorIndex(path=path)
+    index.replace_all(["a"], ["a"], [[1.0, 0.0]])
+    assert LocalVectorIndex(path=path).load()
+
+    index.delete()
+
+    assert len(index) == 0
+    assert LocalVectorIndex(path=path).load() is False
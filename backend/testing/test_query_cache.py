@@ -0,0 +1,118 @@
+"""
+Exact and semantic lookups, TTL, LRU eviction and generations of
+QueryResultCache, on a manual clock
+"""
+import pytest
+
+from query_cache import QueryResultCache, normalize_query
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.mark.parametrize("query, normalized", [
+    ("Dogs on the beach", "dogs on the beach"),
+    ("  dogs   on\tthe\nbeach  ", "dogs on the beach"),
+    ("Dogs on the beach?!", "dogs on the beach"),
+    ("\"dogs on the beach.\"", "dogs on the beach"),
+    ("dogs, on the beach", "dogs, on the beach"),
+])
+def test_normalize_query(query, normalized):
+    assert normalize_query(query) == normalized
+
+
+def test_exact_hits_ignore_case_whitespace_and_punctuation(clock):
+    cache = QueryResultCache(similarity_threshold=2.0, clock=clock)
+    cache.put("Dogs on the beach", ["1.jpg"], namespace="rerank")
+
+    hit = cache.get("  dogs ON the beach? ", namespace="rerank")
+
+    assert hit["value"] == ["1.jpg"]
+    assert hit["cache"]["type"] == "exact"
+    assert hit["cache"]["matched_query"] == "Dogs on the beach"
+    # Namespaces (search modes) do not share answers
+    assert cache.get("dogs on the beach", namespace="fast") is None
+    assert cache.stats()["hits"] == {"exact": 1, "semantic": 0}
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_hits_above_the_threshold_only(clock):
+    cache = QueryResultCache(similarity_threshold=0.9, clock=clock)
+    cache.put("dogs on the beach", ["1.jpg"], embedding=[1.0, 0.0])
+
+    close = cache.get_similar([0.95, 0.1])
+    far = cache.get_similar([0.6, 0.8])
+
+    assert close["value"] == ["1.jpg"]
+    assert close["cache"]["type"] == "semantic"
+    assert close["cache"]["similarity"] == pytest.approx(0.9945, abs=1e-4)
+    assert far is None
+    # A miss on get() is left for get_similar() to count
+    assert cache.get("puppies at the seaside") is None
+    assert cache.stats()["hits"] == {"exact": 0, "semantic": 1}
+    assert cache.stats()["misses"] == 1
+
+
+def test_semantic_hits_stay_in_their_namespace(clock):
+    cache = QueryResultCache(similarity_threshold=0.9, clock=clock)
+    cache.put("dogs on the beach", ["fast"], embedding=[1.0, 0.0], namespace="fast")
+    cache.put("dogs at the beach", ["rerank"], embedding=[0.99, 0.1],
+              namespace="rerank")
+
+    assert cache.get_similar([1.0, 0.0], namespace="rerank")["value"] == ["rerank"]
+    assert cache.get_similar([1.0, 0.0], namespace="other") is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = QueryResultCache(ttl=60, similarity_threshold=0.9, clock=clock)
+    cache.put("dogs on the beach", ["1.jpg"], embedding=[1.0, 0.0])
+
+    clock.now += 60
+    assert cache.get("dogs on the beach")["cache"]["age_seconds"] == 60
+    clock.now += 1
+    assert cache.get("dogs on the beach") is None
+    assert cache.get_similar([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = QueryResultCache(max_entries=2, similarity_threshold=0.9, clock=clock)
+    cache.put("a", "A", embedding=[1.0, 0.0])
+    cache.put("b", "B", embedding=[0.0, 1.0])
+    # Reading "a" makes "b" the oldest
+    assert cache.get("a")["value"] == "A"
+
+    cache.put("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a")["value"] == "A"
+    assert cache.get("c")["value"] == "C"
+    # The evicted entry is gone from semantic matching too
+    assert cache.get_similar([0.0, 1.0]) is None
+
+
+def test_clear_drops_results_computed_before_it(clock):
+    cache = QueryResultCache(similarity_threshold=2.0, clock=clock)
+    cache.put("dogs", "old")
+    # A search reads the generation, then the graph is rebuilt before it
+    # stores its answer
+    generation = cache.generation
+    cache.clear()
+
+    cache.put("cats", "stale", generation=generation)
+    cache.put("birds", "fresh", generation=cache.generation)
+
+    assert cache.get("dogs") is None
+    assert cache.get("cats") is None
+    assert cache.get("birds")["value"] == "fresh"
+    assert cache.stats()["generation"] == generation + 1
@@ -0,0 +1,134 @@
+"""
+Table tests for rank fusion, the neighbour boost and parsing of the LLM
+re-ranking answer
+"""
+import pytest
+
+from ranking import (RRF_K, apply_neighbour_boost, filenames_from_rows,
+                     parse_rerank_output, ranked, reciprocal_rank_fusion)
+
+
+def _rrf(*ranks, k=RRF_K):
+    return sum(1 / (k + rank) for rank in ranks)
+
+
+@pytest.mark.parametrize("lists, weights, expected", [
+    # One list keeps its order
+    ({"vector": ["a", "b", "c"]}, None, ["a", "b", "c"]),
+    # Found by both legs beats first place in one
+    ({"vector": ["a", "b"], "graph": ["c", "b"]}, None, ["b", "a", "c"]),
+    # Equal scores fall back to the filename
+    ({"vector": ["b", "x"], "graph": ["a", "y"]}, None, ["a", "b", "x", "y"]),
+    # A weighted leg outranks the same rank in another
+    ({"vector": ["a"], "graph": ["b"]}, {"graph": 2.0}, ["b", "a"]),
+    # Duplicates within a leg count once, at their best rank
+    ({"vector": ["a", "a", "b"], "graph": ["b"]}, None, ["b", "a"]),
+    # Missing filenames are skipped but keep their rank
+    ({"vector": [None, "a"], "graph": ["b"]}, None, ["b", "a"]),
+])
+def test_fusion_order(lists, weights, expected):
+    fused = reciprocal_rank_fusion(lists, weights=weights)
+
+    assert [r["filename"] for r in ranked(fused)] == expected
+
+
+def test_fusion_scores_and_sources_across_legs():
+    fused = reciprocal_rank_fusion({
+        "vector": ["a", "b", "a"],
+        "graph": ["b", "c"],
+    }, weights={"graph": 0.5})
+
+    assert fused["a"] == {"score": pytest.approx(_rrf(1)), "sources": ["vector"]}
+    assert fused["b"]["score"] == pytest.approx(_rrf(2) + 0.5 * _rrf(1))
+    assert fused["b"]["sources"] == ["vector", "graph"]
+    assert fused["c"]["score"] == pytest.approx(0.5 * _rrf(2))
+
+
+def test_ranked_rounds_and_limits():
+    fused = reciprocal_rank_fusion({"vector": ["a", "b", "c"]})
+
+    results = ranked(fused, limit=2)
+
+    assert results == [
+        {"filename": "a", "score": round(_rrf(1), 6), "sources": ["vector"]},
+        {"filename": "b", "score": round(_rrf(2), 6), "sources": ["vector"]},
+    ]
+
+
+@pytest.mark.parametrize("shared, expected", [
+    ({}, {}),
+    ({"n": 0}, {}),
+    # The best connected neighbour gets a fraction of a first-place vote
+    ({"n": 4, "m": 2}, {"n": 0.5 * _rrf(1), "m": 0.25 * _rrf(1)}),
+])
+def test_neighbour_boost_adds_new_photos(shared, expected):
+    fused = {}
+
+    apply_neighbour_boost(fused, shared, weight=0.5)
+
+    assert {f: e["score"] for f, e in fused.items()} == pytest.approx(expected)
+    assert all(e["sources"] == ["neighbour"] for e in fused.values())
+
+
+def test_neighbour_boost_adds_to_fused_photos():
+    fused = reciprocal_rank_fusion({"vector": ["a", "b"]})
+
+    apply_neighbour_boost(fused, {"b": 3}, weight=1.0)
+
+    assert fused["b"]["score"] == pytest.approx(_rrf(2) + _rrf(1))
+    assert fused["b"]["sources"] == ["vector", "neighbour"]
+    assert [r["filename"] for r in ranked(fused)] == ["b", "a"]
+
+
+@pytest.mark.parametrize("text, expected", [
+    (
+        "Filename: [1.jpg, 2.jpg]\n"
+        "Primary Match Factors:\n"
+        "- [dog, beach]\n"
+        "- sunset\n"
+        "Detailed Reasoning: Both show a dog.\n"
+        "The first is at sunset.",
+        {"filenames": ["1.jpg", "2.jpg"], "match_factors": ["dog", "beach", "sunset"],
+         "reasoning": "Both show a dog. The first is at sunset."},
+    ),
+    # Quoted names, stray spaces and an empty list entry
+    (
+        "  Filename: ['1.jpg' , \"2.jpg\", ]  ",
+        {"filenames": ["1.jpg", "2.jpg"], "match_factors": [], "reasoning": ""},
+    ),
+    # No brackets around a single name
+    (
+        "Filename: 3.jpg",
+        {"filenames": ["3.jpg"], "match_factors": [], "reasoning": ""},
+    ),
+    # Answer cut off after the factors heading
+    (
+        "Filename: [1.jpg]\nPrimary Match Factors:",
+        {"filenames": ["1.jpg"], "match_factors": [], "reasoning": ""},
+    ),
+    # Reasoning on the following lines only; text outside a section is ignored
+    (
+        "Sure! Here you go.\nDetailed Reasoning:\n\nMatches the query.",
+        {"filenames": [], "match_factors": [], "reasoning": "Matches the query."},
+    ),
+    # Factor lines must be bullets
+    (
+        "Primary Match Factors:\ndog\n- beach",
+        {"filenames": [], "match_factors": ["beach"], "reasoning": ""},
+    ),
+    # A later Filename line replaces an earlier one
+    (
+        "Filename: [1.jpg]\nFilename: [2.jpg]",
+        {"filenames": ["2.jpg"], "match_factors": [], "reasoning": ""},
+    ),
+    ("", {"filenames": [], "match_factors": [], "reasoning": ""}),
+    ("Filename: []", {"filenames": [], "match_factors": [], "reasoning": ""}),
+])
+def test_parse_rerank_output(text, expected):
+    assert parse_rerank_output(text) == expected
+
+
+def test_filenames_from_rows_skips_missing_names():
+    rows = [{"filename": "1.jpg"}, {"filename": None}, {}, {"filename": "2.jpg"}]
+
+    assert filenames_from_rows(rows) == ["1.jpg", "2.jpg"]
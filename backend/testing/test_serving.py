@@ -0,0 +1,171 @@
+"""
+AdmissionController and ReadWriteLock, driven from helper threads
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from serving import AdmissionController, Overloaded, ReadWriteLock
+
+
+def _wait_until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+class _Holder:
+    """
+    A thread that enters a context manager and stays inside until release()
+    """
+
+    def __init__(self, context):
+        self.entered = threading.Event()
+        self.error = None
+        self._release = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(context,))
+        self._thread.start()
+
+    def _run(self, context):
+        try:
+            with context:
+                self.entered.set()
+                self._release.wait(5)
+        except Exception as e:
+            self.error = e
+
+    def release(self):
+        self._release.set()
+        self._thread.join(5)
+
+
+@contextmanager
+def _holding(context):
+    holder = _Holder(context)
+    try:
+        yield holder
+    finally:
+        holder.release()
+
+
+def test_admits_up_to_max_in_flight():
+    admission = AdmissionController(max_in_flight=2, max_queue=0)
+
+    with admission.admit(), admission.admit():
+        assert admission.stats()["in_flight"] == 2
+        with pytest.raises(Overloaded):
+            with admission.admit():
+                pass
+
+    assert admission.stats()["in_flight"] == 0
+    assert admission.stats()["admitted"] == 2
+
+
+def test_rejects_with_429_when_the_queue_is_full():
+    admission = AdmissionController(max_in_flight=1, max_queue=1,
+                                    queue_timeout=5, name="searches")
+
+    with _holding(admission.admit()) as running:
+        assert running.entered.wait(2)
+        with _holding(admission.admit()) as queued:
+            _wait_until(lambda: admission.stats()["waiting"] == 1)
+
+            with pytest.raises(Overloaded) as rejected:
+                with admission.admit():
+                    pass
+            assert rejected.value.status == 429
+            assert rejected.value.retry_after == 5
+            assert "searches" in str(rejected.value)
+
+            # The queued request gets the slot once it is free
+            running.release()
+            assert queued.entered.wait(2)
+
+    assert queued.error is None
+    assert admission.stats()["rejected"] == {"queue_full": 1, "timeout": 0}
+    assert admission.stats()["admitted"] == 2
+
+
+def test_rejects_with_503_after_the_queue_timeout():
+    admission = AdmissionController(max_in_flight=1, max_queue=4,
+                                    queue_timeout=0.05)
+
+    with _holding(admission.admit()) as running:
+        assert running.entered.wait(2)
+        started = time.monotonic()
+        with pytest.raises(Overloaded) as rejected:
+            with admission.admit():
+                pass
+        waited = time.monotonic() - started
+
+    assert rejected.value.status == 503
+    assert 0.05 <= waited < 1
+    assert admission.stats()["rejected"] == {"queue_full": 0, "timeout": 1}
+    assert admission.stats()["waiting"] == 0
+
+
+def test_collect_reports_the_pool():
+    admission = AdmissionController(max_in_flight=1, max_queue=0, name="batches")
+    with admission.admit():
+        with pytest.raises(Overloaded):
+            with admission.admit():
+                pass
+        collected = list(admission.collect())
+    metrics = {(name, labels.get("reason")): value
+               for name, _, _, labels, value in collected}
+
+    assert metrics == {
+        ("graphrag_requests_in_flight", None): 1,
+        ("graphrag_requests_waiting", None): 0,
+        ("graphrag_requests_rejected_total", "queue_full"): 1,
+        ("graphrag_requests_rejected_total", "timeout"): 0,
+    }
+    assert all(labels["pool"] == "batches" for _, _, _, labels, _ in collected)
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+
+    with lock.read(), lock.read(timeout=0.01):
+        assert not lock.writing
+
+
+def test_waiting_writer_keeps_new_readers_out():
+    lock = ReadWriteLock()
+
+    with _holding(lock.read()) as reader:
+        assert reader.entered.wait(2)
+        with _holding(lock.write()) as writer:
+            _wait_until(lambda: lock.writing)
+            assert not writer.entered.is_set()
+
+            # A newly arriving search is turned away instead of jumping the
+            # queue ahead of the writer
+            with pytest.raises(Overloaded) as rejected:
+                with lock.read(timeout=0.05):
+                    pass
+            assert rejected.value.status == 503
+
+            # The writer gets in once the earlier reader leaves
+            reader.release()
+            assert writer.entered.wait(2)
+            with pytest.raises(Overloaded):
+                with lock.read(timeout=0.01):
+                    pass
+
+    assert not lock.writing
+    with lock.read(timeout=0.01):
+        pass
+
+
+def test_reader_waits_for_a_short_write():
+    lock = ReadWriteLock()
+
+    with _holding(lock.write()) as writer:
+        assert writer.entered.wait(2)
+        threading.Timer(0.05, writer.release).start()
+        with lock.read(timeout=2):
+            assert not lock.writing